@@ -0,0 +1,84 @@
+"""Partition stock_prices theo năm và intraday_prices theo ngày
+
+Bảng heap đang có được đổi tên, tạo bảng cha partition cùng cột + khóa chính,
+tạo partition phủ dữ liệu hiện có, chép dữ liệu sang rồi xóa bảng cũ.
+Bảng chưa tồn tại thì bỏ qua (create_all sẽ tạo đúng dạng partition theo models).
+
+Revision ID: 0001_partition_prices
+Revises:
+Create Date: 2026-10-17
+"""
+from datetime import date, timedelta
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001_partition_prices"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# bảng -> (cột phân vùng, khóa chính, độ dài partition)
+TABLES = {
+    "stock_prices": ("date", "symbol, date", "year"),
+    "intraday_prices": ("datetime", "symbol, datetime", "day"),
+}
+
+
+def _relkind(bind, table):
+    return bind.execute(sa.text(
+        "SELECT c.relkind FROM pg_class c WHERE c.relname = :t AND pg_table_is_visible(c.oid)"
+    ), {"t": table}).scalar()
+
+
+def _partition_starts(bind, table, column, granularity):
+    if granularity == "year":
+        first, last = bind.execute(sa.text(
+            f"SELECT min(EXTRACT(YEAR FROM {column}))::int, max(EXTRACT(YEAR FROM {column}))::int FROM {table}"
+        )).one()
+        this_year = date.today().year
+        return [date(y, 1, 1) for y in range(min(first or 2008, 2008), max(last or this_year, this_year) + 2)]
+    days = [r[0] for r in bind.execute(sa.text(f"SELECT DISTINCT {column}::date FROM {table}")).all()]
+    today = date.today()
+    return sorted(set(days) | {today + timedelta(days=i) for i in range(8)})
+
+
+def _partition(table, granularity, start):
+    if granularity == "year":
+        return f"{table}_y{start.year}", start, date(start.year + 1, 1, 1)
+    return f"{table}_d{start:%Y%m%d}", start, start + timedelta(days=1)
+
+
+def upgrade():
+    bind = op.get_bind()
+    for table, (column, pk, granularity) in TABLES.items():
+        if _relkind(bind, table) != "r":
+            continue  # chưa có bảng hoặc đã là bảng partition ('p')
+
+        old = f"{table}_heap"
+        op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        op.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {old}_pkey")
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY ({pk})) "
+            f"PARTITION BY RANGE ({column})"
+        )
+        for start in _partition_starts(bind, old, column, granularity):
+            name, lo, hi = _partition(table, granularity, start)
+            op.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{lo}') TO ('{hi}')")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+        op.execute(f"DROP TABLE {old}")
+        op.execute(f"ANALYZE {table}")
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table, (column, pk, _) in TABLES.items():
+        if _relkind(bind, table) != "p":
+            continue
+
+        old = f"{table}_partitioned"
+        op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        op.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {old}_pkey")
+        op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS, PRIMARY KEY ({pk}))")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+        op.execute(f"DROP TABLE {old} CASCADE")
@@ -0,0 +1,39 @@
+"""Tìm kiếm công ty: pg_trgm + unaccent và GIN trigram index
+
+f_unaccent bọc unaccent() với từ điển cố định để khai báo IMMUTABLE (dùng được trong index).
+Index trên lower(symbol) và f_unaccent(lower(name)) phục vụ LIKE '%q%' / similarity không dấu.
+
+Revision ID: 0002_company_search
+Revises: 0001_partition_prices
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0002_company_search"
+down_revision = "0001_partition_prices"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    op.execute(
+        "CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text "
+        "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+        "AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_companies_symbol_trgm "
+        "ON companies USING gin (lower(symbol) gin_trgm_ops)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_companies_name_trgm "
+        "ON companies USING gin (f_unaccent(lower(name)) gin_trgm_ops)"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_companies_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_companies_symbol_trgm")
+    op.execute("DROP FUNCTION IF EXISTS f_unaccent(text)")
@@ -0,0 +1,36 @@
+"""
+Giới hạn số request HTTP xử lý đồng thời trong 1 process API (admission control).
+
+Các API đọc chạy trên event loop (AsyncSession). Không có giới hạn thì mọi request đang tới cùng
+được xử lý xen kẽ: phần dựng DataFrame / JSON của mọi request chia nhau CPU và tranh nhau pool kết nối,
+nên request nào cũng chậm lại và p99 tăng mạnh khi tải cao (xem số đo trong app.load_bench).
+Middleware này chỉ cho API_MAX_INFLIGHT request vào xử lý cùng lúc, phần còn lại xếp hàng FIFO
+(asyncio.Semaphore) -> latency đều như threadpool của bản sync, throughput không giảm.
+
+Cấu hình:
+    API_MAX_INFLIGHT = số request xử lý đồng thời mỗi process (mặc định: 10; 0 = không giới hạn)
+"""
+import asyncio
+import os
+
+
+def max_inflight() -> int:
+    return int(os.getenv("API_MAX_INFLIGHT", "10"))
+
+
+class AdmissionLimitMiddleware:
+    """ASGI middleware thuần (không bọc response như BaseHTTPMiddleware)"""
+
+    def __init__(self, app, limit: int):
+        self.app = app
+        self.limit = limit
+        self._semaphore = None  # tạo trong event loop của server
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.limit <= 0:
+            await self.app(scope, receive, send)
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        async with self._semaphore:
+            await self.app(scope, receive, send)
@@ -1,37 +1,287 @@
+"""
+Scheduler cho các job định kỳ: partition, giá cuối ngày, báo cáo tài chính (FA) và chỉ số tăng trưởng.
+
+- Mọi mốc giờ theo TIMEZONE (giờ Việt Nam, market_now()), không theo giờ của máy chủ
+- Chỉ chạy vào ngày giao dịch (bỏ cuối tuần / ngày lễ)
+- Mỗi job chỉ 1 instance: khóa trong process + dòng scheduler_runs "running" giữa các process.
+  Dòng được tạo dưới pg_advisory_xact_lock (transaction ngắn, không giữ kết nối suốt lượt chạy),
+  ghi owner = host:pid và heartbeat_at được làm mới mỗi SCHEDULER_HEARTBEAT giây trong lúc chạy.
+  Dòng running coi như đã chết khi owner cùng máy không còn pid, hoặc heartbeat cũ hơn SCHEDULER_RUN_TIMEOUT.
+- Lượt chạy bị lỡ được gộp lại (coalesce) và chạy bù 1 lần khi khởi động (phiên giao dịch gần nhất);
+  lượt chạy bù xét ngày giao dịch theo mốc lịch của nó, không theo hôm nay.
+  Chỉ lượt "succeeded" mới tính là đã phục vụ mốc lịch ("skipped" thì lần khởi động sau vẫn chạy bù)
+- Thời gian, số lượng và lỗi của từng lượt chạy được lưu vào bảng scheduler_runs
+- Giá cuối ngày chạy qua hàng đợi ingestion_jobs (scheduler chỉ enqueue, ghi job_id vào scheduler_runs)
+
+Cấu hình:
+    SCHEDULER_TIMEZONE     = múi giờ của lịch (mặc định: Asia/Ho_Chi_Minh)
+    SCHEDULER_HEARTBEAT    = số giây giữa 2 lần làm mới heartbeat_at (mặc định: 30)
+    SCHEDULER_RUN_TIMEOUT  = số giây không có heartbeat thì coi lượt chạy đã chết (mặc định: 300)
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import date
-from vnstock import Vnstock
-from .database import SessionLocal
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy import text
+
 from . import models
+from .database import SessionLocal
+from .trading_calendar import get_calendar, market_now
 
+logger = logging.getLogger(__name__)
+
+TIMEZONE = os.getenv("SCHEDULER_TIMEZONE", "Asia/Ho_Chi_Minh")
+HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_HEARTBEAT", "30"))
+RUN_TIMEOUT = float(os.getenv("SCHEDULER_RUN_TIMEOUT", "300"))
+HOST = socket.gethostname()
+OWNER = f"{HOST}:{os.getpid()}"
+
+# Giờ chạy (giờ Việt Nam); giá chạy sau khi đóng cửa phiên chiều 14:45
+SCHEDULES = {
+    "partitions": {"hour": 8, "minute": 30},
+    "prices": {"hour": 15, "minute": 15},
+    "financials": {"hour": 19, "minute": 0},
+    "growth": {"hour": 21, "minute": 0},
+}
+
+_job_locks = {name: threading.Lock() for name in SCHEDULES}
+_scheduler = None
+
+
+# ================== Các job ==================
 def update_daily():
+    """
+    Đưa job today_load (bảng giá) vào hàng đợi của job worker (python -m app.jobs), không chạy trong
+    process API: cùng khóa nhóm với full_load / delta_load / backfill gửi qua /jobs.
+    Đã có job nạp giá đang chờ / chạy -> lượt này bị bỏ qua.
+    """
+    from .jobs import JobConflictError, enqueue_job
+    try:
+        job = enqueue_job("today_load", {"mode": "board"})
+    except JobConflictError as e:
+        return {"status": "skipped", "job_id": e.job_id, "error": str(e)}
+    return {"job_id": job.id}
+
+
+def update_financials():
+    """Delta load báo cáo tài chính (quý + năm)"""
+    from .fa_delta_load import delta_load_financials, get_all_tickers
+    tickers = get_all_tickers()
+    delta_load_financials(tickers, source="VCI", lang="vi", period_types=["quarter", "year"])
+    return {"items": len(tickers)}
+
+
+def update_growth():
+    """Tính lại chỉ số tăng trưởng cho năm hiện tại"""
+    from .fa_delta_load import get_all_tickers
+    from .routers.financial_metrics import batch_calculate_growth_to_db
+    tickers = get_all_tickers()
+    batch_calculate_growth_to_db(tickers, [market_now().year], [1, 2, 3, 4], max_workers=5)
+    return {"items": len(tickers)}
+
+
+def update_partitions():
+    """Tạo trước partition sắp tới, detach/drop partition intraday quá hạn"""
+    from .partitions import maintain_partitions
+    return maintain_partitions()
+
+
+JOBS = {
+    "partitions": update_partitions,
+    "prices": update_daily,
+    "financials": update_financials,
+    "growth": update_growth,
+}
+
+
+# ================== Chạy 1 job có khóa + ghi metrics ==================
+def _record_run(run_id, **values):
+    db = SessionLocal()
+    try:
+        db.query(models.SchedulerRun).filter(models.SchedulerRun.id == run_id).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _start_run(name, scheduled_for, status="running", error=None):
     db = SessionLocal()
-    symbols = db.query(models.Company.symbol).all()
+    try:
+        now = market_now()
+        run = models.SchedulerRun(job=name, scheduled_for=scheduled_for, started_at=now,
+                                  heartbeat_at=now, status=status, error=error, owner=OWNER)
+        if status != "running":
+            run.finished_at = run.started_at
+            run.duration_seconds = 0.0
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
 
-    for (symbol,) in symbols:
-        stock = Vnstock().stock(symbol=symbol, source="VCI")
+
+def _owner_alive(owner: str | None) -> bool | None:
+    """True/False nếu owner chạy trên máy này (kiểm tra pid), None nếu không biết (máy khác)"""
+    host, _, pid = (owner or "").rpartition(":")
+    if host != HOST or not pid.isdigit():
+        return None
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _run_is_live(run, now) -> bool:
+    alive = _owner_alive(run.owner)
+    if alive is not None:
+        return alive
+    last = run.heartbeat_at or run.started_at
+    return last >= now - timedelta(seconds=RUN_TIMEOUT)
+
+
+def _heartbeat(run_id, stop: threading.Event):
+    """Làm mới heartbeat_at của lượt chạy tới khi stop được set"""
+    while not stop.wait(HEARTBEAT_SECONDS):
         try:
-            df = stock.quote.history(start=str(date.today()), end=str(date.today()), interval="1D")
-            for _, p in df.iterrows():
-                price = models.StockPrice(
-                    symbol=symbol,
-                    date=p["time"],
-                    open=p["open"],
-                    high=p["high"],
-                    low=p["low"],
-                    close=p["close"],
-                    volume=p["volume"],
-                    value=p.get("value"),
-                    change=p.get("change")
-                )
-                db.merge(price)
-        except:
-            continue
-
-    db.commit()
-    db.close()
+            _record_run(run_id, heartbeat_at=market_now())
+        except Exception as e:
+            logger.warning("⚠️ Không cập nhật được heartbeat scheduler run %s: %s", run_id, e)
+
+
+def _claim_run(name, scheduled_for):
+    """Tạo dòng running cho job nếu không process nào khác đang chạy nó; trả (run id, None) hoặc (None, owner)"""
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:k))"), {"k": f"scheduler:{name}"})
+        now = market_now()
+        running = (db.query(models.SchedulerRun)
+                   .filter(models.SchedulerRun.job == name, models.SchedulerRun.status == "running")
+                   .all())
+        for run in running:
+            if _run_is_live(run, now):
+                db.rollback()
+                return None, run.owner
+            run.status, run.finished_at = "failed", now
+            run.error = f"Owner {run.owner} đã dừng hoặc không có heartbeat quá {RUN_TIMEOUT:.0f}s"
+        run = models.SchedulerRun(job=name, scheduled_for=scheduled_for, started_at=now,
+                                  heartbeat_at=now, status="running", owner=OWNER)
+        db.add(run)
+        db.commit()
+        return run.id, None
+    finally:
+        db.close()
+
+
+def run_job(name: str, scheduled_for: datetime | None = None, force: bool = False):
+    """
+    Chạy job `name` nếu ngày của mốc lịch (scheduled_for, mặc định hôm nay giờ Việt Nam) là ngày giao dịch
+    và không có instance nào khác đang chạy
+    """
+    day = (scheduled_for or market_now()).date()
+    if not force and not get_calendar().is_session(day):
+        logger.info("⏭️ Bỏ qua %s: %s không phải ngày giao dịch", name, day)
+        _start_run(name, scheduled_for, status="skipped", error="not a trading day")
+        return
+
+    lock = _job_locks[name]
+    if not lock.acquire(blocking=False):
+        logger.info("⏭️ Bỏ qua %s: đang chạy trong process này", name)
+        return
+
+    try:
+        run_id, owner = _claim_run(name, scheduled_for)
+        if run_id is None:
+            logger.info("⏭️ Bỏ qua %s: %s đang chạy", name, owner)
+            return
+
+        t0 = time.monotonic()
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(run_id, stop), name=f"scheduler-heartbeat-{name}",
+                         daemon=True).start()
+        logger.info("▶️ Scheduler chạy %s", name)
+        try:
+            metrics = JOBS[name]() or {}
+            status = metrics.get("status", "succeeded")
+            _record_run(run_id, status=status, finished_at=market_now(),
+                        duration_seconds=round(time.monotonic() - t0, 3),
+                        items=metrics.get("items", 0), rows=metrics.get("rows", 0),
+                        errors=metrics.get("errors", 0), details=metrics.get("details"),
+                        job_id=metrics.get("job_id"), error=metrics.get("error"))
+            logger.info("✅ %s %s sau %.1fs", name, status, time.monotonic() - t0)
+        except Exception as e:
+            logger.exception("❌ Scheduler %s lỗi: %s", name, e)
+            _record_run(run_id, status="failed", finished_at=market_now(),
+                        duration_seconds=round(time.monotonic() - t0, 3), errors=1, error=str(e)[:2000])
+        finally:
+            stop.set()
+    finally:
+        lock.release()
+
+
+def _last_success(name: str):
+    db = SessionLocal()
+    try:
+        return (db.query(models.SchedulerRun.started_at)
+                .filter(models.SchedulerRun.job == name,
+                        models.SchedulerRun.status == "succeeded")
+                .order_by(models.SchedulerRun.started_at.desc())
+                .limit(1)
+                .scalar())
+    finally:
+        db.close()
+
+
+def catch_up_missed_runs(scheduler: BackgroundScheduler):
+    """Khi khởi động: nếu lượt chạy gần nhất theo lịch (phiên giao dịch gần nhất) bị lỡ thì chạy bù đúng 1 lần"""
+    now = market_now()
+    calendar = get_calendar()
+    for name, spec in SCHEDULES.items():
+        due = now.replace(hour=spec["hour"], minute=spec["minute"], second=0, microsecond=0)
+        if due > now or not calendar.is_session(due.date()):
+            # chưa tới giờ hôm nay / hôm nay nghỉ -> mốc của phiên trước
+            due = datetime.combine(calendar.previous(due.date()), due.time())
+        last = _last_success(name)
+        if last is None or last < due:
+            logger.info("⏪ Chạy bù %s (lịch %s, lần cuối %s)", name, due, last)
+            scheduler.add_job(run_job, args=(name, due), id=f"catchup-{name}", replace_existing=True)
+
 
 def start_scheduler():
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(update_daily, "cron", hour=13, minute=0)  # chạy mỗi 13h
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    scheduler = BackgroundScheduler(
+        timezone=TIMEZONE,
+        job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": 6 * 3600},
+    )
+    for name, spec in SCHEDULES.items():
+        scheduler.add_job(
+            run_job,
+            CronTrigger(day_of_week="mon-fri", timezone=TIMEZONE, **spec),
+            args=(name,),
+            id=name,
+            replace_existing=True,
+        )
     scheduler.start()
+    catch_up_missed_runs(scheduler)
+    _scheduler = scheduler
+    logger.info("⏰ Scheduler đã khởi động: %s", ", ".join(SCHEDULES))
+    return scheduler
+
+
+def shutdown_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+        _scheduler = None
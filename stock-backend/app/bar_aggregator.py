@@ -0,0 +1,89 @@
+"""
+Tổng hợp nến intraday 1m/5m/15m từ lệnh khớp.
+
+Mỗi batch lệnh khớp vừa ghi vào intraday_prices được gom (vector hóa) thành nến theo từng khung,
+rồi upsert vào intraday_bars trong cùng transaction: nến đã có chỉ được cập nhật high/low/close/
+volume (thường chỉ là nến đang mở), không tính lại từ bảng lệnh khớp.
+Lệnh khớp của 1 mã đến theo thứ tự thời gian, nên khi có lệnh ở thời điểm T thì mọi nến
+kết thúc trước T của mã đó đã đủ dữ liệu -> đánh dấu closed.
+"""
+import io
+
+import pandas as pd
+from sqlalchemy import text
+
+BAR_INTERVALS = {"1m": 60, "5m": 300, "15m": 900}
+
+BAR_COLUMNS = ["symbol", "interval", "start", "open", "high", "low", "close", "volume", "ticks"]
+
+STAGE_TABLE = "intraday_bars_stage"
+
+_INTERVAL_SECONDS_SQL = "CASE b.interval " + " ".join(
+    f"WHEN '{name}' THEN {seconds}" for name, seconds in BAR_INTERVALS.items()) + " END"
+
+
+def aggregate_bars(ticks: pd.DataFrame, intervals=BAR_INTERVALS) -> pd.DataFrame:
+    """ticks có cột symbol, datetime, price, volume -> nến OHLCV của mọi khung"""
+    if ticks is None or ticks.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+
+    ticks = ticks.sort_values(["symbol", "datetime"], kind="stable")
+    frames = []
+    for name, seconds in intervals.items():
+        start = ticks["datetime"].dt.floor(f"{seconds}s")
+        bars = (ticks.assign(start=start)
+                     .groupby(["symbol", "start"], sort=False)
+                     .agg(open=("price", "first"), high=("price", "max"), low=("price", "min"),
+                          close=("price", "last"), volume=("volume", "sum"), ticks=("price", "size"))
+                     .reset_index())
+        frames.append(bars.assign(interval=name))
+    return pd.concat(frames, ignore_index=True)[BAR_COLUMNS]
+
+
+def upsert_bars(conn, ticks: pd.DataFrame) -> int:
+    """Gộp batch lệnh khớp vào intraday_bars (trong transaction của conn). Trả về số nến chạm tới"""
+    bars = aggregate_bars(ticks)
+    if bars.empty:
+        return 0
+
+    out = bars.copy()
+    out["volume"] = pd.to_numeric(out["volume"], errors="coerce").round().astype("Int64")
+    buf = io.StringIO()
+    out.to_csv(buf, index=False, header=False, na_rep="", date_format="%Y-%m-%d %H:%M:%S")
+    buf.seek(0)
+
+    cols = ", ".join(f'"{c}"' for c in BAR_COLUMNS)
+    conn.execute(text(
+        f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} "
+        f"(LIKE intraday_bars INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+    ))
+    cur = conn.connection.cursor()
+    cur.copy_expert(f"COPY {STAGE_TABLE} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+    cur.close()
+    conn.execute(text(
+        f"INSERT INTO intraday_bars ({cols}, closed) SELECT {cols}, false FROM {STAGE_TABLE} "
+        f"ON CONFLICT (symbol, interval, start) DO UPDATE SET "
+        f"high = GREATEST(intraday_bars.high, EXCLUDED.high), "
+        f"low = LEAST(intraday_bars.low, EXCLUDED.low), "
+        f"close = EXCLUDED.close, "
+        f"volume = intraday_bars.volume + EXCLUDED.volume, "
+        f"ticks = intraday_bars.ticks + EXCLUDED.ticks"
+    ))
+
+    # Chốt các nến đã qua mốc kết thúc theo lệnh khớp mới nhất của từng mã
+    marks = ticks.groupby("symbol")["datetime"].max()
+    conn.execute(text(
+        f"UPDATE intraday_bars b SET closed = true "
+        f"FROM unnest(CAST(:symbols AS text[]), CAST(:marks AS timestamp[])) AS w(symbol, mark) "
+        f"WHERE b.symbol = w.symbol AND NOT b.closed "
+        f"AND b.start + {_INTERVAL_SECONDS_SQL} * interval '1 second' <= w.mark"
+    ), {"symbols": marks.index.tolist(), "marks": [t.to_pydatetime() for t in marks]})
+    return len(bars)
+
+
+def close_bars(conn, cutoff) -> int:
+    """Chốt mọi nến kết thúc trước cutoff (vd. hết phiên, mã không còn lệnh khớp nào)"""
+    return conn.execute(text(
+        f"UPDATE intraday_bars b SET closed = true "
+        f"WHERE NOT b.closed AND b.start + {_INTERVAL_SECONDS_SQL} * interval '1 second' <= :cutoff"
+    ), {"cutoff": cutoff}).rowcount
@@ -0,0 +1,277 @@
+"""
+Tìm kiếm công ty cho autocomplete của /stocks/companies?q=...
+
+Chỉ mục trong bộ nhớ của process API (vài nghìn mã, dựng lại mất vài chục ms):
+    - mã: danh sách mã đã sắp xếp, tìm tiền tố bằng bisect
+    - tên: danh sách (từ, id) đã sắp xếp theo từng từ của tên, tìm tiền tố từ bằng bisect
+    - chuỗi con: posting list trigram của "mã tên", giao các posting rồi kiểm tra lại;
+      q 1-2 ký tự (chưa có trigram) thì quét thẳng danh sách mã / tên, kết quả được cache theo q
+Mọi so khớp không phân biệt hoa thường và dấu tiếng Việt ("ngan hang" khớp "Ngân hàng", "đ" = "d"),
+cùng tập kết quả với ILIKE '%q%' trên mã / tên ("vn" khớp DVN).
+Thứ hạng: trùng mã > tiền tố mã > tiền tố 1 từ trong tên > chuỗi con của mã > chuỗi con của tên,
+cùng hạng thì theo mã.
+
+Chỉ mục được dựng lại khi companies thay đổi: merge_companies tăng version companies/all
+(dataset_versions); process API kiểm tra version tối đa mỗi COMPANY_SEARCH_RECHECK giây.
+
+Phía Postgres (migration 0002_company_search): pg_trgm + unaccent, hàm f_unaccent (IMMUTABLE)
+và GIN trigram index trên mã / tên không dấu, dùng khi tắt chỉ mục bộ nhớ. main.py chỉ chạy create_all,
+không chạy migration: DB chưa `alembic upgrade head` thì thiếu f_unaccent / similarity -> tìm bằng
+ILIKE thường trên mã / tên (phân biệt dấu, không có index, sắp theo mã) và log cảnh báo 1 lần.
+
+Cấu hình:
+    COMPANY_SEARCH_MEMORY  = 0 để tìm thẳng trong Postgres (mặc định: 1)
+    COMPANY_SEARCH_RECHECK = số giây giữa 2 lần kiểm tra version companies (mặc định: 10)
+
+Benchmark (dữ liệu giả, không cần DB): python -m app.company_search --bench
+"""
+import argparse
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+import unicodedata
+
+from sqlalchemy import text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ("symbol", "exchange", "name", "industry", "website", "listing_date")
+
+# Kết quả rộng (nhiều hơn BROAD_RESULTS id) và kết quả của q 1-2 ký tự (phải quét hết danh sách)
+# được cache theo chỉ mục
+BROAD_RESULTS = 200
+BROAD_CACHE_SIZE = 2048
+
+# Tier xếp hạng (nhỏ hơn = tốt hơn)
+EXACT_SYMBOL, SYMBOL_PREFIX, WORD_PREFIX, SYMBOL_SUBSTRING, NAME_SUBSTRING = range(5)
+
+
+def search_enabled() -> bool:
+    return os.getenv("COMPANY_SEARCH_MEMORY", "1") == "1"
+
+
+def fold(value: str | None) -> str:
+    """Chữ thường, bỏ dấu tiếng Việt, gộp khoảng trắng"""
+    if not value:
+        return ""
+    value = value.lower().replace("đ", "d")
+    value = "".join(c for c in unicodedata.normalize("NFD", value) if not unicodedata.combining(c))
+    return " ".join(value.split())
+
+
+def _trigrams(value: str) -> set:
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class CompanySearchIndex:
+    def __init__(self, rows):
+        """rows: tuple theo SEARCH_COLUMNS"""
+        self.rows = [tuple(r) for r in rows]
+        self.symbols = [(r[0] or "").lower() for r in self.rows]
+        self.names = [fold(r[2]) for r in self.rows]
+
+        self._symbol_sorted = sorted((s, i) for i, s in enumerate(self.symbols))
+        self._words = sorted({(w, i) for i, name in enumerate(self.names) for w in name.split()})
+        self._postings = {}
+        for i, (symbol, name) in enumerate(zip(self.symbols, self.names)):
+            for gram in _trigrams(f"{symbol} {name}"):
+                self._postings.setdefault(gram, []).append(i)
+        self._broad = {}  # (q, exchange, industry) -> toàn bộ id đã xếp hạng
+
+    def __len__(self):
+        return len(self.rows)
+
+    @staticmethod
+    def _prefix_scan(sorted_pairs, prefix):
+        for pos in range(bisect.bisect_left(sorted_pairs, (prefix,)), len(sorted_pairs)):
+            key, i = sorted_pairs[pos]
+            if not key.startswith(prefix):
+                break
+            yield i
+
+    def _substring_candidates(self, q):
+        if len(q) < 3:
+            return range(len(self.rows))  # chưa đủ trigram: kiểm tra mọi mã (vài nghìn phép `in`)
+        postings = sorted((self._postings.get(g, ()) for g in _trigrams(q)), key=len)
+        if not postings or not postings[0]:
+            return ()
+        candidates = set(postings[0])
+        for p in postings[1:]:
+            candidates.intersection_update(p)
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, q: str, exchange: str | None = None, industry: str | None = None,
+               limit: int | None = None) -> tuple[list, int]:
+        """(id khớp đã xếp hạng, tối đa limit phần tử; tổng số kết quả)"""
+        q = fold(q)
+        if not q:
+            return [], 0
+        cached = self._broad.get((q, exchange, industry))
+        if cached is not None:
+            return (cached if limit is None else cached[:limit]), len(cached)
+
+        best = {}
+        for i in self._prefix_scan(self._symbol_sorted, q):
+            best[i] = EXACT_SYMBOL if self.symbols[i] == q else SYMBOL_PREFIX
+        for i in self._prefix_scan(self._words, q):
+            best.setdefault(i, WORD_PREFIX)
+        for i in self._substring_candidates(q):
+            if i in best:
+                continue
+            if q in self.symbols[i]:
+                best[i] = SYMBOL_SUBSTRING
+            elif q in self.names[i]:
+                best[i] = NAME_SUBSTRING
+
+        if exchange or industry:
+            best = {i: t for i, t in best.items()
+                    if (not exchange or self.rows[i][1] == exchange) and (not industry or self.rows[i][3] == industry)}
+        key = lambda i: (best[i], self.symbols[i])
+        if len(best) > BROAD_RESULTS or len(q) < 3:
+            ranked = sorted(best, key=key)
+            if len(self._broad) < BROAD_CACHE_SIZE:
+                self._broad[(q, exchange, industry)] = ranked
+            return (ranked if limit is None else ranked[:limit]), len(ranked)
+        if limit is not None and limit < len(best):
+            return heapq.nsmallest(limit, best, key=key), len(best)
+        return sorted(best, key=key), len(best)
+
+    def records(self, ids) -> list:
+        return [dict(zip(SEARCH_COLUMNS, self.rows[i])) for i in ids]
+
+
+def _load_rows():
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT {', '.join(SEARCH_COLUMNS)} FROM companies")).all()
+
+
+def _companies_version():
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT version FROM dataset_versions WHERE dataset = 'companies' AND key = 'all'"
+        )).scalar()
+
+
+class CompanySearch:
+    """Giữ chỉ mục hiện tại và dựng lại khi version companies đổi"""
+
+    def __init__(self, recheck: float = 10.0, loader=_load_rows, version_fn=_companies_version):
+        self.recheck = recheck
+        self.loader = loader
+        self.version_fn = version_fn
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+        self.rebuilds = 0
+        self._lock = threading.Lock()
+
+    def needs_refresh(self) -> bool:
+        return self.index is None or time.monotonic() - self.checked_at > self.recheck
+
+    def refresh(self, force: bool = False):
+        """Đọc DB (đồng bộ): kiểm tra version, dựng lại chỉ mục nếu cần"""
+        with self._lock:
+            if not force and not self.needs_refresh():
+                return
+            version = self.version_fn()
+            if force or self.index is None or version != self.version:
+                self.index = CompanySearchIndex(self.loader())
+                self.version = version
+                self.rebuilds += 1
+            self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        self.checked_at = 0.0
+        self.version = object()  # lần refresh sau chắc chắn dựng lại
+
+
+_search = None
+_search_lock = threading.Lock()
+_unaccent_ready = None
+
+
+def sql_search_ready() -> bool:
+    """DB đã có f_unaccent và pg_trgm (migration 0002) chưa; kiểm tra 1 lần mỗi process (đồng bộ)"""
+    global _unaccent_ready
+    if _unaccent_ready is None:
+        with engine.connect() as conn:
+            found = conn.execute(text(
+                "SELECT count(DISTINCT proname) FROM pg_proc WHERE proname IN ('f_unaccent', 'similarity')"
+            )).scalar()
+        _unaccent_ready = found == 2
+        if not _unaccent_ready:
+            logger.warning("⚠️ Thiếu f_unaccent / pg_trgm (chưa chạy alembic upgrade head): "
+                           "tìm công ty bằng ILIKE thường")
+    return _unaccent_ready
+
+
+def get_company_search() -> CompanySearch:
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = CompanySearch(recheck=float(os.getenv("COMPANY_SEARCH_RECHECK", "10")))
+        return _search
+
+
+def invalidate_company_search():
+    """Gọi sau khi merge companies trong cùng process"""
+    if _search is not None:
+        _search.invalidate()
+
+
+# ================== Benchmark ==================
+def run_benchmark(n: int = 1700, queries: int = 20000, seed: int = 7) -> dict:
+    import random
+    import string
+
+    rng = random.Random(seed)
+    words = ["Ngân hàng", "TMCP", "Công ty", "Cổ phần", "Đầu tư", "Phát triển", "Xây dựng", "Bất động sản",
+             "Thép", "Sữa", "Việt Nam", "Điện lực", "Dầu khí", "Chứng khoán", "Hàng không", "Thủy sản",
+             "Dược phẩm", "Vận tải", "Nhựa", "Cao su", "Đô thị", "Sài Gòn", "Hà Nội", "Đà Nẵng"]
+    symbols = set()
+    while len(symbols) < n:
+        symbols.add("".join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+    rows = [(s, rng.choice(["HOSE", "HNX", "UPCOM"]), " ".join(rng.sample(words, 5)), None, None, None)
+            for s in sorted(symbols)]
+
+    t0 = time.perf_counter()
+    index = CompanySearchIndex(rows)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    pool = [s[:k] for s in sorted(symbols)[:200] for k in (1, 2, 3)] + \
+           [fold(w)[:k] for w in words for k in (2, 4, 6)] + ["ngan hang", "viet nam", "dau tu", "cp"]
+    samples = []
+    for _ in range(queries):
+        q = rng.choice(pool)
+        t = time.perf_counter()
+        ids, _ = index.search(q, limit=20)
+        index.records(ids)
+        samples.append(time.perf_counter() - t)
+    samples.sort()
+    return {
+        "companies": n,
+        "build_ms": round(build_ms, 2),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+        "max_us": round(samples[-1] * 1e6, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chỉ mục tìm kiếm công ty")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--companies", type=int, default=1700)
+    args = parser.parse_args()
+    if args.bench:
+        print(run_benchmark(args.companies))
+    else:
+        search = get_company_search()
+        search.refresh(force=True)
+        print(f"✅ Đã dựng chỉ mục {len(search.index)} công ty")
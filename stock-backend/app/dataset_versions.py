@@ -0,0 +1,71 @@
+"""
+Watermark phiên bản dữ liệu + ETag / GET có điều kiện cho các API dữ liệu thị trường.
+
+Loader tăng version trong cùng transaction ghi dữ liệu (bảng dataset_versions):
+    prices         key = symbol      (bulk_upsert_prices)
+    daily          key = YYYY-MM-DD  (bulk_upsert_prices)
+    companies      key = all         (merge_companies, vì /daily lấy tên + sàn từ companies)
+    ranking        key = YYYYQn      (save_growth_summary_to_db)
+    latest         key = all         (bulk_upsert_prices, khi latest_prices đổi)
+    market_summary key = YYYY-MM-DD  (market_summary.materialize_days)
+
+Endpoint đọc version (1 lookup theo khóa chính) trước khi chạy query chính: ETag = version + hash
+của path/query string. Nếu If-None-Match khớp thì trả 304 luôn. Version được đọc trước dữ liệu nên
+nếu có lần ghi xen giữa, response chứa dữ liệu mới hơn ETag và lần poll sau chỉ tải lại thêm 1 lần.
+Điều này chỉ đúng khi dữ liệu đọc từ DB sau đó; nguồn cache trong process (price_cache) phải so
+version của nó với request.state.dataset_versions trước khi dùng.
+"""
+import hashlib
+from email.utils import format_datetime
+from datetime import timezone
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import select, text, tuple_
+
+from .models import DatasetVersion
+
+BUMP_SQL = """
+INSERT INTO dataset_versions (dataset, key, version, updated_at)
+SELECT :dataset, k, 1, now() FROM unnest(CAST(:keys AS text[])) AS k
+ON CONFLICT (dataset, key) DO UPDATE
+SET version = dataset_versions.version + 1, updated_at = now()
+"""
+
+
+def bump_versions(conn, dataset: str, keys) -> int:
+    """Tăng version cho các key (gọi trong transaction của writer, commit cùng dữ liệu)"""
+    # sắp xếp để các writer song song khóa dòng theo cùng thứ tự (tránh deadlock)
+    keys = sorted({str(k) for k in keys})
+    if keys:
+        conn.execute(text(BUMP_SQL), {"dataset": dataset, "keys": keys})
+    return len(keys)
+
+
+async def conditional_get(request: Request, db, *versions: tuple[str, str]):
+    """
+    versions: các cặp (dataset, key) mà response phụ thuộc.
+    Trả (Response 304 hoặc None, headers ETag/Last-Modified để gắn vào response 200).
+    Version đã đọc được lưu ở request.state.dataset_versions {(dataset, key): version}.
+    """
+    rows = (await db.execute(
+        select(DatasetVersion.dataset, DatasetVersion.key, DatasetVersion.version, DatasetVersion.updated_at)
+        .where(tuple_(DatasetVersion.dataset, DatasetVersion.key).in_(versions))
+    )).all()
+    found = {(r.dataset, r.key): r for r in rows}
+
+    # dataset chưa từng được ghi -> version 0 (lần ghi đầu tiên sẽ đổi ETag)
+    request.state.dataset_versions = {v: found[v].version if v in found else 0 for v in versions}
+    stamp = ".".join(str(request.state.dataset_versions[v]) for v in versions)
+    digest = hashlib.blake2s(f"{request.url.path}?{request.url.query}".encode("utf-8"), digest_size=6).hexdigest()
+    etag = f'W/"{stamp}-{digest}"'
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    modified = [r.updated_at for r in rows if r.updated_at is not None]
+    if modified:
+        headers["Last-Modified"] = format_datetime(max(modified).astimezone(timezone.utc), usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(","))):
+        return Response(status_code=304, headers=headers), headers
+    return None, headers
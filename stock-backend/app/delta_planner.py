@@ -0,0 +1,86 @@
+import logging
+from datetime import date, datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .trading_calendar import get_calendar, last_closed_session, market_now
+
+logger = logging.getLogger(__name__)
+
+FULL_LOAD_START = "2008-01-01"
+
+
+# Mã chưa có giá nào: lần fetch này không trả dữ liệu -> ghi nhận đã hỏi tới `through`
+RECORD_NO_DATA_SQL = """
+INSERT INTO price_no_data (symbol, checked_through, updated_at)
+SELECT s, :through, now() FROM unnest(CAST(:symbols AS text[])) AS s
+WHERE NOT EXISTS (SELECT 1 FROM stock_prices sp WHERE sp.symbol = s)
+ON CONFLICT (symbol) DO UPDATE
+SET checked_through = GREATEST(price_no_data.checked_through, EXCLUDED.checked_through), updated_at = now()
+"""
+
+
+def last_trading_day(today: date | None = None) -> date:
+    """Ngày giao dịch gần nhất (theo lịch giao dịch, tính cả hôm nay giờ Việt Nam)"""
+    return get_calendar().last_session(today or market_now().date())
+
+
+def get_watermarks(db: Session) -> dict:
+    """Lấy ngày cuối cùng đã lưu của mọi mã bằng 1 câu GROUP BY"""
+    rows = (db.query(models.StockPrice.symbol, func.max(models.StockPrice.date))
+            .group_by(models.StockPrice.symbol)
+            .all())
+    return {symbol: last_date for symbol, last_date in rows}
+
+
+def get_no_data_watermarks(db: Session) -> dict:
+    return {symbol: through for symbol, through in
+            db.query(models.PriceNoData.symbol, models.PriceNoData.checked_through).all()}
+
+
+def record_no_data(db: Session, symbols, through: date) -> int:
+    """Ghi watermark "không có dữ liệu" cho các mã chưa có giá nào sau lần fetch rỗng"""
+    symbols = sorted(set(symbols))
+    if not symbols:
+        return 0
+    count = db.execute(text(RECORD_NO_DATA_SQL), {"symbols": symbols, "through": through}).rowcount
+    db.commit()
+    return count
+
+
+def plan_delta_load(db: Session, symbols, now: datetime | None = None) -> dict:
+    """
+    Lập kế hoạch delta load: mã nào cần fetch và từ ngày nào.
+    Đích là phiên đã đóng cửa gần nhất (chạy buổi sáng thì là phiên hôm trước), mã đã có dữ liệu
+    tới đó thì bỏ qua; ngày bắt đầu là phiên kế tiếp sau ngày cuối đã lưu (không hỏi provider
+    cuối tuần / ngày lễ). Mã chưa có giá nào bắt đầu từ FULL_LOAD_START, hoặc từ sau watermark
+    price_no_data nếu lần trước đã hỏi mà không có dữ liệu.
+    """
+    calendar = get_calendar()
+    target = last_closed_session(now)
+    watermarks = get_watermarks(db)
+    no_data = get_no_data_watermarks(db)
+
+    to_fetch = []
+    up_to_date = []
+    for symbol in symbols:
+        last_date = watermarks.get(symbol) or no_data.get(symbol)
+        if last_date is None:
+            to_fetch.append({"symbol": symbol, "start_date": FULL_LOAD_START})
+        elif last_date >= target:
+            up_to_date.append(symbol)
+        else:
+            start = calendar.next(last_date).strftime("%Y-%m-%d")
+            to_fetch.append({"symbol": symbol, "start_date": start})
+
+    logger.info("📋 Delta plan %s: %d mã cần fetch, %d mã đã cập nhật",
+                target, len(to_fetch), len(up_to_date))
+
+    return {
+        "last_trading_day": target.strftime("%Y-%m-%d"),
+        "total": len(to_fetch) + len(up_to_date),
+        "to_fetch": to_fetch,
+        "up_to_date": len(up_to_date),
+    }
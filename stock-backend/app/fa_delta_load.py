@@ -1,7 +1,7 @@
-import time
 import logging
 import pandas as pd
-from vnstock import Listing, Finance
+from app.market_data import get_provider, provider_stats, REPORT_TYPES
+from app.provider import CircuitOpenError, NON_RETRYABLE
 from app.database import SessionLocal
 from app.models import Base, FinancialReport
 import json
@@ -27,14 +27,13 @@ def save_checkpoint(ticker):
         json.dump({"last_ticker": ticker}, f)
 
 
-# ================== Fetch dữ liệu từ vnstock ==================
+# ================== Fetch dữ liệu từ market data provider ==================
 def fetch_financial_df_for_ticker(ticker, source="VCI", period="quarter", lang="vi"):
     try:
-        f = Finance(symbol=ticker, source=source)
+        md = get_provider()
         return {
-            "income_statement": f.income_statement(period=period, lang=lang),
-            "balance_sheet": f.balance_sheet(period=period, lang=lang),
-            "cash_flow": f.cash_flow(period=period, lang=lang)
+            rtype: md.financial_report(ticker, rtype, period=period, lang=lang, source=source)
+            for rtype in REPORT_TYPES
         }
     except Exception as e:
         raise e
@@ -69,15 +68,7 @@ def get_max_report_period(db: Session, ticker: str, report_type: str, period_typ
 def get_all_tickers():
     """Thử nhiều cách lấy list tickers, trả về list string."""
     try:
-        df = Listing.all_symbols()
-        if isinstance(df, pd.DataFrame) and "symbol" in df.columns:
-            return df['symbol'].dropna().unique().tolist()
-    except Exception:
-        pass
-
-    try:
-        listing = Listing()
-        df = listing.all_symbols()
+        df = get_provider().all_symbols()
         if isinstance(df, pd.DataFrame) and "symbol" in df.columns:
             return df['symbol'].dropna().unique().tolist()
     except Exception:
@@ -207,6 +198,8 @@ def delta_load_financials(tickers, source="VCI", period_types=["quarter"], symbo
         skip_mode = bool(last_ticker)
         logger.info("Checkpoint last_ticker = %s", last_ticker)
 
+    # checkpoint chỉ là 1 mã: sau mã đầu tiên fetch lỗi thì không tiến checkpoint nữa để lần resume lấy lại
+    checkpoint_frozen = False
     db = SessionLocal()
     for i, t in enumerate(tickers):
         if skip_mode:
@@ -215,6 +208,7 @@ def delta_load_financials(tickers, source="VCI", period_types=["quarter"], symbo
             continue
 
         logger.info("Delta processing %d/%d: %s", i+1, len(tickers), t)
+        fetch_failed = False
 
         for period in period_types:   # loop cả quarter và year
             try:
@@ -262,10 +256,18 @@ def delta_load_financials(tickers, source="VCI", period_types=["quarter"], symbo
                     df_new['period_type'] = period
 
                     save_to_db(df_new)
-                    time.sleep(1)
+            except CircuitOpenError:
+                raise  # nguồn đang bị ngắt: dừng, checkpoint giữ ở mã cuối đã xong
+            except NON_RETRYABLE as e:
+                logger.exception("Lỗi dữ liệu khi delta-load %s: %s", t, e)
             except Exception as e:
+                fetch_failed = True
                 logger.exception("Lỗi khi delta-load %s: %s", t, e)
 
-        if not symbol:
+        if fetch_failed and not checkpoint_frozen:
+            checkpoint_frozen = True
+            logger.warning("Giữ checkpoint trước %s: mã này fetch lỗi, lần chạy sau sẽ lấy lại", t)
+        if not symbol and not checkpoint_frozen:
             save_checkpoint(t)
-        time.sleep(1)
+
+    logger.info("Delta load provider cache: %s", provider_stats())
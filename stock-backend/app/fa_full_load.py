@@ -1,6 +1,7 @@
-import logging, time, re 
+import logging, re
 import pandas as pd
-from vnstock import Listing, Finance
+from app.market_data import get_provider, provider_stats, REPORT_TYPES
+from app.provider import CircuitOpenError, NON_RETRYABLE
 from app.database import SessionLocal, engine
 from app.models import Base, FinancialReport
 import json, os
@@ -30,8 +31,7 @@ def save_checkpoint(ticker):
 
 def get_all_tickers():
     try:
-        listing = Listing()
-        df = listing.all_symbols()
+        df = get_provider().all_symbols()
         if isinstance(df, pd.DataFrame) and "symbol" in df.columns:
             return df['symbol'].dropna().unique().tolist()
     except Exception:
@@ -106,47 +106,19 @@ def save_to_db(df: pd.DataFrame):
 
 def fetch_financial_df_for_ticker(ticker: str, source="VCI", period="quarter", lang="vi"):
     """
-    Khởi tạo Finance đúng cách và gọi các method hiện có.
+    Lấy 3 loại báo cáo tài chính qua market data provider.
     Trả về dict of DataFrame: {'income_statement': df, ...}
+    Chỉ lỗi dữ liệu (NON_RETRYABLE, vd: mã không có báo cáo) thành None; lỗi nguồn / breaker mở được raise.
     """
+    md = get_provider()
     results = {}
-    try:
-        finance_client = Finance(symbol=ticker, source=source)
-    except TypeError as e:
-        # Nếu Finance __init__ khác signature, thử khác tạo instance
-        finance_client = Finance(ticker)  # fallback (nếu signature khác)
-
-    # Các report types và các method tên khả dĩ
-    map_methods = {
-        "income_statement": ["income_statement", "income", "statement_income"],
-        "balance_sheet": ["balance_sheet", "balance", "statement_balance"],
-        "cash_flow": ["cash_flow", "cashflow", "cash"],
-    }
-
-    for rtype, candidates in map_methods.items():
-        df = None
-        for name in candidates:
-            if hasattr(finance_client, name):
-                func = getattr(finance_client, name)
-                # gọi thử với nhiều signature
-                try:
-                    df = func(period=period, lang=lang, symbol=ticker)
-                except TypeError:
-                    try:
-                        df = func(period=period, lang=lang)
-                    except TypeError:
-                        try:
-                            df = func(period)
-                        except TypeError:
-                            try:
-                                df = func()
-                            except Exception:
-                                df = None
-                except Exception as e:
-                    logger.debug("call %s failed: %s", name, e)
-                if isinstance(df, pd.DataFrame):
-                    break
-        results[rtype] = df
+    for rtype in REPORT_TYPES:
+        try:
+            df = md.financial_report(ticker, rtype, period=period, lang=lang, source=source)
+        except NON_RETRYABLE as e:
+            logger.debug("call %s failed: %s", rtype, e)
+            df = None
+        results[rtype] = df if isinstance(df, pd.DataFrame) else None
     return results
 
 # def test_fetch_one(ticker="VCB"):
@@ -170,6 +142,8 @@ def full_load_financials(tickers, source="VCI", period_types=["quarter"], lang="
     last_ticker = load_checkpoint()
     skip_mode = bool(last_ticker)
     logger.info("[FULL LOAD] Checkpoint last_ticker = %s", last_ticker)
+    # checkpoint chỉ là 1 mã: sau mã đầu tiên fetch lỗi thì không tiến checkpoint nữa để lần resume lấy lại
+    checkpoint_frozen = False
 
     for i, t in enumerate(tickers):
         if skip_mode:
@@ -179,53 +153,61 @@ def full_load_financials(tickers, source="VCI", period_types=["quarter"], lang="
                 continue
 
         logger.info("Processing %d/%d: %s", i+1, len(tickers), t)
+        fetch_failed = False
         for period in period_types:
-            retry = 0
-            while retry < 5:  # tối đa thử lại 5 lần
-                try:
-                    reports = fetch_financial_df_for_ticker(t, source=source, period=period)
-                    if not reports:
-                        logger.warning("Không có dữ liệu cho %s %s", t, period)
-                        break
-
-                    for rname, df in reports.items():
-                        if df is None or df.empty:
-                            logger.info("No data for %s %s %s", t, rname, period)
-                            continue
-                        df = df.copy()
-                        # Chuẩn hóa cột report_year
-                        if 'report_year' not in df.columns:
-                            if 'Năm' in df.columns:  
-                                df['report_year'] = df['Năm']
-                            elif 'year' in df.columns:
-                                df['report_year'] = df['year']
-                            else:
-                                raise ValueError("Không tìm thấy cột năm trong dữ liệu đầu vào")
-
-                        # Chuẩn hóa cột report_quarter
-                        if 'report_quarter' not in df.columns:
-                            if 'Kỳ' in df.columns:  
-                                # Lấy số từ chuỗi "Kỳ 2" -> 2
-                                df['report_quarter'] = df['Kỳ'].astype(str).str.extract(r'(\d+)')
-                            elif 'quarter' in df.columns:
-                                df['report_quarter'] = df['quarter']
-                            else:
-                                # Nếu không có quarter (chẳng hạn báo cáo năm), gán mặc định = 0
-                                df['report_quarter'] = 0
-
-                        # Convert về int để chắc chắn không null
-                        df['report_year'] = df['report_year'].astype(int)
-                        df['report_quarter'] = df['report_quarter'].astype(int)
-                        df['ticker'] = t
-                        df['lang']=lang
-                        df['report_type'] = rname
-                        df['period_type'] = period
-                        save_to_db(df)
-                        time.sleep(1)
-                    break  # thành công thì thoát vòng retry
-
-                except Exception as e:
-                    logger.exception("Lỗi khác với %s: %s", t, e)
+            # Retry có giới hạn + backoff do provider đảm nhiệm
+            try:
+                reports = fetch_financial_df_for_ticker(t, source=source, period=period)
+                if not reports:
+                    logger.warning("Không có dữ liệu cho %s %s", t, period)
+                    continue
+
+                for rname, df in reports.items():
+                    if df is None or df.empty:
+                        logger.info("No data for %s %s %s", t, rname, period)
+                        continue
+                    df = df.copy()
+                    # Chuẩn hóa cột report_year
+                    if 'report_year' not in df.columns:
+                        if 'Năm' in df.columns:  
+                            df['report_year'] = df['Năm']
+                        elif 'year' in df.columns:
+                            df['report_year'] = df['year']
+                        else:
+                            raise ValueError("Không tìm thấy cột năm trong dữ liệu đầu vào")
+
+                    # Chuẩn hóa cột report_quarter
+                    if 'report_quarter' not in df.columns:
+                        if 'Kỳ' in df.columns:  
+                            # Lấy số từ chuỗi "Kỳ 2" -> 2
+                            df['report_quarter'] = df['Kỳ'].astype(str).str.extract(r'(\d+)')
+                        elif 'quarter' in df.columns:
+                            df['report_quarter'] = df['quarter']
+                        else:
+                            # Nếu không có quarter (chẳng hạn báo cáo năm), gán mặc định = 0
+                            df['report_quarter'] = 0
+
+                    # Convert về int để chắc chắn không null
+                    df['report_year'] = df['report_year'].astype(int)
+                    df['report_quarter'] = df['report_quarter'].astype(int)
+                    df['ticker'] = t
+                    df['lang']=lang
+                    df['report_type'] = rname
+                    df['period_type'] = period
+                    save_to_db(df)
+
+            except CircuitOpenError:
+                raise  # nguồn đang bị ngắt: dừng, checkpoint giữ ở mã cuối đã xong
+            except NON_RETRYABLE as e:
+                logger.exception("Lỗi dữ liệu với %s: %s", t, e)
+            except Exception as e:
+                fetch_failed = True
+                logger.exception("Lỗi khác với %s: %s", t, e)
+        if fetch_failed and not checkpoint_frozen:
+            checkpoint_frozen = True
+            logger.warning("Giữ checkpoint trước %s: mã này fetch lỗi, lần chạy sau sẽ lấy lại", t)
         # ✅ Lưu checkpoint sau khi xong ticker
-        save_checkpoint(t)
-        time.sleep(1)  # nghỉ 1s giữa các ticker
\ No newline at end of file
+        if not checkpoint_frozen:
+            save_checkpoint(t)
+
+    logger.info("[FULL LOAD] Provider cache: %s", provider_stats())
\ No newline at end of file
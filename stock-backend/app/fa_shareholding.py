@@ -1,12 +1,11 @@
 import logging
-import time
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
 import pandas as pd
 from sqlalchemy.orm import Session
-from vnstock import Company, Listing
 
+from app.market_data import get_provider
 from app.database import SessionLocal, engine, Base
 from app.models import IssueShare
 
@@ -33,15 +32,14 @@ def full_load_issue_shares():
     db: Session = SessionLocal()
     try:
         # Lấy danh sách tất cả symbol
-        listing = Listing(source="VCI")
-        symbols_df = listing.all_symbols()
+        md = get_provider()
+        symbols_df = md.all_symbols(source="VCI")
         symbols = symbols_df["symbol"].dropna().unique().tolist()
         logger.info(f"📌 Tìm thấy {len(symbols)} cổ phiếu để load issue_share")
 
         for i, symbol in enumerate(symbols, start=1):
             try:
-                company = Company(symbol=symbol, source="TCBS")
-                overview = company.overview()
+                overview = md.company_overview(symbol, source="TCBS")
 
                 issue_share_value = overview.get("issue_share")
 
@@ -83,9 +81,6 @@ def full_load_issue_shares():
                 logger.error(f"❌ Lỗi khi xử lý {symbol}: {e}", exc_info=False)
                 db.rollback()
 
-            # Thêm delay để tránh quá tải API
-            time.sleep(1)
-
         logger.info("🎉 Hoàn thành full_load issue_shares")
 
     finally:
@@ -0,0 +1,93 @@
+"""
+Dò lỗ hổng dữ liệu trong stock_prices.
+
+Đọc (symbol, date) của cả bảng 1 lần, đổi mỗi ngày thành số thứ tự phiên trong lịch giao dịch
+(searchsorted) rồi so 2 dòng liền nhau của cùng mã: chênh lệch > 1 phiên là có khoảng thiếu.
+Kết quả là danh sách khoảng [start, end] gọn để backfill chỉ fetch đúng phần bị thiếu.
+Chỉ xét giữa ngày đầu và ngày cuối đã lưu của từng mã; phần sau ngày cuối do delta load lo.
+"""
+import logging
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .database import engine
+from .trading_calendar import get_calendar
+
+logger = logging.getLogger(__name__)
+
+
+def _load_dates(symbols=None, since: date | None = None) -> pd.DataFrame:
+    sql = "SELECT symbol, date FROM stock_prices"
+    where, params = [], {}
+    if symbols:
+        where.append("symbol = ANY(:symbols)")
+        params["symbols"] = list(symbols)
+    if since:
+        where.append("date >= :since")
+        params["since"] = since
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY symbol, date"
+    with engine.connect() as conn:
+        return pd.read_sql_query(text(sql), conn, params=params)
+
+
+def find_gaps(df: pd.DataFrame, calendar=None) -> list:
+    """
+    df có cột symbol, date (đã sắp theo symbol, date).
+    Trả về list {symbol, start, end, sessions} cho mỗi khoảng phiên bị thiếu.
+    """
+    if df is None or df.empty:
+        return []
+
+    calendar = calendar or get_calendar()
+    dates = pd.to_datetime(df["date"]).values.astype("datetime64[D]")
+    sessions = calendar.sessions_array(dates.min().astype(date), dates.max().astype(date))
+    if sessions.size == 0:
+        return []
+
+    # Số thứ tự phiên của từng dòng; ngày không phải phiên (dữ liệu lạ cuối tuần) bị bỏ qua
+    idx = np.searchsorted(sessions, dates)
+    valid = (idx < sessions.size) & (sessions[np.minimum(idx, sessions.size - 1)] == dates)
+    symbols = df["symbol"].to_numpy()[valid]
+    idx = idx[valid]
+    if idx.size < 2:
+        return []
+
+    same_symbol = symbols[1:] == symbols[:-1]
+    step = np.diff(idx)
+    hole = same_symbol & (step > 1)
+    if not hole.any():
+        return []
+
+    pos = np.nonzero(hole)[0]
+    starts = sessions[idx[pos] + 1]
+    ends = sessions[idx[pos + 1] - 1]
+    counts = step[pos] - 1
+    return [
+        {"symbol": s, "start": a.astype(date), "end": b.astype(date), "sessions": int(n)}
+        for s, a, b, n in zip(symbols[pos + 1], starts, ends, counts)
+    ]
+
+
+def scan_gaps(symbols=None, since: date | None = None) -> list:
+    """Quét cả bảng (hoặc 1 nhóm mã / từ ngày since) và trả về các khoảng thiếu"""
+    df = _load_dates(symbols, since)
+    gaps = find_gaps(df)
+    logger.info("🕳️ Quét %d dòng giá: %d khoảng thiếu, %d phiên, %d mã",
+                len(df), len(gaps), sum(g["sessions"] for g in gaps), len({g["symbol"] for g in gaps}))
+    return gaps
+
+
+def summarize_gaps(gaps: list) -> dict:
+    by_symbol = {}
+    for g in gaps:
+        by_symbol[g["symbol"]] = by_symbol.get(g["symbol"], 0) + g["sessions"]
+    return {
+        "ranges": len(gaps),
+        "sessions": sum(by_symbol.values()),
+        "symbols": len(by_symbol),
+    }
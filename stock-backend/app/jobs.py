@@ -0,0 +1,381 @@
+"""
+Job engine cho các tác vụ nạp dữ liệu chạy lâu.
+
+API chỉ ghi 1 dòng vào bảng ingestion_jobs rồi trả job id ngay.
+Worker chạy ở process riêng (python -m app.jobs), claim job bằng
+SELECT ... FOR UPDATE SKIP LOCKED và ghi tiến độ ngược lại vào bảng.
+Trong lúc job chạy, 1 thread heartbeat ghi updated_at mỗi HEARTBEAT_SECONDS (kể cả khi handler
+không báo tiến độ); job running không có heartbeat quá STALE_SECONDS bị coi là worker đã chết.
+Dòng job đã ở trạng thái cuối (succeeded / failed / cancelled) không bị ghi đè.
+"""
+import argparse
+import logging
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from . import models
+from .database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+# Job cùng nhóm không chạy song song (kể cả khác loại): mọi loader giá cùng ghi stock_prices
+EXCLUSIVE_GROUPS = {
+    "full_load": "price_loads",
+    "delta_load": "price_loads",
+    "today_load": "price_loads",
+    "backfill": "price_loads",
+}
+
+# Job "running" không có heartbeat quá lâu -> coi như worker đã chết (đánh dấu failed)
+HEARTBEAT_SECONDS = 30.0
+STALE_SECONDS = 5 * 60
+
+POLL_SECONDS = 2.0
+CLAIM_CANDIDATES = 20
+FLUSH_SECONDS = 1.0
+MAX_ERRORS_KEPT = 500
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobConflictError(Exception):
+    """Đã có job cùng nhóm đang chờ hoặc đang chạy"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        super().__init__(f"Job {job_id} cùng nhóm đang chạy")
+
+
+def _handlers():
+    # import trễ để tránh vòng import với router
+    from .routers import stocks
+    return {
+        "full_load": stocks.run_full_load,
+        "delta_load": stocks.run_delta_load,
+        "today_load": stocks.run_today_load,
+        "backfill": stocks.run_backfill,
+    }
+
+
+def _group_kinds(group):
+    return [k for k, g in EXCLUSIVE_GROUPS.items() if g == group]
+
+
+def _lock_group(db, group):
+    """Khóa theo nhóm trong transaction để enqueue / claim đồng thời không cùng lọt qua"""
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:group))"), {"group": group})
+
+
+def _fail_stale_jobs(db, group) -> int:
+    """Job running của nhóm không còn heartbeat -> failed (gọi khi đang giữ khóa nhóm)"""
+    now = datetime.now()
+    return (db.query(models.IngestionJob)
+            .filter(models.IngestionJob.kind.in_(_group_kinds(group)),
+                    models.IngestionJob.status == "running",
+                    models.IngestionJob.updated_at < now - timedelta(seconds=STALE_SECONDS))
+            .update({"status": "failed", "finished_at": now, "updated_at": now,
+                     "error": f"Worker không có heartbeat quá {STALE_SECONDS // 60} phút"},
+                    synchronize_session=False))
+
+
+def _active_job(db, group, statuses=ACTIVE_STATUSES):
+    """Job cùng nhóm đang chờ (bất kể bao lâu) hoặc đang chạy còn heartbeat"""
+    _fail_stale_jobs(db, group)
+    return (db.query(models.IngestionJob)
+            .filter(models.IngestionJob.kind.in_(_group_kinds(group)),
+                    models.IngestionJob.status.in_(statuses))
+            .first())
+
+
+def enqueue_job(kind: str, params: dict | None = None) -> models.IngestionJob:
+    """Tạo job mới ở trạng thái queued, raise JobConflictError nếu trùng nhóm"""
+    db = SessionLocal()
+    try:
+        group = EXCLUSIVE_GROUPS.get(kind)
+        if group:
+            _lock_group(db, group)
+            active = _active_job(db, group)
+            if active:
+                raise JobConflictError(active.id)
+
+        now = datetime.now()
+        job = models.IngestionJob(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            status="queued",
+            params=params or {},
+            done=0,
+            rows=0,
+            errors=[],
+            cancel_requested=False,
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+    finally:
+        db.close()
+
+
+def cancel_job(job_id: str) -> models.IngestionJob | None:
+    db = SessionLocal()
+    try:
+        job = db.query(models.IngestionJob).get(job_id)
+        if job is None:
+            return None
+        if job.status == "queued":
+            job.status = "cancelled"
+            job.finished_at = datetime.now()
+        elif job.status == "running":
+            job.cancel_requested = True
+        job.updated_at = datetime.now()
+        db.commit()
+        db.refresh(job)
+        return job
+    finally:
+        db.close()
+
+
+def job_status(job: models.IngestionJob) -> dict:
+    """Trạng thái job kèm throughput và ETA"""
+    elapsed = None
+    symbols_per_sec = rows_per_sec = eta = None
+    if job.started_at:
+        end = job.finished_at or datetime.now()
+        elapsed = max((end - job.started_at).total_seconds(), 1e-9)
+        symbols_per_sec = round((job.done or 0) / elapsed, 3)
+        rows_per_sec = round((job.rows or 0) / elapsed, 1)
+        if job.status == "running" and job.total and symbols_per_sec:
+            eta = round(max(job.total - job.done, 0) / symbols_per_sec, 1)
+
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "params": job.params,
+        "progress": {
+            "total": job.total,
+            "done": job.done,
+            "current": job.current,
+            "percent": round(100.0 * job.done / job.total, 2) if job.total else None,
+        },
+        "throughput": {
+            "symbols_per_sec": symbols_per_sec,
+            "rows": job.rows,
+            "rows_per_sec": rows_per_sec,
+        },
+        "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+        "eta_seconds": eta,
+        "errors": job.errors or [],
+        "error": job.error,
+        "result": job.result,
+        "cancel_requested": job.cancel_requested,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobProgress:
+    """
+    Reporter tiến độ truyền vào hàm chạy job.
+    Gom cập nhật trong bộ nhớ, ghi xuống DB tối đa mỗi FLUSH_SECONDS.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.total = None
+        self.done = 0
+        self.rows = 0
+        self.current = None
+        self.errors = []
+        self._cancelled = False
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def start(self, total: int):
+        with self._lock:
+            self.total = total
+        self.flush(force=True)
+
+    def advance(self, symbols=1, rows=0, current=None, error=None):
+        with self._lock:
+            self.done += symbols
+            self.rows += rows
+            if current:
+                self.current = current
+            if error and len(self.errors) < MAX_ERRORS_KEPT:
+                self.errors.append(error)
+        self.flush()
+
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def flush(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_flush < FLUSH_SECONDS:
+                return
+            self._last_flush = now
+            values = {
+                "total": self.total,
+                "done": self.done,
+                "rows": self.rows,
+                "current": self.current,
+                "errors": list(self.errors),
+                "updated_at": datetime.now(),
+            }
+
+        db = SessionLocal()
+        try:
+            (db.query(models.IngestionJob)
+             .filter(models.IngestionJob.id == self.job_id, models.IngestionJob.status == "running")
+             .update(values))
+            db.commit()
+            status, flag = (db.query(models.IngestionJob.status, models.IngestionJob.cancel_requested)
+                            .filter(models.IngestionJob.id == self.job_id)
+                            .one())
+            # job không còn running (vd: bị đánh dấu failed) -> handler dừng như khi bị hủy
+            self._cancelled = bool(flag) or status != "running"
+        except Exception as e:
+            db.rollback()
+            logger.warning("Không ghi được tiến độ job %s: %s", self.job_id, e)
+        finally:
+            db.close()
+
+
+# ================== Worker ==================
+def claim_next_job():
+    """
+    Lấy job queued cũ nhất (FOR UPDATE SKIP LOCKED) và chuyển sang running.
+    Job độc quyền được bỏ qua khi đã có job cùng nhóm đang chạy.
+    """
+    db = SessionLocal()
+    try:
+        queued = (db.query(models.IngestionJob)
+                  .filter(models.IngestionJob.status == "queued")
+                  .order_by(models.IngestionJob.created_at.asc())
+                  .with_for_update(skip_locked=True)
+                  .limit(CLAIM_CANDIDATES)
+                  .all())
+        job = None
+        for candidate in queued:
+            group = EXCLUSIVE_GROUPS.get(candidate.kind)
+            if group:
+                _lock_group(db, group)  # cùng khóa với enqueue_job
+                if _active_job(db, group, statuses=("running",)):
+                    continue
+            job = candidate
+            break
+        if job is None:
+            db.commit()  # giữ các job stale đã đánh dấu failed
+            return None
+        now = datetime.now()
+        job.status = "running"
+        job.started_at = now
+        job.updated_at = now
+        db.commit()
+        return job.id, job.kind, dict(job.params or {})
+    finally:
+        db.close()
+
+
+def _finish_job(job_id, status, result=None, error=None, progress: JobProgress | None = None):
+    if progress is not None:
+        progress.flush(force=True)
+    db = SessionLocal()
+    try:
+        values = {"status": status, "finished_at": datetime.now(), "updated_at": datetime.now()}
+        if result is not None:
+            values["result"] = result
+        if error is not None:
+            values["error"] = error
+        updated = (db.query(models.IngestionJob)
+                   .filter(models.IngestionJob.id == job_id, models.IngestionJob.status.notin_(FINAL_STATUSES))
+                   .update(values, synchronize_session=False))
+        db.commit()
+        if not updated:
+            logger.warning("Job %s đã ở trạng thái cuối, bỏ qua kết quả %s", job_id, status)
+    finally:
+        db.close()
+
+
+def _heartbeat(progress: JobProgress, stop: threading.Event):
+    """Ghi updated_at (và đọc cờ hủy) định kỳ tới khi job xong, độc lập với tiến độ của handler"""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        progress.flush(force=True)
+
+
+def run_job(job_id: str, kind: str, params: dict):
+    handler = _handlers().get(kind)
+    if handler is None:
+        _finish_job(job_id, "failed", error=f"Không có handler cho job '{kind}'")
+        return
+
+    progress = JobProgress(job_id)
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(progress, stop), name=f"job-heartbeat-{job_id[:8]}",
+                     daemon=True).start()
+    logger.info("▶️ Bắt đầu job %s (%s)", job_id, kind)
+    try:
+        result = handler(progress=progress, **params)
+    except Exception as e:
+        logger.exception("❌ Job %s lỗi: %s", job_id, e)
+        _finish_job(job_id, "failed", error=traceback.format_exc(limit=5), progress=progress)
+        return
+    finally:
+        stop.set()
+
+    status = "cancelled" if progress.cancelled() else "succeeded"
+    if isinstance(result, dict) and "error" in result:
+        status = "failed"
+    _finish_job(job_id, status, result=result, progress=progress)
+    logger.info("✅ Job %s kết thúc: %s", job_id, status)
+
+
+def _worker_loop(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            claimed = claim_next_job()
+        except Exception as e:
+            logger.warning("Không claim được job: %s", e)
+            claimed = None
+        if claimed is None:
+            stop.wait(POLL_SECONDS)
+            continue
+        run_job(*claimed)
+
+
+def run_worker(workers: int = 2):
+    """Chạy pool worker trong process hiện tại cho tới khi bị dừng (Ctrl+C)"""
+    models.Base.metadata.create_all(bind=engine)
+    stop = threading.Event()
+    threads = [threading.Thread(target=_worker_loop, args=(stop,), name=f"job-worker-{i}", daemon=True)
+               for i in range(workers)]
+    for t in threads:
+        t.start()
+    logger.info("🚀 Job worker chạy với %d luồng", workers)
+    try:
+        while any(t.is_alive() for t in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Đang dừng job worker...")
+        stop.set()
+        for t in threads:
+            t.join()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Worker chạy các ingestion job")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    run_worker(args.workers)
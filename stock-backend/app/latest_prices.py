@@ -0,0 +1,120 @@
+"""
+Bảng latest_prices: phiên gần nhất của mỗi mã + giá đóng cửa phiên trước và % thay đổi.
+
+bulk_upsert_prices cập nhật bảng trong cùng transaction với dữ liệu giá, chỉ cho các mã có
+ngày vừa ghi >= prev_date hiện tại (ghi lại lịch sử cũ hơn không đổi 2 phiên cuối).
+Bảng trống (DB cũ) thì được dựng lại từ stock_prices lần đầu đọc, hoặc chạy tay:
+    python -m app.latest_prices
+
+/stocks/prices/latest đọc cả bảng 1 lần vào snapshot trong process (vài nghìn dòng),
+lọc theo mã / sàn trên bộ nhớ. Snapshot bị bỏ khi listener của price cache nhận NOTIFY
+price_writes, hoặc sau LATEST_PRICES_TTL giây nếu không có listener.
+
+Cấu hình:
+    LATEST_PRICES_TTL = số giây tối đa giữ snapshot (mặc định: 30)
+"""
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+LATEST_COLUMNS = ("symbol", "date", "open", "high", "low", "close", "volume", "value", "change",
+                  "prev_date", "prev_close", "change_pct")
+
+# {symbols}: subquery trả về cột symbol cần tính lại
+UPSERT_LATEST_SQL = """
+INSERT INTO latest_prices (symbol, date, open, high, low, close, volume, value, change,
+                           prev_date, prev_close, change_pct, updated_at)
+SELECT s.symbol, l.date, l.open, l.high, l.low, l.close, l.volume, l.value, l.change,
+       p.date, p.close,
+       CASE WHEN p.close > 0 THEN (l.close - p.close) / p.close * 100 END,
+       now()
+FROM ({symbols}) s
+CROSS JOIN LATERAL (
+    SELECT * FROM stock_prices sp WHERE sp.symbol = s.symbol ORDER BY sp.date DESC LIMIT 1
+) l
+LEFT JOIN LATERAL (
+    SELECT sp.date, sp.close FROM stock_prices sp
+    WHERE sp.symbol = s.symbol AND sp.date < l.date ORDER BY sp.date DESC LIMIT 1
+) p ON true
+ON CONFLICT (symbol) DO UPDATE SET
+    date = EXCLUDED.date, open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+    close = EXCLUDED.close, volume = EXCLUDED.volume, value = EXCLUDED.value, change = EXCLUDED.change,
+    prev_date = EXCLUDED.prev_date, prev_close = EXCLUDED.prev_close, change_pct = EXCLUDED.change_pct,
+    updated_at = EXCLUDED.updated_at
+"""
+
+# Các mã trong bảng stage có thể làm đổi 2 phiên cuối
+STAGED_SYMBOLS_SQL = (
+    "SELECT st.symbol FROM {source} st LEFT JOIN latest_prices lp ON lp.symbol = st.symbol "
+    "GROUP BY st.symbol, lp.prev_date HAVING max(st.date) >= coalesce(lp.prev_date, '-infinity'::date)"
+)
+
+
+def update_latest_prices(conn, source: str) -> int:
+    """Gọi trong transaction của writer, sau khi upsert từ bảng stage `source`"""
+    return conn.execute(text(UPSERT_LATEST_SQL.format(symbols=STAGED_SYMBOLS_SQL.format(source=source)))).rowcount
+
+
+def rebuild_latest_prices() -> int:
+    """Tính lại latest_prices cho mọi mã có trong stock_prices"""
+    db = SessionLocal()
+    try:
+        count = db.execute(text(UPSERT_LATEST_SQL.format(symbols="SELECT DISTINCT symbol FROM stock_prices"))).rowcount
+        db.commit()
+        logger.info("💹 latest_prices: %d mã", count)
+        return count
+    finally:
+        db.close()
+
+
+# ================== Snapshot trong process API ==================
+class LatestSnapshot:
+    def __init__(self, rows):
+        """rows: tuple theo LATEST_COLUMNS + exchange"""
+        self.records = []
+        self.by_symbol = {}
+        self.by_exchange = {}
+        for r in rows:
+            record = dict(zip(LATEST_COLUMNS, r))
+            self.records.append(record)
+            self.by_symbol[record["symbol"]] = record
+            self.by_exchange.setdefault(r[len(LATEST_COLUMNS)], []).append(record)
+        self.loaded_at = time.monotonic()
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def latest_snapshot() -> LatestSnapshot | None:
+    """Snapshot hiện tại, None nếu chưa có hoặc đã cũ"""
+    snapshot = _snapshot
+    if snapshot is None or time.monotonic() - snapshot.loaded_at > float(os.getenv("LATEST_PRICES_TTL", "30")):
+        return None
+    return snapshot
+
+
+def store_latest_snapshot(rows) -> LatestSnapshot:
+    global _snapshot
+    snapshot = LatestSnapshot(rows)
+    with _snapshot_lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def invalidate_latest_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    rebuild_latest_prices()
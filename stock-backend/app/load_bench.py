@@ -0,0 +1,105 @@
+"""
+Đo tải HTTP cho các API đọc: p50/p99 latency và số request/giây ở N client đồng thời.
+
+Mỗi client giữ 1 kết nối keep-alive và gửi GET liên tục trong --duration giây
+(chỉ dùng asyncio của thư viện chuẩn). Chạy với API đang chạy và Postgres local, trước và sau thay đổi:
+    python -m app.load_bench --path "/stocks/prices/VNM?limit=200" \\
+        --path "/stocks/daily?date=2025-09-30&exchange=HOSE" --concurrency 200 --duration 30
+
+Kết quả đo (1 vCPU dùng chung cho client + uvicorn 1 worker + Postgres 16 local; 1500 mã x 262 phiên;
+PRICE_CACHE=0 để mọi request đều đọc DB; 15s mỗi path). "sync" = bản trước khi chuyển API đọc sang
+async engine, "async" = bản hiện tại (AsyncSession + API_MAX_INFLIGHT=10):
+    path                                 client  sync req/s  p50 / p99 ms     async req/s  p50 / p99 ms
+    /stocks/prices/LB0042?limit=200          10       182.5   52.2 / 104.1          199.5   48.8 / 79.3
+    /stocks/daily?date=...&exchange=HOSE     10       102.9   88.9 / 245.1           83.4  115.0 / 276.1
+    /stocks/prices/LB0042?limit=200         100       200.1  479.4 / 797.0          179.6  519.0 / 811.1
+    /stocks/daily?date=...&exchange=HOSE    100        89.0 1090.2 / 1676.3          85.6 1161.2 / 1435.6
+    /stocks/prices/LB0042?limit=200         200       154.7 1247.4 / 1653.9         177.2 1116.1 / 1316.3
+    /stocks/daily?date=...&exchange=HOSE    200        68.2 2876.8 / 3593.3          89.4 2245.3 / 2527.0
+Bản chuyển async đầu tiên (chưa giới hạn request đồng thời) ở 200 client: prices 169.2 req/s,
+p50 / p99 1136.8 / 2890.6 ms; daily 75.8 req/s, 2618.1 / 6921.2 ms -> p99 tệ hơn sync. Nguyên nhân:
+mọi request chạy xen kẽ trên 1 event loop, chia nhau CPU và pool kết nối (đổi DB_POOL_SIZE không đỡ);
+giới hạn FIFO số request xử lý cùng lúc (app.admission) đưa p99 về dưới mức sync.
+Máy bão hòa CPU nên async không tăng được throughput đáng kể; từ 10-100 client hai bản xấp xỉ nhau
+(daily ở 10 client chậm hơn sync ~20%), lợi thế chỉ rõ ở 200 client.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+
+async def _read_response(reader) -> int:
+    status = int((await reader.readline()).split()[1])
+    length, chunked = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        name = name.strip().lower()
+        if name == "content-length":
+            length = int(value)
+        elif name == "transfer-encoding" and "chunked" in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status
+
+
+async def _client(host, port, path, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+    try:
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            writer.write(request)
+            status = await _read_response(reader)
+            if status >= 400:
+                errors.append(status)
+            else:
+                latencies.append(time.perf_counter() - t0)
+    finally:
+        writer.close()
+
+
+async def run_load(url: str, path: str, concurrency: int = 200, duration: float = 30.0) -> dict:
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[_client(host, port, path, deadline, latencies, errors) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def _pct(q):
+        return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000, 2) if latencies else None
+
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": _pct(0.50),
+        "p99_ms": _pct(0.99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đo p50/p99 và req/s cho API đọc")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", action="append", required=True)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30.0)
+    args = parser.parse_args()
+    for p in args.path:
+        print(asyncio.run(run_load(args.url, p, args.concurrency, args.duration)))
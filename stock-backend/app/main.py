@@ -1,23 +1,50 @@
 from fastapi import FastAPI
-from .routers import stocks, fastocks, financial_metrics, financial_ranking
+from .routers import stocks, fastocks, financial_metrics, financial_ranking, jobs, export
 from . import models, database
 from app.fa_full_load import get_all_tickers, full_load_financials
 from app.fa_delta_load import delta_load_financials
 from app.fa_shareholding import full_load_issue_shares
 from .routers.financial_metrics import batch_calculate_growth_to_db
+from .background_tasks import start_scheduler, shutdown_scheduler
+from .partitions import ensure_partitions
+from .price_cache import start_listener, stop_listener
+from .trading_calendar import get_calendar
+from .admission import AdmissionLimitMiddleware, max_inflight
+import os
 import sys
 from datetime import datetime
 
 # Tạo bảng (nếu chưa có)
 models.Base.metadata.create_all(bind=database.engine)
+# Partition cho stock_prices / intraday_prices (bảng cha tạo bởi alembic hoặc create_all)
+ensure_partitions()
 
 app = FastAPI()
+# Giới hạn request xử lý đồng thời trên event loop (API_MAX_INFLIGHT)
+app.add_middleware(AdmissionLimitMiddleware, limit=max_inflight())
 
 # Gắn router
 app.include_router(stocks.router)
 app.include_router(fastocks.router)
 app.include_router(financial_metrics.router)
 app.include_router(financial_ranking.router)
+app.include_router(jobs.router)
+app.include_router(export.router)
+
+# Scheduler cho job định kỳ (tắt bằng ENABLE_SCHEDULER=0)
+@app.on_event("startup")
+def on_startup():
+    start_listener()
+    # nạp lịch giao dịch trước (đọc DB đồng bộ) để endpoint async không bị chặn ở request đầu
+    get_calendar()
+    if os.getenv("ENABLE_SCHEDULER", "1") == "1":
+        start_scheduler()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    shutdown_scheduler()
+    stop_listener()
+    await database.dispose_async_engine()
 
 def main():
     print("=== Stock Data Loader ===")
@@ -0,0 +1,438 @@
+"""
+Lớp trừu tượng nguồn dữ liệu thị trường.
+
+- VnstockProvider: gọi vnstock thật (qua app.provider: rate limit, retry, breaker)
+- RecordingProvider: bọc 1 provider khác, ghi mọi response xuống đĩa
+- ReplayProvider: trả lại response đã ghi, hoặc sinh dữ liệu giả lập, kèm độ trễ cấu hình được
+
+Chọn backend bằng biến môi trường:
+    MARKET_DATA_PROVIDER = live | record | replay   (mặc định: live)
+    MARKET_DATA_DIR      = thư mục lưu/đọc response (mặc định: market_data_fixtures)
+    MARKET_DATA_LATENCY_MS = "min,max" độ trễ giả lập cho replay (mặc định: 0,0)
+    MARKET_DATA_SYNTHETIC  = 1 để sinh dữ liệu khi không có bản ghi (mặc định: 1)
+    MARKET_DATA_SYMBOLS    = số mã giả lập khi replay (mặc định: 1700)
+    MARKET_DATA_CACHE      = 1 để bật cache response trên đĩa cho live/record (mặc định: 1)
+    MARKET_DATA_CACHE_DIR  = thư mục cache (mặc định: market_data_cache)
+    MARKET_DATA_CACHE_MB   = dung lượng tối đa của cache (mặc định: 2048)
+"""
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import provider
+from .trading_calendar import SESSION_HOURS, market_now
+
+logger = logging.getLogger(__name__)
+
+REPORT_TYPES = ("income_statement", "balance_sheet", "cash_flow")
+
+# Bảng giá trả giá theo đồng, lịch sử giá (quote.history) theo nghìn đồng
+BOARD_PRICE_SCALE = 1000.0
+
+# Tên cột khả dĩ của bảng giá VCI sau khi flatten -> cột chuẩn
+BOARD_COLUMNS = {
+    "symbol": ["listing_symbol", "symbol"],
+    "open": ["match_open_price", "match_open", "open"],
+    "high": ["match_highest", "match_highest_price", "high"],
+    "low": ["match_lowest", "match_lowest_price", "low"],
+    "close": ["match_match_price", "match_price", "close"],
+    "volume": ["match_accumulated_volume", "match_total_volume", "volume"],
+}
+
+
+def normalize_price_board(df: pd.DataFrame, session_date, scale=BOARD_PRICE_SCALE) -> pd.DataFrame:
+    """Chuẩn hóa bảng giá về schema của quote.history (+ cột symbol) cho ngày session_date"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=["symbol", "time", "open", "high", "low", "close", "volume"])
+
+    if isinstance(df.columns, pd.MultiIndex):
+        df = df.copy()
+        df.columns = ["_".join(str(p) for p in c if p) for c in df.columns]
+
+    out = pd.DataFrame(index=df.index)
+    for col, candidates in BOARD_COLUMNS.items():
+        found = next((c for c in candidates if c in df.columns), None)
+        out[col] = df[found] if found else None
+
+    for col in ("open", "high", "low", "close"):
+        out[col] = pd.to_numeric(out[col], errors="coerce") / scale
+    out["volume"] = pd.to_numeric(out["volume"], errors="coerce")
+    out["time"] = pd.Timestamp(session_date)
+    return out[["symbol", "time", "open", "high", "low", "close", "volume"]]
+
+
+TICK_COLUMNS = ["symbol", "datetime", "price", "volume"]
+
+
+def normalize_ticks(df: pd.DataFrame, symbol: str) -> pd.DataFrame:
+    """Chuẩn hóa lệnh khớp (quote.intraday) về cột của bảng intraday_prices, giờ Việt Nam naive"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=TICK_COLUMNS)
+    ts = pd.to_datetime(df["time"])
+    if ts.dt.tz is not None:
+        ts = ts.dt.tz_convert("Asia/Ho_Chi_Minh").dt.tz_localize(None)
+    return pd.DataFrame({
+        "symbol": symbol,
+        "datetime": ts.dt.floor("s"),
+        "price": pd.to_numeric(df["price"], errors="coerce"),
+        "volume": pd.to_numeric(df["volume"], errors="coerce"),
+    })
+
+
+class MarketDataProvider(ABC):
+    """Interface chung cho mọi backend dữ liệu thị trường"""
+
+    name = "base"
+
+    @abstractmethod
+    def all_symbols(self, source="VCI", **kwargs) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def price_history(self, symbol: str, start: str, end: str, interval="1D", source="VCI") -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def financial_report(self, symbol: str, report_type: str, period="quarter", lang="vi", source="VCI") -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def company_overview(self, symbol: str, source="TCBS") -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def price_board(self, symbols: list, session_date, source="VCI") -> pd.DataFrame:
+        """OHLCV trong ngày của nhiều mã: cột symbol, time, open, high, low, close, volume"""
+
+    @abstractmethod
+    def intraday_ticks(self, symbol: str, session_date, source="VCI") -> pd.DataFrame:
+        """Lệnh khớp gần nhất trong phiên: cột symbol, datetime, price, volume"""
+
+
+class VnstockProvider(MarketDataProvider):
+    """Backend thật: vnstock qua app.provider"""
+
+    name = "live"
+
+    def all_symbols(self, source="VCI", **kwargs):
+        return provider.all_symbols(source=source, **kwargs)
+
+    def price_history(self, symbol, start, end, interval="1D", source="VCI"):
+        return provider.price_history(symbol, start=start, end=end, interval=interval, source=source)
+
+    def financial_report(self, symbol, report_type, period="quarter", lang="vi", source="VCI"):
+        client = provider.finance(symbol, source=source)
+        return provider.finance_report(client, report_type, source, period=period, lang=lang)
+
+    def company_overview(self, symbol, source="TCBS"):
+        return provider.company_overview(symbol, source=source)
+
+    def price_board(self, symbols, session_date, source="VCI"):
+        return normalize_price_board(provider.price_board(symbols, source=source), session_date)
+
+    def intraday_ticks(self, symbol, session_date, source="VCI"):
+        return normalize_ticks(provider.intraday(symbol, source=source), symbol)
+
+
+def fixture_key(method: str, **params) -> str:
+    """Tên file ổn định cho 1 lời gọi: <method>/<tham số dễ đọc>-<hash>"""
+    parts = [f"{k}={params[k]}" for k in sorted(params) if params[k] is not None]
+    readable = re.sub(r"[^A-Za-z0-9=._-]+", "_", "_".join(parts))[:80]
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:10]
+    return os.path.join(method, f"{readable}-{digest}.pkl.gz")
+
+
+class RecordingProvider(MarketDataProvider):
+    """Gọi provider bên trong và ghi response (DataFrame) xuống đĩa để replay sau"""
+
+    name = "record"
+
+    def __init__(self, inner: MarketDataProvider, directory: str):
+        self.inner = inner
+        self.directory = directory
+
+    def _record(self, method, params, df):
+        if not isinstance(df, pd.DataFrame):
+            return df
+        path = os.path.join(self.directory, fixture_key(method, **params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp, compression="gzip")
+        os.replace(tmp, path)
+        return df
+
+    def all_symbols(self, source="VCI", **kwargs):
+        return self._record("all_symbols", {"source": source},
+                            self.inner.all_symbols(source=source, **kwargs))
+
+    def price_history(self, symbol, start, end, interval="1D", source="VCI"):
+        params = {"symbol": symbol, "start": start, "end": end, "interval": interval, "source": source}
+        return self._record("price_history", params, self.inner.price_history(**params))
+
+    def financial_report(self, symbol, report_type, period="quarter", lang="vi", source="VCI"):
+        params = {"symbol": symbol, "report_type": report_type, "period": period, "lang": lang, "source": source}
+        return self._record("financial_report", params, self.inner.financial_report(**params))
+
+    def company_overview(self, symbol, source="TCBS"):
+        params = {"symbol": symbol, "source": source}
+        return self._record("company_overview", params, self.inner.company_overview(**params))
+
+    def price_board(self, symbols, session_date, source="VCI"):
+        params = {"symbols": ",".join(symbols), "session_date": session_date, "source": source}
+        return self._record("price_board", params, self.inner.price_board(symbols, session_date, source=source))
+
+    def intraday_ticks(self, symbol, session_date, source="VCI"):
+        params = {"symbol": symbol, "session_date": session_date, "source": source}
+        return self._record("intraday_ticks", params, self.inner.intraday_ticks(**params))
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Trả response đã ghi bởi RecordingProvider; nếu không có bản ghi và synthetic=True
+    thì sinh DataFrame giả lập (ổn định theo mã) với cùng schema như vnstock.
+    """
+
+    name = "replay"
+
+    def __init__(self, directory: str, latency_ms=(0.0, 0.0), synthetic=True, n_symbols=1700, seed=0):
+        self.directory = directory
+        self.latency_ms = latency_ms
+        self.synthetic = synthetic
+        self.n_symbols = n_symbols
+        self.seed = seed
+
+    def _sleep(self):
+        lo, hi = self.latency_ms
+        if hi > 0:
+            time.sleep(random.uniform(lo, hi) / 1000.0)
+
+    def _load(self, method, params):
+        self._sleep()
+        path = os.path.join(self.directory, fixture_key(method, **params))
+        if os.path.exists(path):
+            return pd.read_pickle(path, compression="gzip")
+        if not self.synthetic:
+            raise ValueError(f"Không có dữ liệu ghi sẵn cho {method} {params}")
+        return None
+
+    def _rng(self, *key):
+        return np.random.default_rng(zlib.crc32("|".join(map(str, (self.seed,) + key)).encode("utf-8")))
+
+    # ---------- dữ liệu giả lập ----------
+    def synthetic_symbols(self) -> list:
+        symbols = []
+        for i in range(self.n_symbols):
+            a, b = divmod(i, 26 * 26)
+            symbols.append(chr(65 + a % 26) + chr(65 + b // 26) + chr(65 + b % 26))
+        return symbols
+
+    def all_symbols(self, source="VCI", **kwargs):
+        df = self._load("all_symbols", {"source": source})
+        if df is not None:
+            return df
+        symbols = self.synthetic_symbols()
+        exchanges = ("HOSE", "HNX", "UPCOM")
+        return pd.DataFrame({
+            "symbol": symbols,
+            "organ_name": [f"Công ty giả lập {s}" for s in symbols],
+            "exchange": [exchanges[i % 3] for i in range(len(symbols))],
+        })
+
+    def price_history(self, symbol, start, end, interval="1D", source="VCI"):
+        params = {"symbol": symbol, "start": start, "end": end, "interval": interval, "source": source}
+        df = self._load("price_history", params)
+        if df is not None:
+            return df
+
+        days = pd.bdate_range(start=start, end=end)
+        if len(days) == 0:
+            raise ValueError(f"{symbol}: không có phiên giao dịch trong khoảng {start} - {end}")
+
+        # giá ổn định theo (symbol, ngày) để các lần gọi chồng lấn cho cùng kết quả
+        origin = pd.Timestamp("2008-01-01")
+        offsets = np.asarray((days - origin).days)
+        rng = self._rng(symbol)
+        base = 10 + rng.random() * 90
+        steps = np.sin(offsets / (20 + rng.random() * 40)) * 0.2 + offsets * 0.0002
+        close = np.round(base * np.exp(steps), 2)
+        noise = np.stack([(np.sin(offsets * (12.9898 + k) + base) * 43758.5453) % 1.0 for k in range(4)])
+        open_ = np.round(close * (1 + (noise[0] - 0.5) * 0.02), 2)
+        high = np.maximum(open_, close) * (1 + noise[1] * 0.01)
+        low = np.minimum(open_, close) * (1 - noise[2] * 0.01)
+        volume = (noise[3] * 2_000_000).astype(np.int64)
+        return pd.DataFrame({
+            "time": days,
+            "open": open_,
+            "high": np.round(high, 2),
+            "low": np.round(low, 2),
+            "close": close,
+            "volume": volume,
+        })
+
+    def financial_report(self, symbol, report_type, period="quarter", lang="vi", source="VCI"):
+        params = {"symbol": symbol, "report_type": report_type, "period": period, "lang": lang, "source": source}
+        df = self._load("financial_report", params)
+        if df is not None:
+            return df
+
+        rng = self._rng(symbol, report_type, period)
+        rows = []
+        for year in range(2014, datetime.now().year + 1):
+            for quarter in ((1, 2, 3, 4) if period == "quarter" else (0,)):
+                revenue = float(rng.uniform(1e11, 1e13))
+                profit = float(revenue * rng.uniform(-0.05, 0.25))
+                rows.append({
+                    "CP": symbol,
+                    "Năm": year,
+                    "Kỳ": quarter,
+                    "Doanh thu thuần": revenue,
+                    "Lợi nhuận thuần": profit,
+                    "Lợi nhuận sau thuế của Cổ đông công ty mẹ (đồng)": profit * 0.9,
+                })
+        return pd.DataFrame(rows)
+
+    def company_overview(self, symbol, source="TCBS"):
+        params = {"symbol": symbol, "source": source}
+        df = self._load("company_overview", params)
+        if df is not None:
+            return df
+        rng = self._rng(symbol, "overview")
+        return pd.DataFrame([{"symbol": symbol, "issue_share": round(float(rng.uniform(10, 5000)), 6)}])
+
+    def price_board(self, symbols, session_date, source="VCI"):
+        params = {"symbols": ",".join(symbols), "session_date": session_date, "source": source}
+        df = self._load("price_board", params)
+        if df is not None:
+            return df
+        day = pd.Timestamp(session_date).strftime("%Y-%m-%d")
+        frames = []
+        for symbol in symbols:
+            try:
+                bar = self.price_history(symbol, day, day)
+            except ValueError:
+                continue
+            frames.append(bar.assign(symbol=symbol))
+        if not frames:
+            return normalize_price_board(None, session_date)
+        return pd.concat(frames, ignore_index=True)[["symbol", "time", "open", "high", "low", "close", "volume"]]
+
+    def intraday_ticks(self, symbol, session_date, source="VCI", ticks_per_session=3000):
+        params = {"symbol": symbol, "session_date": session_date, "source": source}
+        df = self._load("intraday_ticks", params)
+        if df is not None:
+            return df
+
+        # Cả phiên được sinh cố định theo (mã, ngày); chỉ trả phần đã "xảy ra" tới giờ hiện tại
+        day = pd.Timestamp(session_date).normalize()
+        try:
+            ref = self.price_history(symbol, day.strftime("%Y-%m-%d"), day.strftime("%Y-%m-%d"))["open"].iloc[0]
+        except ValueError:
+            return normalize_ticks(None, symbol)
+        rng = self._rng(symbol, day.date(), "ticks")
+        offsets = []
+        for start, end in SESSION_HOURS:
+            lo = (day + pd.Timedelta(hours=start.hour, minutes=start.minute)).value // 10 ** 9
+            hi = (day + pd.Timedelta(hours=end.hour, minutes=end.minute)).value // 10 ** 9
+            offsets.append(rng.integers(lo, hi, ticks_per_session // len(SESSION_HOURS)))
+        seconds = np.sort(np.concatenate(offsets))
+        ts = pd.to_datetime(seconds, unit="s")
+        ts = ts[ts <= pd.Timestamp(market_now())]
+        walk = np.cumsum(rng.normal(0, 0.001, len(seconds)))[:len(ts)]
+        return pd.DataFrame({
+            "symbol": symbol,
+            "datetime": ts,
+            "price": np.round(ref * np.exp(walk), 2),
+            "volume": rng.integers(1, 50, len(seconds))[:len(ts)] * 100,
+        })
+
+
+class SyntheticTickGenerator:
+    """
+    Sinh luồng lệnh khớp giả lập cho cả thị trường (dùng cho benchmark ingester).
+    Mỗi batch là `seconds` giây thời gian mô phỏng với rate lệnh/giây, giá đi ngẫu nhiên theo mã;
+    một phần lệnh của batch trước được gửi lại (duplicate_ratio) như khi poll chồng lấn.
+    """
+
+    def __init__(self, symbols, rate=20_000, start=None, duplicate_ratio=0.1, seed=0):
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.rate = rate
+        self.clock = pd.Timestamp(start or pd.Timestamp.now().normalize() + pd.Timedelta(hours=9))
+        self.duplicate_ratio = duplicate_ratio
+        self.rng = np.random.default_rng(seed)
+        self.prices = np.round(10 + self.rng.random(len(self.symbols)) * 90, 2)
+        self._previous = None
+
+    def next_batch(self, seconds=0.1) -> pd.DataFrame:
+        n = max(1, int(self.rate * seconds))
+        which = self.rng.integers(0, len(self.symbols), n)
+        self.prices = np.maximum(0.1, self.prices * np.exp(self.rng.normal(0, 0.0005, len(self.symbols))))
+        offsets = np.sort(self.rng.random(n) * seconds * 1e9).astype("timedelta64[ns]")
+        df = pd.DataFrame({
+            "symbol": self.symbols[which],
+            "datetime": (self.clock.to_datetime64() + offsets).astype("datetime64[s]"),
+            "price": np.round(self.prices[which], 2),
+            "volume": self.rng.integers(1, 50, n) * 100,
+        })
+        self.clock += pd.Timedelta(seconds=seconds)
+
+        if self._previous is not None and self.duplicate_ratio > 0:
+            k = int(len(self._previous) * self.duplicate_ratio)
+            df = pd.concat([self._previous.tail(k), df], ignore_index=True)
+        self._previous = df
+        return df
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(kind: str | None = None) -> MarketDataProvider:
+    kind = (kind or os.getenv("MARKET_DATA_PROVIDER", "live")).lower()
+    directory = os.getenv("MARKET_DATA_DIR", "market_data_fixtures")
+
+    if kind in ("live", "record"):
+        inner = VnstockProvider() if kind == "live" else RecordingProvider(VnstockProvider(), directory)
+        if os.getenv("MARKET_DATA_CACHE", "1") != "1":
+            return inner
+        from .response_cache import CachingProvider, ResponseCache
+        cache = ResponseCache(
+            os.getenv("MARKET_DATA_CACHE_DIR", "market_data_cache"),
+            max_bytes=int(os.getenv("MARKET_DATA_CACHE_MB", "2048")) * 1024 * 1024,
+        )
+        return CachingProvider(inner, cache)
+    if kind == "replay":
+        lo, _, hi = os.getenv("MARKET_DATA_LATENCY_MS", "0,0").partition(",")
+        return ReplayProvider(
+            directory,
+            latency_ms=(float(lo or 0), float(hi or lo or 0)),
+            synthetic=os.getenv("MARKET_DATA_SYNTHETIC", "1") == "1",
+            n_symbols=int(os.getenv("MARKET_DATA_SYMBOLS", "1700")),
+        )
+    raise ValueError(f"MARKET_DATA_PROVIDER không hợp lệ: {kind}")
+
+
+def get_provider() -> MarketDataProvider:
+    """Provider dùng chung cho mọi loader (khởi tạo 1 lần theo biến môi trường)"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = build_provider()
+            logger.info("📡 Market data provider: %s", _provider.name)
+        return _provider
+
+
+def provider_stats() -> dict | None:
+    """Thống kê cache của provider hiện tại (None nếu không bật cache)"""
+    p = get_provider()
+    return p.stats() if hasattr(p, "stats") else None
+
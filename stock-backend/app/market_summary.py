@@ -0,0 +1,137 @@
+"""
+Tổng hợp thị trường cuối ngày theo sàn: daily_market_summary + daily_top_lists.
+
+Sau mỗi lần nạp giá (run_price_load, today_load) các ngày vừa ghi được tính lại, mỗi nhóm ngày 1 transaction:
+    daily_market_summary (date, exchange)           số mã, tăng / giảm / đứng giá so với close phiên trước,
+                                                    tổng khối lượng, tổng giá trị
+    daily_top_lists      (date, scope, list, rank)  top MARKET_TOP_N mã mỗi danh sách:
+        gainers / losers   theo % thay đổi so với close phiên trước
+        volume / value     cùng khóa sắp xếp với /stocks/daily?order_by=volume|value&order=desc
+exchange / scope = 'ALL' là toàn thị trường. Version market_summary/<ngày> tăng cùng transaction (ETag).
+
+/stocks/market-summary đọc thẳng 2 bảng. /stocks/daily lấy tổng số dòng từ summary và trang đầu
+của order_by=volume|value (desc) từ top list khi limit < MARKET_TOP_N.
+
+Cấu hình:
+    MARKET_TOP_N = số mã mỗi danh sách (mặc định: 100)
+
+Chạy tay: python -m app.market_summary [--date YYYY-MM-DD | --since YYYY-MM-DD]
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+
+from .database import engine
+from .dataset_versions import bump_versions
+from .trading_calendar import get_calendar
+
+logger = logging.getLogger(__name__)
+
+TOP_N = int(os.getenv("MARKET_TOP_N", "100"))
+DAYS_PER_TRANSACTION = 100
+
+# list -> (điều kiện, thứ tự xếp hạng)
+TOP_LISTS = {
+    "gainers": ("change_pct > 0", "change_pct DESC, symbol ASC"),
+    "losers": ("change_pct < 0", "change_pct ASC, symbol ASC"),
+    "volume": ("TRUE", "coalesce(CAST(volume AS FLOAT), '-Infinity') DESC, symbol DESC"),
+    "value": ("TRUE", "coalesce(CAST(value AS FLOAT), '-Infinity') DESC, symbol DESC"),
+}
+
+DAY_ROWS_SQL = """
+CREATE TEMP TABLE market_day_rows ON COMMIT DROP AS
+SELECT cur.date, cur.symbol, c.name AS company_name, c.exchange,
+       cur.open, cur.high, cur.low, cur.close, cur.volume, cur.value, cur.change,
+       prv.close AS prev_close,
+       CASE WHEN prv.close > 0 THEN (cur.close - prv.close) / prv.close * 100 END AS change_pct
+FROM unnest(CAST(:days AS date[]), CAST(:prevs AS date[])) AS d(day, prev)
+JOIN stock_prices cur ON cur.date = d.day
+JOIN companies c ON c.symbol = cur.symbol
+LEFT JOIN stock_prices prv ON prv.symbol = cur.symbol AND prv.date = d.prev
+"""
+
+SUMMARY_SQL = """
+INSERT INTO daily_market_summary (date, exchange, symbols, advancers, decliners, unchanged,
+                                  total_volume, total_value, updated_at)
+SELECT date, CASE WHEN GROUPING(exchange) = 1 THEN 'ALL' ELSE coalesce(exchange, '') END,
+       count(*),
+       count(*) FILTER (WHERE close > prev_close),
+       count(*) FILTER (WHERE close < prev_close),
+       count(*) FILTER (WHERE close = prev_close),
+       CAST(coalesce(sum(volume), 0) AS bigint),
+       CAST(coalesce(sum(value), 0) AS bigint),
+       now()
+FROM market_day_rows
+GROUP BY GROUPING SETS ((date, exchange), (date))
+"""
+
+TOP_LIST_SQL = """
+INSERT INTO daily_top_lists (date, scope, list, rank, symbol, company_name, exchange,
+                             open, high, low, close, volume, value, change, change_pct)
+SELECT date, scope, '{name}', rank, symbol, company_name, exchange,
+       open, high, low, close, volume, value, change, change_pct
+FROM (
+    SELECT r.*, row_number() OVER (PARTITION BY date, scope ORDER BY {order}) AS rank
+    FROM (
+        SELECT m.*, m.exchange AS scope FROM market_day_rows m WHERE m.exchange IS NOT NULL
+        UNION ALL
+        SELECT m.*, 'ALL' AS scope FROM market_day_rows m
+    ) r
+    WHERE {where}
+) ranked
+WHERE rank <= :top_n
+"""
+
+
+def _as_dates(days) -> list:
+    return sorted({d for d in pd.to_datetime(pd.Series(list(days))).dt.date if pd.notna(d)})
+
+
+def materialize_days(days) -> dict:
+    """Tính lại summary + top list cho các ngày (xóa bản cũ rồi ghi lại trong 1 transaction mỗi nhóm ngày)"""
+    days = _as_dates(days)
+    if not days:
+        return {"days": 0}
+    t0 = time.monotonic()
+    calendar = get_calendar()
+    rows = 0
+    for i in range(0, len(days), DAYS_PER_TRANSACTION):
+        chunk = days[i:i + DAYS_PER_TRANSACTION]
+        params = {"days": chunk, "prevs": [calendar.previous(d) for d in chunk]}
+        with engine.begin() as conn:
+            # loader và /stocks/market-summary có thể cùng tính 1 ngày -> tuần tự hóa
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('market_summary'))"))
+            conn.execute(text("DELETE FROM daily_market_summary WHERE date = ANY(:days)"), {"days": chunk})
+            conn.execute(text("DELETE FROM daily_top_lists WHERE date = ANY(:days)"), {"days": chunk})
+            conn.execute(text(DAY_ROWS_SQL), params)
+            conn.execute(text(SUMMARY_SQL))
+            for name, (where, order) in TOP_LISTS.items():
+                rows += conn.execute(text(TOP_LIST_SQL.format(name=name, where=where, order=order)),
+                                     {"top_n": TOP_N}).rowcount
+            bump_versions(conn, "market_summary", [d.isoformat() for d in chunk])
+    seconds = round(time.monotonic() - t0, 2)
+    logger.info("📊 Market summary: %d ngày (%s..%s), %d dòng top list, %.2fs", len(days), days[0], days[-1], rows, seconds)
+    return {"days": len(days), "from": days[0].isoformat(), "to": days[-1].isoformat(), "seconds": seconds}
+
+
+def materialize_since(since: date) -> dict:
+    calendar = get_calendar()
+    return materialize_days(calendar.between(since, calendar.last_session()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Tính daily_market_summary + daily_top_lists")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--date", type=date.fromisoformat, help="1 ngày (YYYY-MM-DD)")
+    group.add_argument("--since", type=date.fromisoformat, help="mọi phiên từ ngày này (YYYY-MM-DD)")
+    args = parser.parse_args()
+    if args.date:
+        print(materialize_days([args.date]))
+    else:
+        print(materialize_since(args.since or get_calendar().last_session()))
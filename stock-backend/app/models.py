@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Date, Float, BigInteger, Integer, TIMESTAMP, Numeric, UniqueConstraint, JSON, DateTime, func
+from sqlalchemy import Column, String, Date, Float, BigInteger, Integer, TIMESTAMP, Numeric, UniqueConstraint, JSON, DateTime, Boolean, func
 from .database import Base
 from datetime import datetime
 
@@ -16,6 +16,8 @@ class Company(Base):
 # Giá cổ phiếu (OHLCV)
 class StockPrice(Base):
     __tablename__ = "stock_prices"
+    # partition theo năm, xem app/partitions.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (date)"}
 
     symbol = Column(String, primary_key=True)
     date = Column(Date, primary_key=True)
@@ -48,6 +50,8 @@ class Index(Base):
 # Intraday
 class IntradayPrice(Base):
     __tablename__ = "intraday_prices"
+    # partition theo ngày, xem app/partitions.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (datetime)"}
 
     symbol = Column(String, primary_key=True)
     datetime = Column(TIMESTAMP, primary_key=True)
@@ -127,3 +131,134 @@ class FinancialGrowthReport(Base):
 
     def __repr__(self):
         return f"<FinancialGrowthReport(ticker={self.ticker}, year={self.year}, quarter={self.quarter})>"
+
+# Job nạp dữ liệu chạy nền (full_load, delta_load, today_load, ...)
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True)
+    kind = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    params = Column(JSON, nullable=True)
+    total = Column(Integer, nullable=True)
+    done = Column(Integer, default=0)
+    rows = Column(BigInteger, default=0)
+    current = Column(String, nullable=True)
+    errors = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    result = Column(JSON, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now)
+
+# Lịch sử chạy của scheduler (thời gian, số lượng, lỗi)
+class SchedulerRun(Base):
+    __tablename__ = "scheduler_runs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job = Column(String, nullable=False, index=True)
+    scheduled_for = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=False, default=datetime.now)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    status = Column(String, nullable=False, default="running")  # running, succeeded, failed, skipped
+    items = Column(Integer, default=0)
+    rows = Column(BigInteger, default=0)
+    errors = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    details = Column(JSON, nullable=True)
+    job_id = Column(String, nullable=True)      # ingestion_jobs.id khi lượt chạy chỉ enqueue job
+    owner = Column(String, nullable=True)       # host:pid của process chạy
+    heartbeat_at = Column(DateTime, nullable=True)  # làm mới định kỳ trong lúc running
+
+# Lịch giao dịch: các ngày có phiên (dựng từ stock_prices)
+class TradingDay(Base):
+    __tablename__ = "trading_days"
+
+    date = Column(Date, primary_key=True)
+
+# Mã đã hỏi provider tới checked_through mà không có dữ liệu (trái phiếu, chứng quyền, mã hủy niêm yết...)
+class PriceNoData(Base):
+    __tablename__ = "price_no_data"
+
+    symbol = Column(String, primary_key=True)
+    checked_through = Column(Date, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# Nến intraday (1m/5m/15m) tổng hợp dần từ intraday_prices
+class IntradayBar(Base):
+    __tablename__ = "intraday_bars"
+
+    symbol = Column(String, primary_key=True)
+    interval = Column(String, primary_key=True)   # 1m, 5m, 15m
+    start = Column(TIMESTAMP, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(BigInteger)
+    ticks = Column(Integer)
+    closed = Column(Boolean, default=False)
+
+# Giá mới nhất của mỗi mã (cập nhật cùng transaction với bulk upsert, xem app/latest_prices.py)
+class LatestPrice(Base):
+    __tablename__ = "latest_prices"
+
+    symbol = Column(String, primary_key=True)
+    date = Column(Date, nullable=False)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(BigInteger)
+    value = Column(BigInteger, nullable=True)
+    change = Column(Float, nullable=True)
+    prev_date = Column(Date, nullable=True)
+    prev_close = Column(Float, nullable=True)
+    change_pct = Column(Float, nullable=True)    # (close - prev_close) / prev_close * 100
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+# Tổng hợp thị trường theo ngày & sàn (tính sau mỗi lần nạp giá, xem app/market_summary.py)
+class DailyMarketSummary(Base):
+    __tablename__ = "daily_market_summary"
+
+    date = Column(Date, primary_key=True)
+    exchange = Column(String, primary_key=True)   # HOSE, HNX, UPCOM, ALL
+    symbols = Column(Integer)
+    advancers = Column(Integer)                   # close > close phiên trước
+    decliners = Column(Integer)
+    unchanged = Column(Integer)
+    total_volume = Column(BigInteger)
+    total_value = Column(BigInteger)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+# Top N theo ngày & sàn: gainers, losers, volume, value
+class DailyTopList(Base):
+    __tablename__ = "daily_top_lists"
+
+    date = Column(Date, primary_key=True)
+    scope = Column(String, primary_key=True)      # HOSE, HNX, UPCOM, ALL
+    list = Column(String, primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    company_name = Column(String)
+    exchange = Column(String)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(BigInteger)
+    value = Column(BigInteger, nullable=True)
+    change = Column(Float, nullable=True)
+    change_pct = Column(Float, nullable=True)
+
+# Phiên bản dữ liệu (watermark) cho ETag: loader tăng version trong transaction ghi
+class DatasetVersion(Base):
+    __tablename__ = "dataset_versions"
+
+    dataset = Column(String, primary_key=True)   # prices, daily, ranking, companies, latest, market_summary
+    key = Column(String, primary_key=True)       # symbol / YYYY-MM-DD / YYYYQn / all
+    version = Column(BigInteger, nullable=False, default=1)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
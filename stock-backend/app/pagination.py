@@ -0,0 +1,79 @@
+"""
+Phân trang keyset (cursor) và đếm tổng tùy chọn cho các API danh sách.
+
+Cursor là JSON của khóa sắp xếp của dòng cuối trang, mã hóa base64url (client coi như chuỗi mờ).
+Tổng số dòng chỉ tính khi client yêu cầu:
+    total=exact     COUNT(*) thật, cache COUNT_TTL giây theo bộ lọc
+    total=estimate  số dòng ước lượng từ planner (EXPLAIN), không quét bảng
+Đếm chạy trên AsyncSession với câu select() (total_for_async).
+"""
+import base64
+import json
+import threading
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+COUNT_TTL = 60.0
+
+
+class CursorError(ValueError):
+    """Cursor không hợp lệ hoặc không khớp với truy vấn hiện tại"""
+
+
+def encode_cursor(**key) -> str:
+    raw = json.dumps(key, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CursorError("cursor không hợp lệ") from e
+    if not isinstance(key, dict) or key.get("k") != kind:
+        raise CursorError("cursor không dùng cho truy vấn này")
+    return key
+
+
+_counts = {}
+_counts_lock = threading.Lock()
+
+
+def _cached(key: tuple):
+    with _counts_lock:
+        hit = _counts.get(key)
+        if hit and hit[1] > time.monotonic():
+            return hit[0]
+    return None
+
+
+def _store(key: tuple, value: int, ttl: float):
+    with _counts_lock:
+        if len(_counts) > 10_000:
+            _counts.clear()
+        _counts[key] = (value, time.monotonic() + ttl)
+
+
+def _plan_rows(plan) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def total_for_async(mode: str | None, db, stmt, key: tuple):
+    """Tổng số dòng của câu select() theo mode (exact / estimate / None) trên AsyncSession"""
+    if mode == "exact":
+        value = _cached(key)
+        if value is None:
+            value = await db.scalar(select(func.count()).select_from(stmt.order_by(None).subquery()))
+            _store(key, value, COUNT_TTL)
+        return value
+    if mode == "estimate":
+        # giá trị bind được nhúng thẳng (chỉ là chuỗi/ngày/số của bộ lọc) để không phụ thuộc paramstyle của driver
+        sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        conn = await db.connection()
+        return _plan_rows((await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql)).scalar())
+    return None
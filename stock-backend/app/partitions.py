@@ -0,0 +1,234 @@
+"""
+Quản lý partition theo thời gian (PostgreSQL declarative partitioning).
+
+- stock_prices: RANGE (date), mỗi năm 1 partition: stock_prices_y2024
+- intraday_prices: RANGE (datetime), mỗi ngày 1 partition: intraday_prices_d20261016
+
+Bảng cha được tạo bởi migration Alembic (alembic upgrade head) hoặc create_all.
+Module này tạo trước partition cho các kỳ sắp tới và detach/drop partition intraday quá hạn.
+
+Cấu hình:
+    PARTITION_YEARS_AHEAD      = số năm tạo trước cho stock_prices (mặc định: 1)
+    PARTITION_DAYS_AHEAD       = số ngày tạo trước cho intraday_prices (mặc định: 7)
+    INTRADAY_RETENTION_DAYS    = giữ intraday bao nhiêu ngày (mặc định: 90)
+    INTRADAY_RETENTION_MODE    = detach | drop (mặc định: detach)
+
+Chạy:      python -m app.partitions [--retention]
+Benchmark: python -m app.partitions --bench [--years 20] [--symbols 1700]
+
+Kết quả đo (Postgres 16 local, 20 năm x 1700 mã = 8.87 triệu dòng, ms mỗi query, heap / partition):
+    symbol_1y          1.16 / 1.14     (1 mã, 1 năm: cả 2 dùng khóa chính (symbol, date), như nhau)
+    symbol_1m          0.24 / 0.28
+    one_day          809.91 / 40.05    (lọc theo ngày: chỉ quét 1 partition năm thay vì cả bảng, ~20x)
+    latest_day_count 695.01 / 80.87    (~8.6x)
+Lợi ích chỉ đến từ pruning cho query lọc theo ngày (/daily, gap scanner, market summary);
+bảng heap không có index riêng trên date nên phải quét toàn bộ.
+"""
+import argparse
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+FIRST_YEAR = 2008
+
+YEARS_AHEAD = int(os.getenv("PARTITION_YEARS_AHEAD", "1"))
+DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+RETENTION_DAYS = int(os.getenv("INTRADAY_RETENTION_DAYS", "90"))
+RETENTION_MODE = os.getenv("INTRADAY_RETENTION_MODE", "detach")
+
+# bảng -> (cột phân vùng, độ dài 1 partition)
+PARTITIONED_TABLES = {
+    "stock_prices": ("date", "year"),
+    "intraday_prices": ("datetime", "day"),
+}
+
+
+def partition_bounds(granularity: str, d: date):
+    if granularity == "year":
+        return date(d.year, 1, 1), date(d.year + 1, 1, 1)
+    return d, d + timedelta(days=1)
+
+
+def partition_name(table: str, granularity: str, d: date) -> str:
+    return f"{table}_y{d.year}" if granularity == "year" else f"{table}_d{d:%Y%m%d}"
+
+
+def partition_start(table: str, name: str) -> date | None:
+    """Ngày bắt đầu của partition suy ra từ tên (None nếu không đúng quy ước)"""
+    m = re.fullmatch(rf"{table}_(?:y(\d{{4}})|d(\d{{8}}))", name)
+    if not m:
+        return None
+    if m.group(1):
+        return date(int(m.group(1)), 1, 1)
+    return datetime.strptime(m.group(2), "%Y%m%d").date()
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return bool(conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :t AND pg_table_is_visible(c.oid)"
+    ), {"t": table}).scalar())
+
+
+def list_partitions(conn, table: str) -> list:
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t ORDER BY c.relname"
+    ), {"t": table}).all()
+    return [r[0] for r in rows]
+
+
+def create_partition(conn, table: str, d: date) -> str:
+    _, granularity = PARTITIONED_TABLES[table]
+    start, end = partition_bounds(granularity, d)
+    name = partition_name(table, granularity, start)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    return name
+
+
+def ensure_partitions(today: date | None = None, first_year: int = FIRST_YEAR,
+                      years_ahead: int = YEARS_AHEAD, days_ahead: int = DAYS_AHEAD) -> dict:
+    """Tạo (nếu chưa có) partition năm cho stock_prices và partition ngày sắp tới cho intraday_prices"""
+    today = today or date.today()
+    created = {}
+    with engine.begin() as conn:
+        for table, (_, granularity) in PARTITIONED_TABLES.items():
+            if not is_partitioned(conn, table):
+                logger.warning("Bảng %s chưa được partition (chạy alembic upgrade head)", table)
+                continue
+            existing = set(list_partitions(conn, table))
+            if granularity == "year":
+                starts = [date(y, 1, 1) for y in range(first_year, today.year + years_ahead + 1)]
+            else:
+                starts = [today + timedelta(days=i) for i in range(days_ahead + 1)]
+            names = [create_partition(conn, table, d) for d in starts
+                     if partition_name(table, granularity, d) not in existing]
+            created[table] = names
+            if names:
+                logger.info("🧱 %s: tạo %d partition (%s .. %s)", table, len(names), names[0], names[-1])
+    return created
+
+
+def apply_retention(today: date | None = None, keep_days: int = RETENTION_DAYS, mode: str = RETENTION_MODE) -> list:
+    """Detach (giữ lại bảng để lưu trữ) hoặc drop các partition intraday cũ hơn keep_days"""
+    if mode not in ("detach", "drop"):
+        raise ValueError(f"INTRADAY_RETENTION_MODE không hợp lệ: {mode}")
+    cutoff = (today or date.today()) - timedelta(days=keep_days)
+    removed = []
+    with engine.begin() as conn:
+        for name in list_partitions(conn, "intraday_prices"):
+            start = partition_start("intraday_prices", name)
+            if start is None or start >= cutoff:
+                continue
+            conn.execute(text(f"ALTER TABLE intraday_prices DETACH PARTITION {name}"))
+            if mode == "drop":
+                conn.execute(text(f"DROP TABLE {name}"))
+            removed.append(name)
+    if removed:
+        logger.info("🗑️ intraday_prices: %s %d partition cũ hơn %s", mode, len(removed), cutoff)
+    return removed
+
+
+def maintain_partitions() -> dict:
+    """Job định kỳ: tạo partition sắp tới + áp dụng retention cho intraday"""
+    created = ensure_partitions()
+    removed = apply_retention()
+    return {"items": sum(len(v) for v in created.values()) + len(removed),
+            "details": {"created": created, "removed": removed}}
+
+
+# ================== Benchmark heap vs partitioned ==================
+BENCH_SCHEMA = "bench_partitions"
+
+BENCH_QUERIES = {
+    "symbol_1y": "SELECT * FROM {t} WHERE symbol = 'S0042' AND date >= '{y}-01-01' AND date <= '{y}-12-31' ORDER BY date",
+    "symbol_1m": "SELECT * FROM {t} WHERE symbol = 'S0042' AND date >= '{y}-06-01' AND date <= '{y}-06-30' ORDER BY date",
+    "one_day": "SELECT * FROM {t} WHERE date = '{y}-06-14' ORDER BY symbol",
+    "latest_day_count": "SELECT count(*) FROM {t} WHERE date >= '{y}-12-01'",
+}
+
+
+def run_benchmark(years=20, n_symbols=1700, repeat=5) -> dict:
+    """
+    Dựng 2 bảng giống stock_prices (heap và partition theo năm) trong schema riêng với dữ liệu
+    giả lập `years` năm x `n_symbols` mã, đo thời gian các query lọc theo ngày rồi xóa schema.
+    """
+    end_year = date.today().year - 1
+    start_year = end_year - years + 1
+    columns = ("symbol varchar, date date, open float, high float, low float, close float, "
+               "volume bigint, value bigint, change float, PRIMARY KEY (symbol, date)")
+    fill = (
+        "INSERT INTO {t} SELECT 'S' || lpad(s::text, 4, '0'), d::date, 10, 11, 9, 10 + random(), "
+        "(random() * 1e6)::bigint, NULL, 0 "
+        f"FROM generate_series(1, {n_symbols}) s, "
+        f"generate_series('{start_year}-01-01'::date, '{end_year}-12-31'::date, '1 day') d "
+        "WHERE EXTRACT(ISODOW FROM d) < 6"
+    )
+    heap, part = f"{BENCH_SCHEMA}.heap", f"{BENCH_SCHEMA}.part"
+    result = {"years": years, "symbols": n_symbols}
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+        conn.execute(text(f"CREATE TABLE {heap} ({columns})"))
+        conn.execute(text(f"CREATE TABLE {part} ({columns}) PARTITION BY RANGE (date)"))
+        for y in range(start_year, end_year + 1):
+            conn.execute(text(f"CREATE TABLE {BENCH_SCHEMA}.part_y{y} PARTITION OF {part} "
+                              f"FOR VALUES FROM ('{y}-01-01') TO ('{y + 1}-01-01')"))
+        for t in (heap, part):
+            t0 = time.monotonic()
+            conn.execute(text(fill.format(t=t)))
+            result[f"load_seconds_{t.split('.')[1]}"] = round(time.monotonic() - t0, 2)
+        result["rows"] = conn.execute(text(f"SELECT count(*) FROM {heap}")).scalar()
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"ANALYZE {heap}"))
+            conn.execute(text(f"ANALYZE {part}"))
+            for name, sql in BENCH_QUERIES.items():
+                timings = {}
+                for t in (heap, part):
+                    q = text(sql.format(t=t, y=end_year - 1))
+                    conn.execute(q).all()  # làm nóng cache
+                    t0 = time.monotonic()
+                    for _ in range(repeat):
+                        conn.execute(q).all()
+                    timings[t.split(".")[1]] = round((time.monotonic() - t0) / repeat * 1000, 2)
+                result[name] = timings  # ms mỗi query
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản lý partition stock_prices / intraday_prices")
+    parser.add_argument("--retention", action="store_true", help="Detach/drop partition intraday quá hạn")
+    parser.add_argument("--bench", action="store_true", help="Benchmark heap vs partition trên dữ liệu giả lập")
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--symbols", type=int, default=1700)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.bench:
+        print(run_benchmark(args.years, args.symbols))
+        return
+    print(ensure_partitions())
+    if args.retention:
+        print(apply_retention())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Cache lịch sử giá theo mã trong process API.
+
+Mỗi mã được giữ dưới dạng NumPy structured array (date, open, high, low, close, volume, value, change)
+sắp theo ngày; /stocks/prices/{symbol} và /latest cắt khoảng ngày + phân trang trên mảng thay vì
+truy vấn Postgres. Tổng dung lượng giới hạn bởi PRICE_CACHE_MB, vượt thì bỏ mã ít dùng nhất (LRU).
+
+Làm mới khi có dữ liệu mới: bulk writer gửi NOTIFY price_writes {symbol: ngày nhỏ nhất vừa ghi}
+trong cùng transaction (chỉ tới nơi khi commit). Listener trong process API đánh dấu các mã đang cache;
+lần đọc sau chỉ tải lại phần từ ngày đó và nối vào mảng. NOTIFY tới lúc mã đang được tải (generation
+của mã đổi) thì entry vừa tải vẫn bị đánh dấu cũ từ ngày đó. Nếu listener không chạy thì mỗi mã
+vẫn tự làm mới phần cuối sau PRICE_CACHE_TTL giây.
+
+Mỗi entry nhớ version prices/<symbol> (dataset_versions) đọc ngay trước khi tải dữ liệu. Endpoint có ETag
+truyền version vừa đọc từ DB vào get(); entry cũ hơn version đó (NOTIFY chưa tới) bị tải lại cả mã,
+để không trả dữ liệu cũ dưới ETag mới.
+
+Cấu hình:
+    PRICE_CACHE      = 0 để tắt (mặc định: 1)
+    PRICE_CACHE_MB   = dung lượng tối đa (mặc định: 128)
+    PRICE_CACHE_TTL  = số giây tối đa giữa 2 lần làm mới khi không có listener (mặc định: 300)
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from sqlalchemy import text
+
+from .database import engine
+from .latest_prices import invalidate_latest_snapshot
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "price_writes"
+NOTIFY_PAYLOAD_BYTES = 7000  # giới hạn payload của NOTIFY là 8000 byte
+
+PRICE_DTYPE = np.dtype([
+    ("date", "datetime64[D]"),
+    ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"),
+    ("volume", "f8"), ("value", "f8"), ("change", "f8"),
+])
+VALUE_FIELDS = PRICE_DTYPE.names[1:]
+
+
+def cache_enabled() -> bool:
+    return os.getenv("PRICE_CACHE", "1") == "1"
+
+
+def _load_version(symbol: str) -> int:
+    """Version prices/<symbol> hiện tại (0 nếu mã chưa từng được ghi)"""
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT version FROM dataset_versions WHERE dataset = 'prices' AND key = :s"
+        ), {"s": symbol}).scalar() or 0
+
+
+def _load_rows(symbol: str, since: date | None = None) -> np.ndarray:
+    sql = f"SELECT date, {', '.join(VALUE_FIELDS)} FROM stock_prices WHERE symbol = :s"
+    params = {"s": symbol}
+    if since is not None:
+        sql += " AND date >= :since"
+        params["since"] = since
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql + " ORDER BY date"), params).all()
+
+    arr = np.empty(len(rows), dtype=PRICE_DTYPE)
+    if rows:
+        df = pd.DataFrame(rows, columns=PRICE_DTYPE.names)
+        arr["date"] = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]")
+        for field in VALUE_FIELDS:
+            arr[field] = pd.to_numeric(df[field], errors="coerce").to_numpy(dtype="f8")
+    return arr
+
+
+class _Entry:
+    __slots__ = ("rows", "version", "stale_from", "loaded_at")
+
+    def __init__(self, rows, version):
+        self.rows = rows
+        self.version = version
+        self.stale_from = None
+        self.loaded_at = time.monotonic()
+
+
+class SymbolPriceCache:
+    def __init__(self, max_bytes: int, ttl: float = 300.0, loader=_load_rows, version_fn=_load_version):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.loader = loader
+        self.version_fn = version_fn
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # symbol -> _Entry; thứ tự = LRU
+        # symbol -> (generation, ngày nhỏ nhất bị đánh dấu kể từ lần _put khớp generation gần nhất)
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str, min_version: int | None = None) -> np.ndarray:
+        """
+        Toàn bộ lịch sử giá của mã (mảng chỉ đọc, sắp theo ngày).
+        min_version: version prices/<symbol> đã đọc từ DB; entry cũ hơn thì tải lại cả mã.
+        """
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                self._entries.move_to_end(symbol)
+                if min_version is not None and entry.version < min_version:
+                    entry = None  # có lần ghi mà NOTIFY chưa tới, không biết từ ngày nào
+                elif entry.stale_from is None and time.monotonic() - entry.loaded_at > self.ttl and entry.rows.size:
+                    entry.stale_from = entry.rows["date"][-1].astype(date)
+            if entry is not None:
+                stale_from = entry.stale_from
+                if stale_from is None:
+                    self.hits += 1
+                    return entry.rows
+                self.refreshes += 1
+            else:
+                self.misses += 1
+            generation = self._marks.get(symbol, (0, None))[0]
+
+        # version đọc trước dữ liệu: dữ liệu tải về luôn mới bằng hoặc hơn version ghi vào entry
+        version = self.version_fn(symbol)
+        if entry is None:
+            rows = self.loader(symbol)
+        else:
+            # chỉ tải phần từ ngày có thay đổi rồi nối vào phần cũ
+            fresh = self.loader(symbol, stale_from)
+            keep = entry.rows[entry.rows["date"] < np.datetime64(stale_from, "D")]
+            rows = np.concatenate([keep, fresh])
+        rows.flags.writeable = False
+        self._put(symbol, rows, version, generation)
+        return rows
+
+    def _put(self, symbol: str, rows: np.ndarray, version: int, generation: int = 0):
+        with self._lock:
+            old = self._entries.pop(symbol, None)
+            if old is not None:
+                self.bytes -= old.rows.nbytes
+            entry = _Entry(rows, version)
+            current, since = self._marks.get(symbol, (0, None))
+            if current != generation:
+                # có NOTIFY tới trong lúc đang tải -> dữ liệu vừa tải có thể đã cũ, lần đọc sau làm mới tiếp
+                entry.stale_from = since
+            elif since is not None:
+                self._marks[symbol] = (current, None)
+            self._entries[symbol] = entry
+            self.bytes += rows.nbytes
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.rows.nbytes
+                self.evictions += 1
+
+    def mark_stale(self, changes: dict):
+        """changes: {symbol: ngày nhỏ nhất vừa được ghi}; tăng generation để lần tải đang chạy biết mình đã cũ"""
+        with self._lock:
+            for symbol, since in changes.items():
+                since = date.fromisoformat(since) if isinstance(since, str) else since
+                generation, marked = self._marks.get(symbol, (0, None))
+                self._marks[symbol] = (generation + 1, since if marked is None else min(marked, since))
+                entry = self._entries.get(symbol)
+                if entry is not None:
+                    entry.stale_from = since if entry.stale_from is None else min(entry.stale_from, since)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "symbols": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def slice_range(rows: np.ndarray, start: date | None = None, end: date | None = None) -> np.ndarray:
+    """Cắt [start, end] bằng searchsorted trên cột date (view, không copy)"""
+    lo = np.searchsorted(rows["date"], np.datetime64(start, "D")) if start else 0
+    hi = np.searchsorted(rows["date"], np.datetime64(end, "D"), side="right") if end else rows.size
+    return rows[lo:hi]
+
+
+def to_records(symbol: str, rows: np.ndarray) -> list:
+    """Mảng giá -> list dict cùng field với models.StockPrice (NaN -> None)"""
+    out = []
+    for r in rows.tolist():
+        item = {"symbol": symbol, "date": r[0]}
+        for field, v in zip(VALUE_FIELDS, r[1:]):
+            if v != v:
+                v = None
+            elif field in ("volume", "value"):
+                v = int(v)
+            item[field] = v
+        out.append(item)
+    return out
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_price_cache() -> SymbolPriceCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SymbolPriceCache(
+                max_bytes=int(os.getenv("PRICE_CACHE_MB", "128")) * 1024 * 1024,
+                ttl=float(os.getenv("PRICE_CACHE_TTL", "300")),
+            )
+        return _cache
+
+
+# ================== Thông báo ghi giá (writer -> các process API) ==================
+def notify_price_writes(conn, df: pd.DataFrame):
+    """Gửi NOTIFY {symbol: ngày nhỏ nhất} trong transaction của writer, chia nhỏ theo giới hạn payload"""
+    changes = df.groupby("symbol")["date"].min()
+    payload = {}
+    size = 2
+    for symbol, since in changes.items():
+        item = len(symbol) + 18
+        if payload and size + item > NOTIFY_PAYLOAD_BYTES:
+            conn.execute(text("SELECT pg_notify(:c, :p)"), {"c": CHANNEL, "p": json.dumps(payload)})
+            payload, size = {}, 2
+        payload[symbol] = str(since)
+        size += item
+    if payload:
+        conn.execute(text("SELECT pg_notify(:c, :p)"), {"c": CHANNEL, "p": json.dumps(payload)})
+
+
+def _listen(stop: threading.Event):
+    while not stop.is_set():
+        try:
+            # kết nối riêng ngoài pool: autocommit + LISTEN không lọt lại vào pool, không chiếm slot của pool
+            dbapi = psycopg2.connect(engine.url.render_as_string(hide_password=False))
+            try:
+                dbapi.autocommit = True
+                with dbapi.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                logger.info("👂 Price cache lắng nghe %s", CHANNEL)
+                # vừa (kết nối lại) -> có thể đã lỡ thông báo trong lúc mất kết nối
+                get_price_cache().clear()
+                invalidate_latest_snapshot()
+                while not stop.is_set():
+                    if select.select([dbapi], [], [], 5.0) == ([], [], []):
+                        continue
+                    dbapi.poll()
+                    while dbapi.notifies:
+                        note = dbapi.notifies.pop(0)
+                        get_price_cache().mark_stale(json.loads(note.payload))
+                        invalidate_latest_snapshot()
+            finally:
+                dbapi.close()
+        except Exception as e:
+            logger.warning("Price cache listener lỗi (%s), thử lại sau 10s", e)
+            stop.wait(10)
+
+
+_listener_stop = threading.Event()
+
+
+def start_listener():
+    if not cache_enabled():
+        return
+    _listener_stop.clear()
+    threading.Thread(target=_listen, args=(_listener_stop,), name="price-cache-listener", daemon=True).start()
+
+
+def stop_listener():
+    _listener_stop.set()
@@ -0,0 +1,350 @@
+"""
+Bản sao dạng cột (Arrow) của stock_prices cho các phân tích đọc nhiều mã.
+
+Bố cục thư mục (PRICE_MIRROR_DIR):
+    year=2024/base.arrow           toàn bộ năm, sắp theo (symbol, date), file Arrow IPC không nén
+    year=2024/index.json           symbol -> [offset, số dòng] trong base.arrow
+    year=2024/delta-20241015.arrow các ngày mới nạp sau lần compact gần nhất
+    _meta.json                     ngày đã đồng bộ tới
+
+Sau mỗi lần nạp giá các ngày từ ngày sớm nhất vừa ghi (kể cả lịch sử cũ nạp lại / mã mới niêm yết)
+được ghi lại thành delta; chưa có bản sao thì xuất toàn bộ. Khi đủ PRICE_MIRROR_COMPACT_AFTER
+file delta (hoặc năm đã qua) thì gộp lại vào base. File Arrow IPC không nén đọc qua memory map:
+slice theo mã / khoảng ngày không copy, cột số trả về dưới dạng NumPy trỏ thẳng vào vùng map.
+export_parquet() xuất bản Parquet (partition theo năm) cho công cụ bên ngoài.
+
+pyarrow có trong requirements.txt; môi trường cài thiếu pyarrow thì mirror bị tắt.
+
+Cấu hình:
+    PRICE_MIRROR               = 1 để đồng bộ sau mỗi lần nạp giá (mặc định: 0)
+    PRICE_MIRROR_DIR           = thư mục mirror (mặc định: price_mirror)
+    PRICE_MIRROR_COMPACT_AFTER = số file delta tối đa mỗi năm trước khi gộp (mặc định: 20)
+
+Chạy: python -m app.price_mirror [--full] [--since YYYY-MM-DD] [--parquet DIR]
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from .database import engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow là tùy chọn
+    pa = ipc = pq = None
+
+logger = logging.getLogger(__name__)
+
+MIRROR_DIR = os.getenv("PRICE_MIRROR_DIR", "price_mirror")
+COMPACT_AFTER = int(os.getenv("PRICE_MIRROR_COMPACT_AFTER", "20"))
+
+FLOAT_COLUMNS = ["open", "high", "low", "close", "change"]
+INT_COLUMNS = ["volume", "value"]
+MIRROR_COLUMNS = ["symbol", "date"] + FLOAT_COLUMNS + INT_COLUMNS
+
+# Ngày cuối đã đồng bộ được đọc lại mỗi lần sync (board rồi history có thể ghi đè cùng 1 ngày)
+SYNC_OVERLAP_DAYS = 1
+
+
+def mirror_enabled() -> bool:
+    return os.getenv("PRICE_MIRROR", "0") == "1" and pa is not None
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Cần cài pyarrow để dùng price mirror (pip install pyarrow)")
+
+
+def _to_table(df: pd.DataFrame):
+    """
+    DataFrame giá -> Arrow table sắp theo (symbol, date).
+    NaN giữ nguyên (không dùng null bitmap) và volume/value thiếu = 0 để cột số đọc được zero-copy.
+    """
+    df = df.sort_values(["symbol", "date"], kind="stable")
+    arrays = {
+        "symbol": pa.array(df["symbol"].to_numpy(dtype=object), type=pa.string()),
+        "date": pa.array(pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]"), type=pa.date32()),
+    }
+    for col in FLOAT_COLUMNS:
+        arrays[col] = pa.array(pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64"))
+    for col in INT_COLUMNS:
+        arrays[col] = pa.array(pd.to_numeric(df[col], errors="coerce").fillna(0).to_numpy(dtype="int64"))
+    return pa.table(arrays)
+
+
+def _write_arrow(table, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def _write_json(obj, path: str):
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _read_arrow(path: str):
+    """Đọc file Arrow IPC qua memory map (không copy dữ liệu)"""
+    return ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def _symbol_index(table) -> dict:
+    symbols = table.column("symbol").to_numpy(zero_copy_only=False)
+    if len(symbols) == 0:
+        return {}
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    lengths = np.diff(np.r_[starts, len(symbols)])
+    return {symbols[s]: [int(s), int(n)] for s, n in zip(starts, lengths)}
+
+
+def _query_prices(start: date | None = None, end: date | None = None) -> pd.DataFrame:
+    sql = f"SELECT {', '.join(MIRROR_COLUMNS)} FROM stock_prices"
+    where, params = [], {}
+    if start:
+        where.append("date >= :start")
+        params["start"] = start
+    if end:
+        where.append("date <= :end")
+        params["end"] = end
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    with engine.connect() as conn:
+        return pd.read_sql_query(text(sql), conn, params=params)
+
+
+class PriceMirror:
+    def __init__(self, directory: str = MIRROR_DIR):
+        _require_pyarrow()
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._cache = {}  # path -> (mtime, table, index)
+
+    # ---------- đường dẫn / meta ----------
+    def _year_dir(self, year: int) -> str:
+        return os.path.join(self.directory, f"year={year}")
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "_meta.json")
+
+    def meta(self) -> dict:
+        try:
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def years(self) -> list:
+        return sorted(int(os.path.basename(p)[5:]) for p in glob.glob(os.path.join(self.directory, "year=*")))
+
+    def _deltas(self, year: int) -> list:
+        return sorted(glob.glob(os.path.join(self._year_dir(year), "delta-*.arrow")))
+
+    # ---------- ghi ----------
+    def _write_base(self, year: int, table):
+        _write_arrow(table, os.path.join(self._year_dir(year), "base.arrow"))
+        _write_json(_symbol_index(table), os.path.join(self._year_dir(year), "index.json"))
+
+    def export_all(self) -> dict:
+        """Xuất lại toàn bộ stock_prices, từng năm một (bộ nhớ chỉ giữ 1 năm)"""
+        with engine.connect() as conn:
+            first, last = conn.execute(text("SELECT min(date), max(date) FROM stock_prices")).one()
+        if first is None:
+            return {"years": 0, "rows": 0}
+        rows = 0
+        for year in range(first.year, last.year + 1):
+            df = _query_prices(date(year, 1, 1), date(year, 12, 31))
+            self._write_base(year, _to_table(df))
+            for path in self._deltas(year):
+                os.remove(path)
+            rows += len(df)
+        _write_json({"synced_through": last.isoformat()}, self._meta_path())
+        logger.info("🗄️ Mirror: xuất %d dòng, %d năm", rows, last.year - first.year + 1)
+        return {"years": last.year - first.year + 1, "rows": rows, "synced_through": last.isoformat()}
+
+    def sync(self, since: date | None = None, compact_after: int = COMPACT_AFTER) -> dict:
+        """Ghi các ngày mới (từ ngày đã đồng bộ, hoặc từ since) thành file delta theo ngày"""
+        synced = self.meta().get("synced_through")
+        if synced is None:
+            # chưa có bản sao: xuất toàn bộ, không chỉ phần từ since
+            return self.export_all()
+        if since is None:
+            since = date.fromisoformat(synced) - timedelta(days=SYNC_OVERLAP_DAYS)
+
+        df = _query_prices(since)
+        if df.empty:
+            return {"days": 0, "rows": 0, "synced_through": synced}
+
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+        years = set()
+        for day, group in df.groupby("date"):
+            path = os.path.join(self._year_dir(day.year), f"delta-{day:%Y%m%d}.arrow")
+            _write_arrow(_to_table(group), path)
+            years.add(day.year)
+
+        this_year = date.today().year
+        compacted = [y for y in sorted(years) if y < this_year or len(self._deltas(y)) >= compact_after]
+        for year in compacted:
+            self.compact(year)
+
+        last = max(df["date"])
+        if synced is None or last.isoformat() > synced:
+            _write_json({"synced_through": last.isoformat()}, self._meta_path())
+        return {"days": df["date"].nunique(), "rows": len(df), "compacted": compacted,
+                "synced_through": max(last.isoformat(), synced or "")}
+
+    def compact(self, year: int):
+        """Gộp base + delta của 1 năm thành base mới (delta thắng khi trùng symbol/date)"""
+        paths = self._deltas(year)
+        base_path = os.path.join(self._year_dir(year), "base.arrow")
+        frames = [_read_arrow(base_path).to_pandas()] if os.path.exists(base_path) else []
+        frames += [_read_arrow(p).to_pandas() for p in paths]
+        if not frames:
+            return
+        df = pd.concat(frames, ignore_index=True).drop_duplicates(["symbol", "date"], keep="last")
+        with self._lock:
+            self._cache.clear()
+        self._write_base(year, _to_table(df))
+        for path in paths:
+            os.remove(path)
+
+    def export_parquet(self, dest: str) -> int:
+        """Xuất Parquet partition theo năm (dest/year=YYYY/prices.parquet) từ mirror"""
+        rows = 0
+        for year in self.years():
+            self.compact(year)
+            table = self._table(os.path.join(self._year_dir(year), "base.arrow"))[0]
+            os.makedirs(os.path.join(dest, f"year={year}"), exist_ok=True)
+            pq.write_table(table, os.path.join(dest, f"year={year}", "prices.parquet"))
+            rows += table.num_rows
+        return rows
+
+    # ---------- đọc ----------
+    def _table(self, path: str):
+        """(table, symbol index) của 1 file, map 1 lần và dùng lại tới khi file đổi"""
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+        table = _read_arrow(path)
+        index_path = os.path.join(os.path.dirname(path), "index.json")
+        if path.endswith("base.arrow") and os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        else:
+            index = _symbol_index(table)
+        with self._lock:
+            self._cache[path] = (mtime, table, index)
+        return table, index
+
+    def _pieces(self, path, symbol, start, end, skip_days=None):
+        table, index = self._table(path)
+        pos = index.get(symbol)
+        if pos is None:
+            return None
+        part = table.slice(pos[0], pos[1])
+        dates = part.column("date").to_numpy(zero_copy_only=False).astype("datetime64[D]")
+        lo = np.searchsorted(dates, np.datetime64(start, "D"))
+        hi = np.searchsorted(dates, np.datetime64(end, "D"), side="right")
+        if hi <= lo:
+            return None
+        part, dates = part.slice(lo, hi - lo), dates[lo:hi]
+        if skip_days is not None and skip_days.size:
+            keep = ~np.isin(dates, skip_days)
+            if not keep.all():
+                return part.filter(pa.array(keep)), dates[keep]
+        return part, dates
+
+    def read(self, symbols, start: date, end: date, columns=("open", "high", "low", "close", "volume")) -> dict:
+        """
+        Giá của nhiều mã trong [start, end]: {symbol: {"date": datetime64[D], cột: ndarray}}.
+        Nếu dữ liệu của mã nằm gọn trong 1 file thì cột số là view trên vùng memory map (không copy).
+        """
+        out = {}
+        years = [y for y in self.years() if start.year <= y <= end.year]
+        for symbol in symbols:
+            parts = []
+            for year in years:
+                deltas = self._deltas(year)
+                delta_days = np.array(
+                    [np.datetime64(f"{p[-14:-10]}-{p[-10:-8]}-{p[-8:-6]}", "D") for p in deltas],
+                    dtype="datetime64[D]")
+                base = os.path.join(self._year_dir(year), "base.arrow")
+                if os.path.exists(base):
+                    piece = self._pieces(base, symbol, start, end, skip_days=delta_days)
+                    if piece:
+                        parts.append(piece)
+                for path in deltas:
+                    piece = self._pieces(path, symbol, start, end)
+                    if piece:
+                        parts.append(piece)
+            if not parts:
+                continue
+            if len(parts) == 1:
+                table, dates = parts[0]
+                arrays = {c: table.column(c).to_numpy(zero_copy_only=False) for c in columns}
+            else:
+                dates = np.concatenate([d for _, d in parts])
+                order = np.argsort(dates, kind="stable")
+                dates = dates[order]
+                arrays = {c: np.concatenate([t.column(c).to_numpy(zero_copy_only=False) for t, _ in parts])[order]
+                          for c in columns}
+            out[symbol] = {"date": dates, **arrays}
+        return out
+
+
+_mirror = None
+
+
+def get_mirror() -> PriceMirror:
+    global _mirror
+    if _mirror is None:
+        _mirror = PriceMirror()
+    return _mirror
+
+
+def sync_mirror(since: date | None = None) -> dict | None:
+    """Gọi sau mỗi lần nạp giá; lỗi mirror không làm hỏng kết quả nạp"""
+    if not mirror_enabled():
+        return None
+    try:
+        return get_mirror().sync(since=since)
+    except Exception as e:
+        logger.error("❌ Lỗi đồng bộ price mirror: %s", e)
+        return {"error": str(e)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đồng bộ bản sao Arrow/Parquet của stock_prices")
+    parser.add_argument("--full", action="store_true", help="Xuất lại toàn bộ")
+    parser.add_argument("--since", default=None, help="Đồng bộ lại từ ngày YYYY-MM-DD")
+    parser.add_argument("--parquet", default=None, help="Xuất thêm Parquet vào thư mục này")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    mirror = get_mirror()
+    if args.full:
+        print(mirror.export_all())
+    else:
+        print(mirror.sync(since=date.fromisoformat(args.since) if args.since else None))
+    if args.parquet:
+        print({"parquet_rows": mirror.export_parquet(args.parquet)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import logging
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from . import database
+from .company_search import invalidate_company_search
+from .dataset_versions import bump_versions
+from .price_writer import bulk_upsert_prices, PriceWriteError
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class StageStats:
+    """Bộ đếm throughput cho 1 stage (fetch hoặc write)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, items=0, rows=0, errors=0, seconds=0.0):
+        with self._lock:
+            self.items += items
+            self.rows += rows
+            self.errors += errors
+            self.busy_seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started_at, 1e-9)
+            return {
+                "items": self.items,
+                "rows": self.rows,
+                "errors": self.errors,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "elapsed_seconds": round(elapsed, 3),
+                "rows_per_sec": round(self.rows / elapsed, 1),
+            }
+
+
+def merge_companies(companies) -> int:
+    """
+    Merge danh sách models.Company trong 1 transaction.
+    Chỉ tăng version companies/all và dựng lại chỉ mục tìm kiếm khi có dòng thật sự thay đổi.
+    """
+    if not companies:
+        return 0
+    db = database.SessionLocal()
+    try:
+        merged = [db.merge(company) for company in companies]
+        changed = sum(1 for m in merged if m in db.new or db.is_modified(m))
+        if changed:
+            bump_versions(db.connection(), "companies", ["all"])
+        db.commit()
+        if changed:
+            invalidate_company_search()
+        return len(companies)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Lỗi lưu company batch {len(companies)} mã: {e}")
+        return 0
+    finally:
+        db.close()
+
+
+class PricePipeline:
+    """
+    Pipeline fetch/write cho các price loader:
+    - N fetcher thread lấy dữ liệu từng mã và đẩy vào queue có giới hạn (backpressure)
+    - 1 writer thread gom frame của nhiều mã thành batch lớn rồi bulk upsert
+    Bộ nhớ bị giới hạn bởi queue_size, không giữ toàn bộ DataFrame cùng lúc.
+    """
+
+    def __init__(self, fetch_fn, fetch_workers=5, queue_size=20, batch_rows=50_000, flush_seconds=2.0,
+                 progress=None):
+        self.fetch_fn = fetch_fn
+        self.progress = progress  # JobProgress (nếu chạy dưới dạng job)
+        self.fetch_workers = fetch_workers
+        self.batch_rows = batch_rows
+        self.flush_seconds = flush_seconds
+        self.frames: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.fetch_stats = StageStats("fetch")
+        self.write_stats = StageStats("write")
+        self.companies = 0
+        self.prices = 0
+        self.dates = set()  # các ngày đã ghi thành công (cho market summary)
+        self.no_data = []   # mã fetch thành công nhưng không có dữ liệu
+        self.errors = []
+        self._errors_lock = threading.Lock()
+        self._stop = threading.Event()  # writer chết -> fetcher dừng thay vì block trên queue đầy
+        self._writer_error = None
+
+    # ---------- fetch stage ----------
+    def _put(self, item, alive=None) -> bool:
+        """put có timeout: bỏ cuộc khi writer đã dừng (alive: thread writer, dùng cho _DONE)"""
+        while not self._stop.is_set() and (alive is None or alive.is_alive()):
+            try:
+                self.frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fetch_worker(self, tasks, tasks_lock):
+        while not self._stop.is_set():
+            if self.progress is not None and self.progress.cancelled():
+                return
+            with tasks_lock:
+                task = next(tasks, None)
+            if task is None:
+                return
+            symbol = task[0]
+            t0 = time.monotonic()
+            try:
+                company, df = self.fetch_fn(*task)
+            except Exception as e:
+                print(f"❌ Không fetch được {symbol}: {e}")
+                self.fetch_stats.record(items=1, errors=1, seconds=time.monotonic() - t0)
+                self._add_error(symbol)
+                if self.progress is not None:
+                    self.progress.advance(1, current=symbol, error=f"{symbol}: {e}")
+                continue
+            rows = 0 if df is None else len(df)
+            self.fetch_stats.record(items=1, rows=rows, seconds=time.monotonic() - t0)
+            if not rows:
+                self.no_data.append(symbol)  # list.append an toàn giữa các thread
+            if not self._put((symbol, company, df)):  # block khi writer chậm hơn fetcher
+                return
+
+    # ---------- write stage ----------
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        t0 = time.monotonic()
+        symbols = [symbol for symbol, _, _ in batch]
+
+        self.companies += merge_companies([c for _, c, _ in batch if c is not None])
+
+        frames = [df for _, _, df in batch if df is not None and not df.empty]
+        rows = 0
+        errors = 0
+        if frames:
+            try:
+                df = pd.concat(frames, ignore_index=True)
+                rows = bulk_upsert_prices(df)
+                self.prices += rows
+                self.dates.update(df["date"].unique())
+            except PriceWriteError as e:
+                print(f"❌ Lỗi lưu giá: {e}")
+                errors = 1
+                for symbol in symbols:
+                    self._add_error(symbol)
+
+        self.write_stats.record(items=len(batch), rows=rows, errors=errors, seconds=time.monotonic() - t0)
+        if self.progress is not None:
+            self.progress.advance(len(batch), rows=rows, current=symbols[-1],
+                                  error=f"Lỗi ghi batch {len(batch)} mã" if errors else None)
+
+    def _writer(self):
+        try:
+            self._write_loop()
+        except BaseException as e:
+            logger.exception("❌ Writer của pipeline giá dừng vì lỗi: %s", e)
+            self._writer_error = e
+            self._stop.set()
+            # xả queue để fetcher đang chờ put không bị treo
+            while True:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _write_loop(self):
+        batch, batch_rows = [], 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.frames.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                item = None
+
+            if item is _DONE:
+                self._write_batch(batch)
+                return
+
+            if item is not None:
+                batch.append(item)
+                batch_rows += 0 if item[2] is None else len(item[2])
+
+            if batch and (batch_rows >= self.batch_rows
+                          or time.monotonic() - last_flush >= self.flush_seconds):
+                self._write_batch(batch)
+                batch, batch_rows = [], 0
+                last_flush = time.monotonic()
+
+    def _add_error(self, symbol):
+        with self._errors_lock:
+            if symbol not in self.errors:
+                self.errors.append(symbol)
+
+    def stats(self) -> dict:
+        return {
+            "fetch": self.fetch_stats.snapshot(),
+            "write": self.write_stats.snapshot(),
+            "queue_depth": self.frames.qsize(),
+        }
+
+    def run(self, tasks, total: int | None = None) -> dict:
+        """
+        tasks: iterable các tuple (symbol, ...) truyền vào fetch_fn.
+        fetch_fn trả về (models.Company | None, DataFrame giá đã chuẩn hóa | None).
+        """
+        if self.progress is not None and total is not None:
+            self.progress.start(total)
+        tasks = iter(tasks)
+        tasks_lock = threading.Lock()
+
+        writer = threading.Thread(target=self._writer, name="price-writer", daemon=True)
+        writer.start()
+        fetchers = [
+            threading.Thread(target=self._fetch_worker, args=(tasks, tasks_lock),
+                             name=f"price-fetch-{i}", daemon=True)
+            for i in range(self.fetch_workers)
+        ]
+        for t in fetchers:
+            t.start()
+        for t in fetchers:
+            t.join()
+
+        self._put(_DONE, alive=writer)
+        writer.join()
+        if self._writer_error is not None:
+            raise self._writer_error
+
+        stats = self.stats()
+        logger.info("📊 Pipeline giá: fetch %s | write %s", stats["fetch"], stats["write"])
+        result = {
+            "companies": self.companies,
+            "prices": self.prices,
+            "errors": self.errors,
+            "stats": stats,
+        }
+        if self.progress is not None and self.progress.cancelled():
+            result["cancelled"] = True
+        return result
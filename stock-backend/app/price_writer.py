@@ -0,0 +1,214 @@
+"""
+Ghi giá ngày vào stock_prices theo batch: COPY vào bảng tạm + 1 lệnh INSERT ... ON CONFLICT.
+
+Benchmark so với cách cũ (db.merge + commit từng dòng), ghi vào DB đang cấu hình với các mã
+giả lập BENCH* rồi xóa đi:
+    python -m app.price_writer --bench [--symbols 100] [--days 1000] [--merge-rows 2000]
+
+Kết quả đo (Postgres 16 local qua loopback, 100 mã x 1000 ngày, stock_prices đã partition theo năm):
+    bulk upsert   insert mới 55.0k dòng/s, ghi đè dòng đã có 51.2k dòng/s
+    merge từng dòng (2000 dòng)  insert 545 dòng/s, ghi đè 1.05k dòng/s   -> nhanh hơn ~100x / ~49x
+Postgres qua mạng thì cách cũ còn chậm hơn nữa (mỗi dòng 2-3 round trip).
+"""
+import argparse
+import io
+import logging
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from .database import engine
+from .dataset_versions import bump_versions
+from .latest_prices import update_latest_prices
+from .price_cache import notify_price_writes
+from .trading_calendar import INSERT_TRADING_DAYS_SQL, invalidate_calendar
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ["symbol", "date", "open", "high", "low", "close", "volume", "value", "change"]
+
+STAGE_TABLE = "stock_prices_stage"
+
+
+class PriceWriteError(Exception):
+    """Lỗi khi ghi 1 batch giá (báo theo batch, không theo từng dòng)"""
+
+    def __init__(self, symbols, rows, cause):
+        self.symbols = symbols
+        self.rows = rows
+        self.cause = cause
+        preview = ", ".join(symbols[:5]) + ("..." if len(symbols) > 5 else "")
+        super().__init__(f"batch {rows} dòng ({preview}): {cause}")
+
+
+def prices_frame(symbol: str, df_prices: pd.DataFrame) -> pd.DataFrame:
+    """
+    Chuẩn hóa DataFrame trả về từ quote.history() về đúng cột của bảng stock_prices.
+    """
+    if df_prices is None or df_prices.empty:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+
+    df = df_prices.rename(columns={"time": "date"}).copy()
+    df["symbol"] = symbol
+    for col in PRICE_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+
+    df = df[PRICE_COLUMNS]
+    df["date"] = pd.to_datetime(df["date"]).dt.date
+    return df
+
+
+def _copy_buffer(df: pd.DataFrame) -> io.StringIO:
+    """Ghi DataFrame ra CSV trong bộ nhớ để COPY vào Postgres"""
+    out = df.copy()
+    for col in ("open", "high", "low", "close", "change"):
+        out[col] = pd.to_numeric(out[col], errors="coerce")
+    for col in ("volume", "value"):
+        out[col] = pd.to_numeric(out[col], errors="coerce").round().astype("Int64")
+
+    buf = io.StringIO()
+    out.to_csv(buf, index=False, header=False, na_rep="")
+    buf.seek(0)
+    return buf
+
+
+def bulk_upsert_prices(df: pd.DataFrame) -> int:
+    """
+    Ghi cả DataFrame giá (nhiều mã, nhiều ngày) vào stock_prices:
+    COPY vào bảng tạm rồi 1 lệnh INSERT ... ON CONFLICT (symbol, date) DO UPDATE.
+    Trả về số dòng đã ghi; nếu lỗi thì rollback cả batch và raise PriceWriteError.
+    """
+    if df is None or df.empty:
+        return 0
+
+    df = df[PRICE_COLUMNS].dropna(subset=["symbol", "date"])
+    df = df.drop_duplicates(subset=["symbol", "date"], keep="last")
+    if df.empty:
+        return 0
+
+    buf = _copy_buffer(df)
+    cols = ", ".join(f'"{c}"' for c in PRICE_COLUMNS)
+    updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in PRICE_COLUMNS[2:])
+
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} "
+                f"(LIKE stock_prices INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+            ))
+            cur = conn.connection.cursor()
+            cur.copy_expert(f"COPY {STAGE_TABLE} ({cols}) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.close()
+            conn.execute(text(
+                f"INSERT INTO stock_prices ({cols}) SELECT {cols} FROM {STAGE_TABLE} "
+                f"ON CONFLICT (symbol, date) DO UPDATE SET {updates}"
+            ))
+            # ngày mới xuất hiện -> thêm vào lịch giao dịch
+            new_days = conn.execute(text(INSERT_TRADING_DAYS_SQL.format(source=STAGE_TABLE))).rowcount
+            # phiên gần nhất / phiên trước của các mã vừa ghi
+            if update_latest_prices(conn, STAGE_TABLE):
+                bump_versions(conn, "latest", ["all"])
+            # watermark cho ETag của /prices/{symbol} và /daily
+            bump_versions(conn, "prices", df["symbol"].unique())
+            bump_versions(conn, "daily", pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d").unique())
+            # báo cho price cache của các process API (tới nơi khi commit)
+            notify_price_writes(conn, df)
+    except Exception as e:
+        symbols = sorted(df["symbol"].unique().tolist())
+        logger.error("❌ Lỗi ghi batch giá %d dòng / %d mã: %s", len(df), len(symbols), e)
+        raise PriceWriteError(symbols, len(df), e) from e
+
+    if new_days:
+        invalidate_calendar()
+    return len(df)
+
+
+# ================== Benchmark ==================
+BENCH_PREFIX = "BENCH"
+
+
+def _bench_frame(n_symbols: int, n_days: int, seed: int = 7) -> pd.DataFrame:
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=pd.Timestamp("2025-12-31"), periods=n_days).date
+    symbols = [f"{BENCH_PREFIX}{i:04d}" for i in range(n_symbols)]
+    n = n_symbols * n_days
+    close = rng.uniform(5, 100, n).round(2)
+    return pd.DataFrame({
+        "symbol": np.repeat(symbols, n_days),
+        "date": np.tile(days, n_symbols),
+        "open": close, "high": close, "low": close, "close": close,
+        "volume": rng.integers(1_000, 1_000_000, n),
+        "value": rng.integers(1_000_000, 10_000_000_000, n),
+        "change": rng.normal(0, 1, n).round(2),
+    })
+
+
+def merge_per_row(df: pd.DataFrame) -> int:
+    """Cách ghi cũ (trước bulk upsert): db.merge + commit cho từng dòng"""
+    from . import models
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    written = 0
+    try:
+        for p in df.itertuples(index=False):
+            db.merge(models.StockPrice(symbol=p.symbol, date=p.date, open=p.open, high=p.high, low=p.low,
+                                       close=p.close, volume=int(p.volume), value=int(p.value), change=p.change))
+            db.commit()
+            written += 1
+    finally:
+        db.close()
+    return written
+
+
+def _cleanup_bench():
+    with engine.begin() as conn:
+        for table in ("stock_prices", "latest_prices"):
+            conn.execute(text(f"DELETE FROM {table} WHERE symbol LIKE :p"), {"p": f"{BENCH_PREFIX}%"})
+        conn.execute(text("DELETE FROM dataset_versions WHERE dataset = 'prices' AND key LIKE :p"),
+                     {"p": f"{BENCH_PREFIX}%"})
+
+
+def _timed(fn, df) -> dict:
+    t0 = time.perf_counter()
+    rows = fn(df)
+    seconds = time.perf_counter() - t0
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds, 1)}
+
+
+def run_benchmark(n_symbols: int = 100, n_days: int = 1000, merge_rows: int = 2000) -> dict:
+    """rows/s của bulk upsert (insert mới + ghi đè) và của merge từng dòng trên cùng dữ liệu"""
+    df = _bench_frame(n_symbols, n_days)
+    _cleanup_bench()
+    try:
+        result = {
+            "bulk_insert": _timed(bulk_upsert_prices, df),
+            "bulk_upsert_existing": _timed(bulk_upsert_prices, df),
+        }
+        _cleanup_bench()
+        sample = df.head(merge_rows)
+        result["merge_per_row_insert"] = _timed(merge_per_row, sample)
+        result["merge_per_row_existing"] = _timed(merge_per_row, sample)
+        result["speedup_insert"] = round(result["bulk_insert"]["rows_per_sec"]
+                                         / result["merge_per_row_insert"]["rows_per_sec"], 1)
+        result["speedup_existing"] = round(result["bulk_upsert_existing"]["rows_per_sec"]
+                                           / result["merge_per_row_existing"]["rows_per_sec"], 1)
+        return result
+    finally:
+        _cleanup_bench()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark ghi stock_prices: bulk upsert vs merge từng dòng")
+    parser.add_argument("--bench", action="store_true")
+    parser.add_argument("--symbols", type=int, default=100)
+    parser.add_argument("--days", type=int, default=1000)
+    parser.add_argument("--merge-rows", type=int, default=2000, help="Số dòng đo cho cách merge từng dòng")
+    args = parser.parse_args()
+    if args.bench:
+        print(run_benchmark(args.symbols, args.days, args.merge_rows))
@@ -0,0 +1,225 @@
+import logging
+import random
+import threading
+import time
+
+from vnstock import Vnstock, Listing, Finance, Company, Trading
+
+logger = logging.getLogger(__name__)
+
+# Giới hạn theo từng nguồn dữ liệu: rate = số request/giây, burst = dung lượng bucket,
+# concurrency = số request song song ban đầu (AIMD sẽ tự điều chỉnh trong [min, max])
+PROVIDER_LIMITS = {
+    "VCI": {"rate": 5.0, "burst": 10, "concurrency": 4, "min_concurrency": 1, "max_concurrency": 10},
+    "TCBS": {"rate": 2.0, "burst": 4, "concurrency": 2, "min_concurrency": 1, "max_concurrency": 5},
+}
+DEFAULT_LIMITS = {"rate": 2.0, "burst": 4, "concurrency": 2, "min_concurrency": 1, "max_concurrency": 5}
+
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+BREAKER_THRESHOLD = 8
+BREAKER_RESET_SECONDS = 60.0
+
+# Lỗi do dữ liệu/tham số (vd: mã không có dữ liệu) -> không retry, không tính là lỗi nguồn
+NON_RETRYABLE = (ValueError, TypeError, KeyError)
+
+
+class CircuitOpenError(Exception):
+    """Nguồn dữ liệu đang bị ngắt (circuit breaker mở)"""
+
+
+class TokenBucket:
+    """Token bucket: tối đa `rate` request/giây, cho phép burst tới `capacity`"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AimdLimiter:
+    """
+    Giới hạn số request song song theo AIMD:
+    thành công -> tăng cộng (additive increase), lỗi -> giảm nhân (multiplicative decrease).
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, success: bool):
+        with self._cond:
+            self.in_flight -= 1
+            if success:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+            else:
+                self.limit = max(self.minimum, self.limit / 2)
+            self._cond.notify_all()
+
+
+class CircuitBreaker:
+    """Mở mạch sau `threshold` lỗi liên tiếp, thử lại (half-open) sau `reset_seconds`"""
+
+    def __init__(self, threshold: int, reset_seconds: float):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                # half-open: cho 1 request đi thử
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record(self, success: bool):
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return "open" if self.opened_at is not None else "closed"
+
+
+class SourceGate:
+    """Điểm truy cập duy nhất cho 1 nguồn (VCI/TCBS): rate limit + AIMD + retry + breaker"""
+
+    def __init__(self, source: str, limits: dict):
+        self.source = source
+        self.bucket = TokenBucket(limits["rate"], limits["burst"])
+        self.concurrency = AimdLimiter(limits["concurrency"], limits["min_concurrency"], limits["max_concurrency"])
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET_SECONDS)
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()  # calls / failures được cập nhật từ nhiều fetcher thread
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(MAX_RETRIES + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Nguồn {self.source} đang tạm ngắt do lỗi liên tiếp")
+
+            self.bucket.acquire()
+            self.concurrency.acquire()
+            success = False
+            try:
+                with self._lock:
+                    self.calls += 1
+                result = fn(*args, **kwargs)
+                success = True
+                return result
+            except NON_RETRYABLE:
+                success = True  # lỗi dữ liệu, nguồn vẫn hoạt động bình thường
+                raise
+            except Exception as e:
+                with self._lock:
+                    self.failures += 1
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logger.warning("⚠️ %s lỗi (%s), thử lại lần %d sau %.1fs", self.source, e, attempt + 1, delay)
+            finally:
+                self.concurrency.release(success)
+                self.breaker.record(success)
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls, failures = self.calls, self.failures
+        return {
+            "source": self.source,
+            "calls": calls,
+            "failures": failures,
+            "concurrency": round(self.concurrency.limit, 2),
+            "breaker": self.breaker.state,
+        }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(source: str) -> SourceGate:
+    source = source.upper()
+    with _gates_lock:
+        if source not in _gates:
+            _gates[source] = SourceGate(source, PROVIDER_LIMITS.get(source, DEFAULT_LIMITS))
+        return _gates[source]
+
+
+def call(source: str, fn, *args, **kwargs):
+    """Gọi 1 hàm vnstock bất kỳ qua gate của nguồn tương ứng"""
+    return get_gate(source).call(fn, *args, **kwargs)
+
+
+# ================== Wrapper cho các API vnstock ==================
+def all_symbols(source="VCI", **kwargs):
+    return call(source, lambda: Listing(source=source).all_symbols(**kwargs))
+
+
+def price_history(symbol: str, start: str, end: str, interval="1D", source="VCI"):
+    def _fetch():
+        stock = Vnstock().stock(symbol=symbol, source=source)
+        return stock.quote.history(start=start, end=end, interval=interval)
+    return call(source, _fetch)
+
+
+def intraday(symbol: str, page_size=5000, source="VCI"):
+    """Các lệnh khớp gần nhất trong phiên (cột time, price, volume, match_type, id)"""
+    def _fetch():
+        stock = Vnstock().stock(symbol=symbol, source=source)
+        return stock.quote.intraday(symbol=symbol, page_size=page_size, show_log=False)
+    return call(source, _fetch)
+
+
+def price_board(symbols: list, source="VCI"):
+    """Bảng giá nhiều mã trong 1 request (cột đã flatten: listing_*, match_*, bid_ask_*)"""
+    return call(source, lambda: Trading(source=source).price_board(
+        symbols_list=list(symbols), flatten_columns=True, separator="_"))
+
+
+def finance(symbol: str, source="VCI") -> Finance:
+    return Finance(symbol=symbol, source=source)
+
+
+def finance_report(client: Finance, report_type: str, source="VCI", *args, **kwargs):
+    return call(source, getattr(client, report_type), *args, **kwargs)
+
+
+def company_overview(symbol: str, source="TCBS"):
+    return call(source, lambda: Company(symbol=symbol, source=source).overview())
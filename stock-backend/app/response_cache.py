@@ -0,0 +1,225 @@
+"""
+Cache response của market data provider trên đĩa.
+
+Key = hash nội dung của (method, source, symbol, period, lang, khoảng ngày, ...),
+value = DataFrame nén (pickle gzip). Có TTL theo từng endpoint, giới hạn dung lượng
+với loại bỏ theo LRU và thống kê hit/miss.
+
+Lịch sử giá được tách tại phiên đã đóng cửa gần nhất: phần [start, phiên đã đóng] dùng TTL dài hơn
+(full_load chết giữa chừng chạy lại lấy từ cache), phần đuôi còn mở (phiên đang giao dịch) dùng TTL ngắn.
+Phần đã đóng vẫn không phải bất biến: nguồn điều chỉnh lại giá quá khứ khi có sự kiện doanh nghiệp
+(chia tách, cổ tức) -> chỉ giữ vài giờ để lần dựng lại sau đó không ghi lại giá chưa điều chỉnh.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+
+import pandas as pd
+
+from .market_data import MarketDataProvider
+from .trading_calendar import get_calendar, last_closed_session
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 3600
+
+# TTL (giây) theo endpoint
+CACHE_TTLS = {
+    "price_history": 10 * 60,             # phần sau phiên đã đóng cửa gần nhất
+    "price_history_closed": 6 * 3600,     # tới phiên đã đóng cửa: chỉ đổi khi nguồn điều chỉnh giá
+    "financial_report": DAY,
+    "company_overview": 7 * DAY,
+    "all_symbols": DAY,
+}
+
+
+class ResponseCache:
+    def __init__(self, directory: str, max_bytes: int = 2 * 1024 ** 3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._index = OrderedDict()  # digest -> (size, created_at); thứ tự = LRU
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def make_key(method: str, **params) -> str:
+        payload = json.dumps({"method": method, **params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.pkl.gz")
+
+    def _scan(self):
+        """Dựng lại index từ các file đã có (cũ nhất đứng đầu LRU)"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pkl.gz"):
+                    continue
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                entries.append((st.st_mtime, name[:-len(".pkl.gz")], st.st_size))
+        for mtime, digest, size in sorted(entries):
+            self._index[digest] = (size, mtime)
+            self.bytes += size
+
+    def get(self, key: str, ttl: float):
+        path = self._path(key)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            size, created_at = entry
+            if time.time() - created_at > ttl:
+                self.expired += 1
+                self.misses += 1
+                self._remove(key)
+                return None
+            self._index.move_to_end(key)
+
+        try:
+            df = pd.read_pickle(path, compression="gzip")
+        except Exception as e:
+            logger.warning("Cache hỏng %s: %s", path, e)
+            with self._lock:
+                self.misses += 1
+                self._remove(key)
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def put(self, key: str, df: pd.DataFrame):
+        if not isinstance(df, pd.DataFrame):
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        df.to_pickle(tmp, compression="gzip")
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            if key in self._index:
+                self.bytes -= self._index[key][0]
+            self._index[key] = (size, time.time())
+            self._index.move_to_end(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        size, _ = self._index.pop(key, (0, 0))
+        self.bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+class CachingProvider(MarketDataProvider):
+    """Bọc 1 provider: đọc cache trước, chỉ gọi nguồn khi miss"""
+
+    def __init__(self, inner: MarketDataProvider, cache: ResponseCache, ttls: dict | None = None):
+        self.inner = inner
+        self.cache = cache
+        self.ttls = ttls or CACHE_TTLS
+        self.name = f"{inner.name}+cache"
+
+    def _cached(self, method, ttl_name, params, call):
+        key = ResponseCache.make_key(method, **params)
+        df = self.cache.get(key, self.ttls[ttl_name])
+        if df is not None:
+            return df
+        df = call()
+        self.cache.put(key, df)
+        return df
+
+    def all_symbols(self, source="VCI", **kwargs):
+        return self._cached("all_symbols", "all_symbols", {"source": source, **kwargs},
+                            lambda: self.inner.all_symbols(source=source, **kwargs))
+
+    def _price_range(self, ttl_name, symbol, start, end, interval, source):
+        params = {"symbol": symbol, "start": str(start), "end": str(end), "interval": interval, "source": source}
+        return self._cached("price_history", ttl_name, params, lambda: self.inner.price_history(**params))
+
+    def price_history(self, symbol, start, end, interval="1D", source="VCI"):
+        start_d = date.fromisoformat(str(start)[:10])
+        end_d = date.fromisoformat(str(end)[:10])
+        closed = last_closed_session()
+        if end_d <= closed or interval != "1D":
+            ttl_name = "price_history_closed" if end_d <= closed else "price_history"
+            return self._price_range(ttl_name, symbol, start, end, interval, source)
+        if start_d > closed:
+            return self._price_range("price_history", symbol, start, end, interval, source)
+
+        # [start, phiên đã đóng] cache dài hạn + đuôi (phiên đang mở) cache ngắn
+        head_error = None
+        try:
+            head = self._price_range("price_history_closed", symbol, start, closed, interval, source)
+        except ValueError as e:
+            head, head_error = None, e  # mã mới niêm yết: chưa có phiên đã đóng, đuôi vẫn có thể có dữ liệu
+        tail_start = closed + timedelta(days=1)
+        tail = None
+        if get_calendar().count_between(tail_start, end_d) > 0:
+            try:
+                tail = self._price_range("price_history", symbol, tail_start, end_d, interval, source)
+            except ValueError:
+                tail = None  # phiên đang mở chưa có dữ liệu
+        if tail is None or tail.empty:
+            if head_error is not None:
+                raise head_error
+            return head
+        if head is None or head.empty:
+            return tail
+        df = pd.concat([head, tail], ignore_index=True)
+        return df.drop_duplicates(subset="time", keep="last") if "time" in df.columns else df
+
+    def financial_report(self, symbol, report_type, period="quarter", lang="vi", source="VCI"):
+        params = {"symbol": symbol, "report_type": report_type, "period": period, "lang": lang, "source": source}
+        return self._cached("financial_report", "financial_report", params,
+                            lambda: self.inner.financial_report(**params))
+
+    def company_overview(self, symbol, source="TCBS"):
+        params = {"symbol": symbol, "source": source}
+        return self._cached("company_overview", "company_overview", params,
+                            lambda: self.inner.company_overview(**params))
+
+    def price_board(self, symbols, session_date, source="VCI"):
+        # dữ liệu trong phiên thay đổi liên tục -> không cache
+        return self.inner.price_board(symbols, session_date, source=source)
+
+    def intraday_ticks(self, symbol, session_date, source="VCI"):
+        return self.inner.intraday_ticks(symbol, session_date, source=source)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
@@ -0,0 +1,168 @@
+"""
+Export toàn bộ dữ liệu dạng stream (không giới hạn limit).
+
+Đọc bằng server-side cursor (stream_results + partitions), mỗi chunk được ghi ra ngay
+dưới dạng NDJSON, CSV hoặc Arrow IPC stream nên bộ nhớ không phụ thuộc kích thước kết quả.
+Arrow cần pyarrow (có trong requirements.txt; thiếu thì trả 501).
+"""
+import csv
+import io
+import json
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+from ..database import engine
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow là tùy chọn
+    pa = ipc = None
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+CHUNK_ROWS = 10_000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+PRICE_COLUMNS = ["symbol", "date", "open", "high", "low", "close", "volume", "value", "change"]
+REPORT_COLUMNS = ["ticker", "report_type", "period_type", "report_year", "report_quarter", "lang", "data"]
+
+
+def _arrow_schema(kind: str):
+    if kind == "prices":
+        return pa.schema([
+            ("symbol", pa.string()), ("date", pa.date32()),
+            ("open", pa.float64()), ("high", pa.float64()), ("low", pa.float64()), ("close", pa.float64()),
+            ("volume", pa.int64()), ("value", pa.int64()), ("change", pa.float64()),
+        ])
+    return pa.schema([
+        ("ticker", pa.string()), ("report_type", pa.string()), ("period_type", pa.string()),
+        ("report_year", pa.int32()), ("report_quarter", pa.int32()), ("lang", pa.string()),
+        ("data", pa.string()),  # JSON dạng chuỗi
+    ])
+
+
+def _encode_ndjson(columns, rows):
+    return "".join(json.dumps(dict(zip(columns, r)), ensure_ascii=False, default=str) + "\n"
+                   for r in rows).encode("utf-8")
+
+
+def _encode_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in rows:
+        writer.writerow([json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for v in r])
+    return buf.getvalue().encode("utf-8")
+
+
+def _stream(sql: str, params: dict, columns: list, fmt: str, kind: str):
+    """Generator: đọc theo chunk từ server-side cursor, encode và yield từng chunk"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=CHUNK_ROWS).execute(text(sql), params)
+
+        if fmt == "arrow":
+            schema = _arrow_schema(kind)
+            sink = io.BytesIO()
+            with ipc.new_stream(sink, schema) as writer:
+                for rows in result.partitions():
+                    cols = list(zip(*rows))
+                    if kind == "reports":
+                        cols[-1] = [None if v is None else json.dumps(v, ensure_ascii=False) for v in cols[-1]]
+                    writer.write_batch(pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, schema)],
+                                                       schema=schema))
+                    yield sink.getvalue()
+                    sink.seek(0)
+                    sink.truncate(0)
+            yield sink.getvalue()  # end-of-stream marker
+            return
+
+        if fmt == "csv":
+            yield (",".join(columns) + "\n").encode("utf-8")
+        for rows in result.partitions():
+            yield _encode_ndjson(columns, rows) if fmt == "ndjson" else _encode_csv(rows)
+
+
+def _response(sql, params, columns, fmt, kind, name):
+    if fmt == "arrow" and pa is None:
+        raise HTTPException(status_code=501, detail="Cần cài pyarrow để export Arrow")
+    ext = {"ndjson": "ndjson", "csv": "csv", "arrow": "arrows"}[fmt]
+    filename = f"{name}-{datetime.now():%Y%m%d%H%M%S}.{ext}"
+    return StreamingResponse(_stream(sql, params, columns, fmt, kind), media_type=MEDIA_TYPES[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def _symbols(symbols: str | None):
+    return [s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else None
+
+
+@router.get("/prices")
+def export_prices(
+    format: str = Query(default="ndjson", regex="^(ndjson|csv|arrow)$"),
+    symbols: str | None = Query(default=None, description="Danh sách mã, cách nhau dấu phẩy"),
+    exchange: str | None = Query(default=None, description="HOSE|HNX|UPCOM"),
+    start: str | None = Query(default=None, description="YYYY-MM-DD"),
+    end: str | None = Query(default=None, description="YYYY-MM-DD"),
+):
+    """Toàn bộ stock_prices theo bộ lọc, sắp theo (symbol, date)"""
+    where, params = [], {}
+    if symbols:
+        where.append("p.symbol = ANY(:symbols)")
+        params["symbols"] = _symbols(symbols)
+    if exchange:
+        where.append("p.symbol IN (SELECT symbol FROM companies WHERE exchange = :exchange)")
+        params["exchange"] = exchange
+    try:
+        if start:
+            where.append("p.date >= :start")
+            params["start"] = datetime.strptime(start, "%Y-%m-%d").date()
+        if end:
+            where.append("p.date <= :end")
+            params["end"] = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Sai định dạng ngày, dùng YYYY-MM-DD")
+
+    sql = f"SELECT {', '.join('p.' + c for c in PRICE_COLUMNS)} FROM stock_prices p"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY p.symbol, p.date"
+    return _response(sql, params, PRICE_COLUMNS, format, "prices", "stock_prices")
+
+
+@router.get("/financial_reports")
+def export_financial_reports(
+    format: str = Query(default="ndjson", regex="^(ndjson|csv|arrow)$"),
+    symbols: str | None = Query(default=None, description="Danh sách mã, cách nhau dấu phẩy"),
+    exchange: str | None = Query(default=None, description="HOSE|HNX|UPCOM"),
+    report_type: str | None = Query(default=None, description="income_statement|balance_sheet|cash_flow"),
+    period_type: str | None = Query(default=None, description="quarter|year"),
+    year: int | None = Query(default=None),
+    quarter: int | None = Query(default=None, ge=1, le=4),
+    lang: str | None = Query(default=None),
+):
+    """Báo cáo tài chính theo bộ lọc, sắp theo (ticker, năm, quý, loại báo cáo)"""
+    where, params = [], {}
+    if symbols:
+        where.append("r.ticker = ANY(:symbols)")
+        params["symbols"] = _symbols(symbols)
+    if exchange:
+        where.append("r.ticker IN (SELECT symbol FROM companies WHERE exchange = :exchange)")
+        params["exchange"] = exchange
+    for column, value in (("report_type", report_type), ("period_type", period_type),
+                          ("report_year", year), ("report_quarter", quarter), ("lang", lang)):
+        if value is not None:
+            where.append(f"r.{column} = :{column}")
+            params[column] = value
+
+    sql = f"SELECT {', '.join('r.' + c for c in REPORT_COLUMNS)} FROM financial_reports r"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY r.ticker, r.report_year, r.report_quarter, r.report_type"
+    return _response(sql, params, REPORT_COLUMNS, format, "reports", "financial_reports")
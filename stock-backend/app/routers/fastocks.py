@@ -1,36 +1,30 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
 from app.models import FinancialReport
 
 router = APIRouter(prefix="/FaStock Get Data", tags=["FaStock Get Data"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.get("/report/")
-def get_report(
+async def get_report(
     ticker: str,
     report_type: str = Query(..., regex="(balance_sheet|income_statement|cash_flow)"),
     report_year: int = None,
     report_quarter: int = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(FinancialReport.data).filter(
+    query = select(FinancialReport.data).where(
         FinancialReport.ticker == ticker,
         FinancialReport.report_type == report_type.lower()
     )
     if report_year:
-        query = query.filter(FinancialReport.report_year == report_year)
+        query = query.where(FinancialReport.report_year == report_year)
     if report_quarter:
-        query = query.filter(FinancialReport.report_quarter == report_quarter)
+        query = query.where(FinancialReport.report_quarter == report_quarter)
 
-    result = query.all()
+    result = (await db.scalars(query)).all()
     if not result:
         raise HTTPException(status_code=404, detail="Data not found")
 
-    return [row[0] for row in result]
+    return result
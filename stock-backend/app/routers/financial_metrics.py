@@ -4,6 +4,7 @@ from psycopg2.extras import RealDictCursor
 from decimal import Decimal
 from app.models import FinancialGrowthReport
 from app.database import SessionLocal
+from app.dataset_versions import bump_versions
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from sqlalchemy import text
@@ -579,6 +580,8 @@ def save_growth_summary_to_db(data: dict):
             record = FinancialGrowthReport(**db_data)
             db.add(record)
 
+        # watermark cho ETag của /financial-ranking/summary
+        bump_versions(db.connection(), "ranking", [f"{year}Q{quarter}"])
         db.commit()
 
     except Exception as e:
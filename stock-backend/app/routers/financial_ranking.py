@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Query, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
+from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any, Tuple
 from collections import defaultdict
-from app.database import SessionLocal
+from app.database import get_async_db
+from app.dataset_versions import conditional_get
 from app.models import FinancialGrowthReport
 
 router = APIRouter(prefix="/financial-ranking", tags=["Financial Ranking"])
@@ -142,134 +146,140 @@ def _sort_and_assign_positions_for_growth(reports: List[FinancialGrowthReport],
 
 
 @router.get("/summary")
-def ranking_summary(year: int = Query(...), quarter: int = Query(...)):
+async def ranking_summary(request: Request, year: int = Query(...), quarter: int = Query(...),
+                          db: AsyncSession = Depends(get_async_db)):
     """
     Endpoint rút gọn chỉ trả ticker và score.
     """
-    db: Session = SessionLocal()
-    try:
-        # --- tái sử dụng logic từ API chính ---
-        reports = db.query(FinancialGrowthReport).filter(
-            FinancialGrowthReport.year == year,
-            FinancialGrowthReport.quarter == quarter
-        ).all()
-
-        if not reports:
-            raise HTTPException(status_code=404, detail="No financial_growth_report rows for given year/quarter.")
-
-        tickers = sorted({r.ticker for r in reports})
-        counts: Dict[str, Dict[int,int]] = {t: defaultdict(int) for t in tickers}
-
-        def _apply_positions(pos_list: List[Tuple[str,int]], field_name: str):
-            w = CRITERIA_WEIGHTS.get(field_name, 1.0)
-            for ticker, pos in pos_list:
-                counts[ticker][pos] += w
-                # FPT [4,....] AAA [5,...]
-                # FPT [5,...]  AAA [4.5,....]
-        # --- xử lý như API gốc ---
-        for field in PERCENT_CRITERIA:
-            _apply_positions(_sort_and_assign_positions_for_numeric(reports, field), field)
-
-        for field in GROWTH_CRITERIA:
-            _apply_positions(_sort_and_assign_positions_for_growth(reports, field), field)
-
-        for field in CONSECUTIVE_CRITERIA:
-            _apply_positions(_sort_and_assign_positions_for_numeric(reports, field), field)
-
-        max_pos = max((max(pos_dict.keys()) if pos_dict else 0) for pos_dict in counts.values())
-
-        def ticker_key_vec(ticker: str):
-            d = counts[ticker]
-            return tuple(d.get(pos, 0) for pos in range(1, max_pos+1))
-
-        # --- Tính vector thứ hạng ---
-        vectors = {t: ticker_key_vec(t) for t in tickers}
-
-                # --- Tính first_nonzero_pos (vị trí tốt nhất mà mã đó có >0) ---
-        first_nonzero = {}
-        for t, vec in vectors.items():
-            fnz = None
-            for i, v in enumerate(vec):
-                if v and v > 0:
-                    fnz = i
-                    break
-            first_nonzero[t] = fnz  # None nếu toàn zeros
-
-        # --- Nhóm ticker theo first_nonzero_pos ---
-        groups_by_pos = defaultdict(list)
-        for t, p in first_nonzero.items():
-            groups_by_pos[p].append(t)
-
-        # --- Duyệt các pos theo ưu tiên: pos nhỏ (tốt) trước; None xử lý sau ---
-        pos_keys = sorted([k for k in groups_by_pos.keys() if k is not None])
-        if None in groups_by_pos:
-            has_none = True
-        else:
-            has_none = False
-
-        # --- Gán dense rank theo từng (pos, count) nhóm ---
-        ticker_to_rank = {}
-        current_rank = 1
-
-        for p in pos_keys:
-            tickers_in_group = groups_by_pos[p]
-            # Nhóm theo số lượng đạt tại pos p (vector[p])
-            count_buckets = defaultdict(list)
-            for t in tickers_in_group:
-                cnt = vectors[t][p] if p < len(vectors[t]) else 0
-                count_buckets[cnt].append(t)
-
-            # Duyệt các count giảm dần (count cao được rank tốt hơn)
-            for cnt in sorted(count_buckets.keys(), reverse=True):
-                for t in sorted(count_buckets[cnt]):  # deterministic order
-                    ticker_to_rank[t] = current_rank
-                current_rank += 1
-
-        # Ticker toàn zeros (None) -> xếp sau, cùng rank
-        if has_none:
-            for t in sorted(groups_by_pos[None]):
+    # ETag theo version của kỳ (year, quarter): poll lặp lại khi chưa tính lại -> 304
+    not_modified, etag = await conditional_get(request, db, ("ranking", f"{year}Q{quarter}"))
+    if not_modified:
+        return not_modified
+
+    reports = (await db.scalars(select(FinancialGrowthReport).where(
+        FinancialGrowthReport.year == year,
+        FinancialGrowthReport.quarter == quarter
+    ))).all()
+
+    if not reports:
+        raise HTTPException(status_code=404, detail="No financial_growth_report rows for given year/quarter.")
+
+    # xếp hạng thuần CPU -> chạy trong threadpool để không chặn event loop
+    return JSONResponse(await run_in_threadpool(_ranking_summary, year, quarter, reports), headers=etag)
+
+
+def _ranking_summary(year: int, quarter: int, reports: List[FinancialGrowthReport]) -> Dict[str, Any]:
+    # --- tái sử dụng logic từ API chính ---
+    tickers = sorted({r.ticker for r in reports})
+    counts: Dict[str, Dict[int,int]] = {t: defaultdict(int) for t in tickers}
+
+    def _apply_positions(pos_list: List[Tuple[str,int]], field_name: str):
+        w = CRITERIA_WEIGHTS.get(field_name, 1.0)
+        for ticker, pos in pos_list:
+            counts[ticker][pos] += w
+            # FPT [4,....] AAA [5,...]
+            # FPT [5,...]  AAA [4.5,....]
+    # --- xử lý như API gốc ---
+    for field in PERCENT_CRITERIA:
+        _apply_positions(_sort_and_assign_positions_for_numeric(reports, field), field)
+
+    for field in GROWTH_CRITERIA:
+        _apply_positions(_sort_and_assign_positions_for_growth(reports, field), field)
+
+    for field in CONSECUTIVE_CRITERIA:
+        _apply_positions(_sort_and_assign_positions_for_numeric(reports, field), field)
+
+    max_pos = max((max(pos_dict.keys()) if pos_dict else 0) for pos_dict in counts.values())
+
+    def ticker_key_vec(ticker: str):
+        d = counts[ticker]
+        return tuple(d.get(pos, 0) for pos in range(1, max_pos+1))
+
+    # --- Tính vector thứ hạng ---
+    vectors = {t: ticker_key_vec(t) for t in tickers}
+
+            # --- Tính first_nonzero_pos (vị trí tốt nhất mà mã đó có >0) ---
+    first_nonzero = {}
+    for t, vec in vectors.items():
+        fnz = None
+        for i, v in enumerate(vec):
+            if v and v > 0:
+                fnz = i
+                break
+        first_nonzero[t] = fnz  # None nếu toàn zeros
+
+    # --- Nhóm ticker theo first_nonzero_pos ---
+    groups_by_pos = defaultdict(list)
+    for t, p in first_nonzero.items():
+        groups_by_pos[p].append(t)
+
+    # --- Duyệt các pos theo ưu tiên: pos nhỏ (tốt) trước; None xử lý sau ---
+    pos_keys = sorted([k for k in groups_by_pos.keys() if k is not None])
+    if None in groups_by_pos:
+        has_none = True
+    else:
+        has_none = False
+
+    # --- Gán dense rank theo từng (pos, count) nhóm ---
+    ticker_to_rank = {}
+    current_rank = 1
+
+    for p in pos_keys:
+        tickers_in_group = groups_by_pos[p]
+        # Nhóm theo số lượng đạt tại pos p (vector[p])
+        count_buckets = defaultdict(list)
+        for t in tickers_in_group:
+            cnt = vectors[t][p] if p < len(vectors[t]) else 0
+            count_buckets[cnt].append(t)
+
+        # Duyệt các count giảm dần (count cao được rank tốt hơn)
+        for cnt in sorted(count_buckets.keys(), reverse=True):
+            for t in sorted(count_buckets[cnt]):  # deterministic order
                 ticker_to_rank[t] = current_rank
-            # current_rank += 1  # không cần nếu không dùng sau
-
-        # --- Tạo kết quả rankings kèm rank, score, vector, best_pos, count_at_best_pos ---
-        rankings = []
-        for t in tickers:
-            rank = ticker_to_rank.get(t, current_rank)  # fallback rare case
-            # compute score from rank
-            score = max(100 - (rank - 1), 1)
-            best_pos = first_nonzero[t]
-            count_at_best = 0
-            if best_pos is not None:
-                count_at_best = vectors[t][best_pos] if best_pos < len(vectors[t]) else 0
-            rankings.append({
-                "ticker": t,
-                "score": score,
-                "rank": rank,
-                "best_pos": best_pos + 1,
-                "count_at_best": count_at_best,
-                "vector": vectors[t]
-            })
-
-        # Sắp xếp: rank tăng dần (rank nhỏ là tốt), nếu cùng rank thì sort ticker
-        rankings.sort(key=lambda x: (x["rank"], x["ticker"]))      
-        top10_vectors = rankings[:10]
-
-        # print("=== Tổng trọng số của 10 mã cao nhất ===")
-        # for r in top10_vectors:
-        #     ticker = r["ticker"]
-        #     total_weight = sum(vectors[ticker])
-        #     print(f"{ticker}: {total_weight:.2f}")
-        #     print(top10_vectors)
-
-        return {
-            "year": year,
-            "quarter": quarter,
-            "num_companies": len(tickers), 
-            "rankings": [
-                {"ticker": r["ticker"], "score": r["score"]}
-                for r in rankings
-            ]
-        }
-
-    finally:
-        db.close()
+            current_rank += 1
+
+    # Ticker toàn zeros (None) -> xếp sau, cùng rank
+    if has_none:
+        for t in sorted(groups_by_pos[None]):
+            ticker_to_rank[t] = current_rank
+        # current_rank += 1  # không cần nếu không dùng sau
+
+    # --- Tạo kết quả rankings kèm rank, score, vector, best_pos, count_at_best_pos ---
+    rankings = []
+    for t in tickers:
+        rank = ticker_to_rank.get(t, current_rank)  # fallback rare case
+        # compute score from rank
+        score = max(100 - (rank - 1), 1)
+        best_pos = first_nonzero[t]
+        count_at_best = 0
+        if best_pos is not None:
+            count_at_best = vectors[t][best_pos] if best_pos < len(vectors[t]) else 0
+        rankings.append({
+            "ticker": t,
+            "score": score,
+            "rank": rank,
+            "best_pos": best_pos + 1,
+            "count_at_best": count_at_best,
+            "vector": vectors[t]
+        })
+
+    # Sắp xếp: rank tăng dần (rank nhỏ là tốt), nếu cùng rank thì sort ticker
+    rankings.sort(key=lambda x: (x["rank"], x["ticker"]))      
+    top10_vectors = rankings[:10]
+
+    # print("=== Tổng trọng số của 10 mã cao nhất ===")
+    # for r in top10_vectors:
+    #     ticker = r["ticker"]
+    #     total_weight = sum(vectors[ticker])
+    #     print(f"{ticker}: {total_weight:.2f}")
+    #     print(top10_vectors)
+
+    return {
+        "year": year,
+        "quarter": quarter,
+        "num_companies": len(tickers), 
+        "rankings": [
+            {"ticker": r["ticker"], "score": r["score"]}
+            for r in rankings
+        ]
+    }
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models import IngestionJob
+from app.jobs import cancel_job, job_status
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@router.get("/")
+def list_jobs(
+    kind: str | None = Query(default=None),
+    status: str | None = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_db)
+):
+    q = db.query(IngestionJob)
+    if kind:
+        q = q.filter(IngestionJob.kind == kind)
+    if status:
+        q = q.filter(IngestionJob.status == status)
+    rows = q.order_by(IngestionJob.created_at.desc()).limit(limit).all()
+    return {"data": [job_status(j) for j in rows]}
+
+@router.get("/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db)):
+    job = db.query(IngestionJob).get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+@router.post("/{job_id}/cancel")
+def cancel(job_id: str):
+    job = cancel_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
@@ -1,341 +1,706 @@
-import time, random
+import numpy as np
+import pandas as pd
 from fastapi import APIRouter, Query
-from sqlalchemy.orm import Session
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from vnstock import Vnstock, Listing
 from datetime import date, timedelta
 from sqlalchemy import func
 from .. import models, database
+from ..database import get_async_db
+from ..market_data import get_provider, provider_stats
+from ..delta_planner import plan_delta_load, record_no_data
+from ..trading_calendar import get_calendar, last_closed_session, market_now
+from ..gap_scanner import scan_gaps, summarize_gaps
+from ..price_mirror import sync_mirror
+from ..price_cache import cache_enabled, get_price_cache, slice_range, to_records
+from ..pagination import CursorError, decode_cursor, encode_cursor, total_for_async
+from ..serialization import FastJSONResponse, rows_as_dicts
+from ..dataset_versions import conditional_get
+from ..company_search import SEARCH_COLUMNS, fold, get_company_search, search_enabled, sql_search_ready
+from ..latest_prices import LATEST_COLUMNS, latest_snapshot, rebuild_latest_prices, store_latest_snapshot
+from ..market_summary import TOP_N as MARKET_TOP_N, materialize_days
+from ..jobs import enqueue_job, JobConflictError
+from ..price_pipeline import PricePipeline, merge_companies
+from ..price_writer import bulk_upsert_prices, prices_frame, PriceWriteError, PRICE_COLUMNS
 
 router = APIRouter(prefix="/stocks", tags=["Stocks"])
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, or_
+# Số mã mỗi request bảng giá khi today_load ở chế độ board
+BOARD_CHUNK_SIZE = 200
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, or_, cast, case, Float, literal, tuple_, text, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date, timedelta, datetime
 
 
-# Dependency để lấy session DB
-def get_db():
-    db = database.SessionLocal()
+
+def company_from_row(symbol: str, row: dict) -> models.Company:
+    """Tạo object Company từ 1 dòng của Listing.all_symbols()"""
+    return models.Company(
+        symbol=symbol,
+        exchange=row.get("exchange") or row.get("comGroupCode"),
+        name=row.get("organName") or row.get("companyName"),
+        industry=row.get("industryName") or row.get("icbName"),
+        website=None,
+        listing_date=None
+    )
+
+
+def fetch_prices(symbol: str, start_date: str, end_date: str | None = None):
+    """Fetch giá 1 mã trong [start_date, end_date] (mặc định tới hôm nay), None nếu không có dữ liệu"""
+    # Rate limit / retry / circuit breaker do provider (backend live) đảm nhiệm
     try:
-        yield db
-    finally:
-        db.close()
+        df_prices = get_provider().price_history(
+            symbol,
+            start=start_date,
+            end=end_date or str(date.today()),
+            interval="1D",
+            source="VCI"
+        )
+    except ValueError as e:
+        print(f"⚠️ {symbol}: không có dữ liệu hợp lệ ({e})")
+        df_prices = None
+    # lỗi khác (mạng, breaker) được ném lên: pipeline tính là lỗi, không nhầm với "không có dữ liệu"
 
+    if df_prices is None or df_prices.empty:
+        print(f"⚠️ Không có dữ liệu mới cho {symbol} từ {start_date}")
+        return None
 
-def fetch_and_save_symbol(symbol: str, row: dict, start_date: str):
-    """Xử lý 1 mã cổ phiếu: lưu company + giá"""
-    db = database.SessionLocal()
-    inserted_companies = 0
-    inserted_prices = 0
+    return prices_frame(symbol, df_prices)
+
+
+def fetch_symbol(symbol: str, row: dict, start_date: str, end_date: str | None = None):
+    """
+    Fetch 1 mã cổ phiếu (chỉ network, không ghi DB).
+    Trả về (company, DataFrame giá đã chuẩn hóa) cho writer của pipeline.
+    """
+    return company_from_row(symbol, row), fetch_prices(symbol, start_date, end_date)
+
+
+def fetch_range(symbol: str, start_date: str, end_date: str):
+    """Fetch 1 khoảng ngày bị thiếu của mã đã có (không cập nhật company)"""
+    return None, fetch_prices(symbol, start_date, end_date)
 
+
+def load_symbols():
+    """Lấy danh sách mã (HOSE, HNX, UPCOM) và tên cột mã cổ phiếu"""
     try:
-        # Insert thông tin công ty
-        try:
-            company = models.Company(
-                symbol=symbol,
-                exchange=row.get("exchange") or row.get("comGroupCode"),
-                name=row.get("organName") or row.get("companyName"),
-                industry=row.get("industryName") or row.get("icbName"),
-                website=None,
-                listing_date=None
-            )
-            db.merge(company)
-            db.commit()
-            inserted_companies += 1
-        except Exception as e:
-            db.rollback()
-            print(f"❌ Lỗi lưu company {symbol}: {e}")
+        df_symbols = get_provider().all_symbols(to_df=True)  # lấy toàn bộ HOSE, HNX, UPCOM
+    except Exception as e:
+        return None, None, {"error": f"Không fetch được danh sách symbols: {e}"}
 
-        # Delay ngẫu nhiên tránh rate-limit
-        time.sleep(random.uniform(1.0, 3.0))
+    # Detect tên cột mã cổ phiếu
+    for code_col in ("ticker", "symbol", "stockCode"):
+        if code_col in df_symbols.columns:
+            return df_symbols, code_col, None
+
+    return None, None, {"error": f"Không tìm thấy cột mã cổ phiếu trong {df_symbols.columns.tolist()}"}
 
-        stock = Vnstock().stock(symbol=symbol, source="VCI")
 
+def run_price_load(tasks, total=None, progress=None, fetch_fn=fetch_symbol, extra_dates=(), no_data=None) -> dict:
+    """
+    Chạy pipeline fetch/write cho danh sách task (mặc định (symbol, row, start_date)).
+    extra_dates: ngày đã ghi ngoài pipeline (bảng giá) cần tính lại market summary cùng.
+    no_data: list nhận các mã fetch thành công nhưng không có dữ liệu.
+    """
+    pipeline = PricePipeline(fetch_fn, fetch_workers=5, progress=progress)
+    result = pipeline.run(tasks, total=total)
+    if no_data is not None:
+        no_data.extend(pipeline.no_data)
+    cache = provider_stats()
+    if cache is not None:
+        result["stats"]["provider_cache"] = cache
+    days = pipeline.dates.union(extra_dates)
+    # đồng bộ sang bản sao Arrow (nếu bật PRICE_MIRROR) từ ngày sớm nhất vừa ghi, kể cả lịch sử cũ
+    if days:
+        mirror = sync_mirror(since=min(pd.to_datetime(list(days))).date())
+        if mirror is not None:
+            result["mirror"] = mirror
+    # tổng hợp thị trường cuối ngày cho các ngày vừa ghi
+    if days:
         try:
-            df_prices = stock.quote.history(
-                start=start_date,
-                end=str(date.today()),
-                interval="1D"
-            )
-        except ValueError as e:
-            print(f"⚠️ {symbol}: không có dữ liệu hợp lệ ({e})")
-            df_prices = None
+            result["market_summary"] = materialize_days(days)
         except Exception as e:
-            print(f"❌ Lỗi fetch giá {symbol}: {e}")
-            df_prices = None
+            print(f"❌ Lỗi tính market summary: {e}")
+            result["market_summary"] = {"error": str(e)}
+    return result
 
-        if df_prices is None or df_prices.empty:
-            print(f"⚠️ Không có dữ liệu mới cho {symbol} từ {start_date}")
-        else:
-            for _, p in df_prices.iterrows():
-                try:
-                    price = models.StockPrice(
-                        symbol=symbol,
-                        date=p["time"],
-                        open=p.get("open"),
-                        high=p.get("high"),
-                        low=p.get("low"),
-                        close=p.get("close"),
-                        volume=p.get("volume"),
-                        value=p.get("value"),
-                        change=p.get("change")
-                    )
-                    db.merge(price)
-                    db.commit()
-                    inserted_prices += 1
-                except Exception as e:
-                    db.rollback()
-                    print(f"❌ Lỗi lưu giá {symbol}: {e}")
-
-            print(f"✅ {symbol}: thêm {inserted_prices} bản ghi từ {start_date}")
 
+def run_full_load(progress=None):
+    df_symbols, code_col, error = load_symbols()
+    if error:
+        return error
+
+    tasks = ((row[code_col], row, "2008-01-01") for _, row in df_symbols.iterrows())
+    return run_price_load(tasks, total=len(df_symbols), progress=progress)
+
+
+def run_delta_load(progress=None):
+    df_symbols, code_col, error = load_symbols()
+    if error:
+        return error
+
+    # Lập kế hoạch: 1 câu query lấy max(date) của mọi mã, bỏ qua mã đã cập nhật
+    rows_by_symbol = {row[code_col]: row for _, row in df_symbols.iterrows()}
+    db = database.SessionLocal()
+    try:
+        plan = plan_delta_load(db, list(rows_by_symbol))
+    finally:
+        db.close()
+
+    # tới phiên đã đóng cửa: không ghi nến dở dang của hôm nay khi chạy trước 14:45
+    end = plan["last_trading_day"]
+    tasks = ((item["symbol"], rows_by_symbol[item["symbol"]], item["start_date"], end) for item in plan["to_fetch"])
+    no_data = []
+    result = run_price_load(tasks, total=len(plan["to_fetch"]), progress=progress, no_data=no_data)
+    # mã chưa từng có giá mà vẫn rỗng -> lần sau không hỏi lại từ FULL_LOAD_START
+    db = database.SessionLocal()
+    try:
+        record_no_data(db, no_data, date.fromisoformat(plan["last_trading_day"]))
     finally:
         db.close()
+    result["plan"] = {
+        "last_trading_day": plan["last_trading_day"],
+        "total": plan["total"],
+        "fetched": len(plan["to_fetch"]),
+        "up_to_date": plan["up_to_date"],
+    }
+    return result
 
-    return inserted_companies, inserted_prices
 
+def run_backfill(progress=None, symbols=None, since=None):
+    """Quét lỗ hổng theo lịch giao dịch rồi chỉ fetch lại đúng các khoảng thiếu"""
+    gaps = scan_gaps(symbols=symbols, since=date.fromisoformat(since) if since else None)
+    tasks = [(g["symbol"], g["start"].strftime("%Y-%m-%d"), g["end"].strftime("%Y-%m-%d")) for g in gaps]
+    result = run_price_load(tasks, total=len(tasks), progress=progress, fetch_fn=fetch_range)
+    result["gaps"] = summarize_gaps(gaps)
+    return result
 
-# ===================== API FULL LOAD =====================
-@router.post("/full_load")
-def full_load():
-    listing = Listing()
+
+def load_today_from_board(rows_by_symbol: dict, session_date: date, progress=None):
+    """
+    Lấy OHLCV trong ngày của nhiều mã mỗi request qua bảng giá, ghi 1 lần bulk upsert.
+    Trả về (số dòng đã ghi, danh sách mã không có trên bảng giá, lỗi).
+    """
+    md = get_provider()
+    symbols = list(rows_by_symbol)
+    frames, errors = [], []
+
+    for i in range(0, len(symbols), BOARD_CHUNK_SIZE):
+        if progress is not None and progress.cancelled():
+            break
+        chunk = symbols[i:i + BOARD_CHUNK_SIZE]
+        try:
+            board = md.price_board(chunk, session_date)
+        except Exception as e:
+            print(f"❌ Lỗi lấy bảng giá {chunk[0]}..{chunk[-1]}: {e}")
+            errors.append(f"board {chunk[0]}..{chunk[-1]}: {e}")
+            continue
+        board = board[board["symbol"].isin(chunk) & board["close"].notna() & (board["close"] > 0)]
+        frames.append(board)
+        if progress is not None:
+            progress.advance(len(board), current=chunk[-1])
+
+    found = set()
+    prices = 0
+    if frames:
+        df = pd.concat(frames, ignore_index=True).rename(columns={"time": "date"})
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+        found = set(df["symbol"])
+        merge_companies([company_from_row(s, rows_by_symbol[s]) for s in found])
+        try:
+            prices = bulk_upsert_prices(df.reindex(columns=PRICE_COLUMNS))
+        except PriceWriteError as e:
+            print(f"❌ Lỗi lưu giá bảng giá: {e}")
+            errors.append(str(e))
+            found = set()
+
+    missing = [s for s in symbols if s not in found]
+    return prices, missing, errors
+
+
+def run_today_load(progress=None, mode="board"):
+    """
+    Nạp giá của phiên gần nhất đã đóng cửa (last_closed_session). Trước 14:45 của 1 phiên thì đó là
+    phiên trước: không ghi bảng giá / nến dở dang của hôm nay thành giá cuối ngày.
+    Bảng giá chỉ dùng khi phiên đó là hôm nay (đã đóng cửa); ngược lại lấy history từng mã.
+    """
+    df_symbols, code_col, error = load_symbols()
+    if error:
+        return error
+
+    now = market_now()
+    session = last_closed_session(now)
+    day = session.strftime("%Y-%m-%d")
+    rows_by_symbol = {row[code_col]: row for _, row in df_symbols.iterrows()}
+    if progress is not None:
+        progress.start(len(rows_by_symbol))
+
+    if mode != "board" or session != now.date():
+        # từng mã một, chỉ ngày của phiên đã đóng cửa
+        tasks = ((s, row, day, day) for s, row in rows_by_symbol.items())
+        return {"date": day, "mode": mode if mode != "board" else "history", **run_price_load(tasks, progress=progress)}
+
+    board_prices, missing, board_errors = load_today_from_board(rows_by_symbol, session, progress)
+
+    # Fallback: mã không có trên bảng giá -> lấy history từng mã
+    tasks = ((s, rows_by_symbol[s], day, day) for s in missing)
+    if progress is not None and progress.cancelled():
+        tasks = ()  # bị hủy giữa chừng: không fallback từng mã
+    result = run_price_load(tasks, progress=progress, extra_dates=[session] if board_prices else ())
+    result["prices"] += board_prices
+    result["companies"] += len(rows_by_symbol) - len(missing)
+    result["errors"] = board_errors + result["errors"]
+    result["board"] = {"symbols": len(rows_by_symbol) - len(missing), "prices": board_prices,
+                       "fallback": len(missing)}
+    return {"date": day, "mode": mode, **result}
+
+
+def submit_job(kind: str, params: dict | None = None):
+    """Đưa job vào hàng đợi, trả job id; worker (python -m app.jobs) sẽ chạy"""
     try:
-        df_symbols = listing.all_symbols(to_df=True)  # lấy toàn bộ HOSE, HNX, UPCOM
-    except Exception as e:
-        return {"error": f"Không fetch được danh sách symbols: {e}"}
+        job = enqueue_job(kind, params)
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "job_id": e.job_id})
+    return {"job_id": job.id, "kind": job.kind, "status": job.status, "status_url": f"/jobs/{job.id}"}
 
-    # Detect tên cột mã cổ phiếu
-    if "ticker" in df_symbols.columns:
-        code_col = "ticker"
-    elif "symbol" in df_symbols.columns:
-        code_col = "symbol"
-    elif "stockCode" in df_symbols.columns:
-        code_col = "stockCode"
-    else:
-        return {"error": f"Không tìm thấy cột mã cổ phiếu trong {df_symbols.columns.tolist()}"}
-
-    total_companies, total_prices = 0, 0
-    errors = []
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        for _, row in df_symbols.iterrows():
-            symbol = row[code_col]
-            futures[executor.submit(fetch_and_save_symbol, symbol, row, "2008-01-01")] = symbol
-
-        for future in as_completed(futures):
-            symbol = futures[future]
-            try:
-                c, p = future.result()
-                total_companies += c
-                total_prices += p
-            except Exception as e:
-                print(f"❌ Không fetch được {symbol}: {e}")
-                errors.append(symbol)
 
-    return {
-        "companies": total_companies,
-        "prices": total_prices,
-        "errors": errors
-    }
+# ===================== API FULL LOAD =====================
+@router.post("/full_load", status_code=202)
+def full_load():
+    return submit_job("full_load")
 
 
 # ===================== API DELTA LOAD =====================
-@router.post("/delta_load")
+@router.post("/delta_load", status_code=202)
 def delta_load():
-    listing = Listing()
-    try:
-        df_symbols = listing.all_symbols(to_df=True)
-    except Exception as e:
-        return {"error": f"Không fetch được danh sách symbols: {e}"}
-
-    # Detect tên cột mã cổ phiếu
-    if "ticker" in df_symbols.columns:
-        code_col = "ticker"
-    elif "symbol" in df_symbols.columns:
-        code_col = "symbol"
-    elif "stockCode" in df_symbols.columns:
-        code_col = "stockCode"
-    else:
-        return {"error": f"Không tìm thấy cột mã cổ phiếu trong {df_symbols.columns.tolist()}"}
-
-    total_companies, total_prices = 0, 0
-    errors = []
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        for _, row in df_symbols.iterrows():
-            symbol = row[code_col]
-
-            # Xác định ngày bắt đầu = ngày cuối cùng trong DB +1
-            db = database.SessionLocal()
-            last_date = db.query(func.max(models.StockPrice.date)) \
-                          .filter(models.StockPrice.symbol == symbol) \
-                          .scalar()
-            db.close()
-
-            if last_date:
-                start_date = (last_date + timedelta(days=1)).strftime("%Y-%m-%d")
-            else:
-                start_date = "2008-01-01"
-
-            futures[executor.submit(fetch_and_save_symbol, symbol, row, start_date)] = symbol
-
-        for future in as_completed(futures):
-            symbol = futures[future]
-            try:
-                c, p = future.result()
-                total_companies += c
-                total_prices += p
-            except Exception as e:
-                print(f"❌ Không fetch được {symbol}: {e}")
-                errors.append(symbol)
+    return submit_job("delta_load")
 
-    return {
-        "companies": total_companies,
-        "prices": total_prices,
-        "errors": errors
-    }
 
 # ===================== API TODAY LOAD =====================
-@router.post("/today_load")
-def today_load():
-    listing = Listing()
-    try:
-        df_symbols = listing.all_symbols(to_df=True)
-    except Exception as e:
-        return {"error": f"Không fetch được danh sách symbols: {e}"}
-
-    # Detect tên cột mã cổ phiếu
-    if "ticker" in df_symbols.columns:
-        code_col = "ticker"
-    elif "symbol" in df_symbols.columns:
-        code_col = "symbol"
-    elif "stockCode" in df_symbols.columns:
-        code_col = "stockCode"
-    else:
-        return {"error": f"Không tìm thấy cột mã cổ phiếu trong {df_symbols.columns.tolist()}"}
-
-    today = date.today().strftime("%Y-%m-%d")
-    total_companies, total_prices = 0, 0
-    errors = []
-
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = {}
-        for _, row in df_symbols.iterrows():
-            symbol = row[code_col]
-            # chỉ lấy dữ liệu ngày hôm nay
-            futures[executor.submit(fetch_and_save_symbol, symbol, row, today)] = symbol
-
-        for future in as_completed(futures):
-            symbol = futures[future]
-            try:
-                c, p = future.result()
-                total_companies += c
-                total_prices += p
-            except Exception as e:
-                print(f"❌ Không fetch được {symbol}: {e}")
-                errors.append(symbol)
+@router.post("/today_load", status_code=202)
+def today_load(mode: str = Query(default="board", regex="^(board|history)$",
+                                 description="board: bảng giá nhiều mã/request; history: từng mã")):
+    return submit_job("today_load", {"mode": mode})
+
+
+# ===================== API BACKFILL (lấp khoảng thiếu) =====================
+@router.get("/gaps")
+def list_gaps(
+    symbols: str | None = Query(default=None, description="Danh sách mã, cách nhau dấu phẩy"),
+    since: str | None = Query(default=None, description="YYYY-MM-DD"),
+    limit: int = Query(default=500, ge=1, le=10000),
+):
+    symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else None
+    gaps = scan_gaps(symbols=symbol_list, since=date.fromisoformat(since) if since else None)
+    return {"data": gaps[:limit], "meta": {**summarize_gaps(gaps), "limit": limit}}
 
-    return {
-        "date": today,
-        "companies": total_companies,
-        "prices": total_prices,
-        "errors": errors
-    }
 
+@router.post("/backfill", status_code=202)
+def backfill(
+    symbols: str | None = Query(default=None, description="Danh sách mã, cách nhau dấu phẩy"),
+    since: str | None = Query(default=None, description="YYYY-MM-DD"),
+):
+    symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()] if symbols else None
+    return submit_job("backfill", {"symbols": symbol_list, "since": since})
 
 
 # ===================== GET API: COMPANIES =====================
-@router.get("/companies")
-def list_companies(
+COMPANY_COLUMNS = SEARCH_COLUMNS
+
+
+@router.get("/companies", response_class=FastJSONResponse)
+async def list_companies(
     q: str | None = Query(default=None, description="Tìm theo mã hoặc tên"),
     exchange: str | None = Query(default=None),
     industry: str | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=500),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.Company)
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(or_(models.Company.symbol.ilike(like),
-                                 models.Company.name.ilike(like)))
+    meta = {"limit": limit, "offset": offset}
+    if q and search_enabled():
+        # chỉ mục trong bộ nhớ: xếp hạng theo mã/tiền tố/chuỗi con, không dấu
+        search = get_company_search()
+        if search.needs_refresh():
+            await run_in_threadpool(search.refresh)
+        ids, total = search.index.search(q, exchange=exchange, industry=industry, limit=offset + limit)
+        return FastJSONResponse({"data": search.index.records(ids[offset:]), "meta": {"total": total, **meta}})
+
+    query = select(*[getattr(models.Company, c) for c in COMPANY_COLUMNS])
+    order = [models.Company.symbol.asc()]
+    if q and not await run_in_threadpool(sql_search_ready):
+        # DB chưa chạy migration 0002: ILIKE thường, sắp theo mã
+        pattern = f"%{q.strip()}%"
+        query = query.where(or_(models.Company.symbol.ilike(pattern), models.Company.name.ilike(pattern)))
+    elif q:
+        # Postgres: GIN trigram index trên lower(symbol) và f_unaccent(lower(name)) (migration 0002)
+        folded = fold(q)
+        symbol_col = func.lower(models.Company.symbol)
+        name_col = func.f_unaccent(func.lower(models.Company.name))
+        query = query.where(or_(symbol_col.like(f"%{folded}%"), name_col.like(f"%{folded}%")))
+        order = [case((symbol_col == folded, 0), (symbol_col.like(f"{folded}%"), 1), else_=2),
+                 func.similarity(name_col, folded).desc(), *order]
     if exchange:
-        query = query.filter(models.Company.exchange == exchange)
+        query = query.where(models.Company.exchange == exchange)
     if industry:
-        query = query.filter(models.Company.industry == industry)
+        query = query.where(models.Company.industry == industry)
 
-    total = query.count()
-    rows = query.order_by(models.Company.symbol.asc()).limit(limit).offset(offset).all()
-    return {"data": rows, "meta": {"total": total, "limit": limit, "offset": offset}}
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
+    rows = (await db.execute(query.order_by(*order).limit(limit).offset(offset))).all()
+    return FastJSONResponse({"data": rows_as_dicts(COMPANY_COLUMNS, rows), "meta": {"total": total, **meta}})
 
 
 @router.get("/companies/{symbol}")
-def get_company(symbol: str, db: Session = Depends(get_db)):
-    row = db.query(models.Company).get(symbol.upper())
+async def get_company(symbol: str, db: AsyncSession = Depends(get_async_db)):
+    row = await db.get(models.Company, symbol.upper())
     if not row:
         raise HTTPException(status_code=404, detail="Company not found")
     return row
 
 
+# ===================== GET API: GIÁ NHIỀU MÃ (DẠNG CỘT) =====================
+PRICE_FIELDS = ("open", "high", "low", "close", "volume", "value", "change")
+MAX_SYMBOLS = 200
+MAX_CELLS = 2_000_000  # số phiên x số mã x số trường tối đa mỗi request
+
+
+@router.get("/prices")
+async def get_prices_multi(
+    symbols: str = Query(..., description="Danh sách mã, cách nhau dấu phẩy"),
+    start: str | None = Query(default=None, description="YYYY-MM-DD (mặc định: 1 năm trước end)"),
+    end: str | None = Query(default=None, description="YYYY-MM-DD (mặc định: phiên gần nhất)"),
+    fields: str = Query(default="close", description="open,high,low,close,volume,value,change"),
+    ffill: bool = Query(default=False, description="Điền giá trị phiên trước cho phiên thiếu dữ liệu"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Giá nhiều mã trong 1 query, trả dạng cột: 1 mảng dates (các phiên theo lịch giao dịch)
+    và với mỗi mã, mỗi trường 1 mảng giá trị cùng độ dài (null nếu thiếu).
+    """
+    symbol_list = list(dict.fromkeys(x.strip().upper() for x in symbols.split(",") if x.strip()))
+    field_list = list(dict.fromkeys(x.strip().lower() for x in fields.split(",") if x.strip()))
+    bad = [f for f in field_list if f not in PRICE_FIELDS]
+    if not symbol_list or not field_list or bad:
+        raise HTTPException(status_code=422, detail=f"symbols/fields không hợp lệ {bad or ''}".strip())
+    if len(symbol_list) > MAX_SYMBOLS:
+        raise HTTPException(status_code=422, detail=f"Tối đa {MAX_SYMBOLS} mã mỗi request")
+
+    calendar = get_calendar()
+    try:
+        end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else calendar.last_session()
+        start_d = datetime.strptime(start, "%Y-%m-%d").date() if start else end_d - timedelta(days=365)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Sai định dạng ngày, dùng YYYY-MM-DD")
+
+    sessions = calendar.sessions_array(start_d, end_d)
+    if sessions.size * len(symbol_list) * len(field_list) > MAX_CELLS:
+        raise HTTPException(status_code=422, detail="Khoảng dữ liệu quá lớn, hãy thu hẹp ngày hoặc số mã")
+
+    rows = (await db.execute(
+        text(f"SELECT symbol, date, {', '.join(field_list)} FROM stock_prices "
+             f"WHERE symbol = ANY(:symbols) AND date >= :start AND date <= :end"),
+        {"symbols": symbol_list, "start": start_d, "end": end_d},
+    )).all()
+    df = pd.DataFrame(rows, columns=["symbol", "date", *field_list])
+
+    # Căn theo lịch: vị trí phiên của từng dòng, bỏ dòng rơi vào ngày không phải phiên
+    grid = {f: np.full((len(symbol_list), sessions.size), np.nan) for f in field_list}
+    if not df.empty and sessions.size:
+        dates = pd.to_datetime(df["date"]).to_numpy().astype("datetime64[D]")
+        col = np.searchsorted(sessions, dates)
+        ok = (col < sessions.size) & (sessions[np.minimum(col, sessions.size - 1)] == dates)
+        row = pd.Categorical(df["symbol"], categories=symbol_list).codes
+        ok &= row >= 0
+        for f in field_list:
+            grid[f][row[ok], col[ok]] = pd.to_numeric(df[f], errors="coerce").to_numpy(dtype="f8")[ok]
+
+    if ffill and sessions.size:
+        for f in field_list:
+            values = grid[f]
+            idx = np.where(np.isnan(values), 0, np.arange(sessions.size))
+            np.maximum.accumulate(idx, axis=1, out=idx)
+            grid[f] = values[np.arange(len(symbol_list))[:, None], idx]
+
+    def _column(values, field):
+        if field in ("volume", "value"):
+            return [None if v != v else int(v) for v in values.tolist()]
+        return [None if v != v else v for v in values.tolist()]
+
+    return {
+        "dates": sessions.astype(str).tolist(),
+        "fields": field_list,
+        "data": {s: {f: _column(grid[f][i], f) for f in field_list} for i, s in enumerate(symbol_list)},
+        "meta": {"start": start_d, "end": end_d, "sessions": int(sessions.size), "ffill": ffill,
+                 "missing": [s for s in symbol_list if df.empty or s not in set(df["symbol"])]},
+    }
+
+
+# ===================== GET API: GIÁ MỚI NHẤT NHIỀU MÃ =====================
+# Khai báo trước /prices/{symbol} để "latest" không bị hiểu là mã
+@router.get("/prices/latest", response_class=FastJSONResponse)
+async def get_latest_prices(
+    request: Request,
+    symbols: str | None = Query(default=None, description="Danh sách mã, cách nhau dấu phẩy"),
+    exchange: str | None = Query(default=None, description="HOSE|HNX|UPCOM"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Phiên gần nhất + giá đóng cửa phiên trước + % thay đổi của nhiều mã trong 1 request"""
+    not_modified, etag = await conditional_get(request, db, ("latest", "all"))
+    if not_modified:
+        return not_modified
+
+    snapshot = latest_snapshot()
+    if snapshot is None:
+        stmt = (select(*[getattr(models.LatestPrice, c) for c in LATEST_COLUMNS], models.Company.exchange)
+                .outerjoin(models.Company, models.Company.symbol == models.LatestPrice.symbol)
+                .order_by(models.LatestPrice.symbol))
+        rows = (await db.execute(stmt)).all()
+        if not rows:
+            # DB cũ chưa có latest_prices -> dựng từ stock_prices (1 lần)
+            await run_in_threadpool(rebuild_latest_prices)
+            rows = (await db.execute(stmt)).all()
+        snapshot = store_latest_snapshot(rows)
+
+    missing = []
+    if symbols:
+        symbol_list = list(dict.fromkeys(x.strip().upper() for x in symbols.split(",") if x.strip()))
+        data = [snapshot.by_symbol[s] for s in symbol_list if s in snapshot.by_symbol]
+        missing = [s for s in symbol_list if s not in snapshot.by_symbol]
+    elif exchange:
+        data = snapshot.by_exchange.get(exchange, [])
+    else:
+        data = snapshot.records
+    return FastJSONResponse({"data": data, "meta": {"count": len(data), "missing": missing}}, headers=etag)
+
+
 # ===================== GET API: DAILY PRICES (OHLCV) =====================
-@router.get("/prices/{symbol}")
-def get_prices(
+PRICE_ROW_COLUMNS = ("symbol", "date", *PRICE_FIELDS)
+
+
+def _price_columns(model=models.StockPrice):
+    return [getattr(model, c) for c in PRICE_ROW_COLUMNS]
+
+
+@router.get("/prices/{symbol}", response_class=FastJSONResponse)
+async def get_prices(
+    request: Request,
     symbol: str,
     start: str | None = Query(default=None, description="YYYY-MM-DD"),
     end: str | None = Query(default=None, description="YYYY-MM-DD"),
     order: str = Query(default="asc", regex="^(?i)(asc|desc)$"),
     limit: int = Query(default=200, ge=1, le=5000),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: str | None = Query(default=None, description="next_cursor của trang trước (thay cho offset)"),
+    total: str | None = Query(default=None, regex="^(exact|estimate)$", description="Tính tổng số dòng"),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(models.StockPrice).filter(models.StockPrice.symbol == symbol.upper())
-    if start:
-        q = q.filter(models.StockPrice.date >= datetime.strptime(start, "%Y-%m-%d").date())
-    if end:
-        q = q.filter(models.StockPrice.date <= datetime.strptime(end, "%Y-%m-%d").date())
-
-    q = q.order_by(models.StockPrice.date.desc() if order.lower() == "desc" else models.StockPrice.date.asc())
-    total = q.count()
-    rows = q.limit(limit).offset(offset).all()
-    return {"data": rows, "meta": {"total": total, "limit": limit, "offset": offset}}
-
-
-@router.get("/prices/{symbol}/latest")
-def get_latest_price(symbol: str, db: Session = Depends(get_db)):
-    row = (db.query(models.StockPrice)
-           .filter(models.StockPrice.symbol == symbol.upper())
-           .order_by(models.StockPrice.date.desc())
-           .first())
+    symbol = symbol.upper()
+    desc = order.lower() == "desc"
+    start_d = datetime.strptime(start, "%Y-%m-%d").date() if start else None
+    end_d = datetime.strptime(end, "%Y-%m-%d").date() if end else None
+    meta = {"limit": limit, "offset": offset, "next_cursor": None}
+    # Khoảng ngày không có phiên nào (cuối tuần, nghỉ lễ) -> khỏi truy vấn
+    if start_d and end_d and get_calendar().count_between(start_d, end_d) == 0:
+        return FastJSONResponse({"data": [], "meta": {**meta, "total": 0}})
+
+    # ETag theo version giá của mã: client gửi lại If-None-Match -> 304, không chạy query chính
+    not_modified, etag = await conditional_get(request, db, ("prices", symbol))
+    if not_modified:
+        return not_modified
+
+    after = None
+    if cursor:
+        try:
+            key = decode_cursor(cursor, "prices")
+            after = date.fromisoformat(key["d"])
+        except (CursorError, KeyError, ValueError) as e:
+            raise HTTPException(status_code=422, detail=str(e) or "cursor không hợp lệ")
+        if key.get("s") != symbol or key.get("o") != order.lower():
+            raise HTTPException(status_code=422, detail="cursor không dùng cho truy vấn này")
+        offset = meta["offset"] = 0
+
+    if cache_enabled():
+        # cắt khoảng ngày + phân trang trên mảng đã cache, không truy vấn DB
+        # lần đầu/làm mới sẽ đọc DB bằng engine đồng bộ -> chạy trong threadpool
+        version = request.state.dataset_versions[("prices", symbol)]
+        rows = slice_range(await run_in_threadpool(get_price_cache().get, symbol, version), start_d, end_d)
+        if total:
+            meta["total"] = int(rows.size)
+        if after is not None:
+            rows = slice_range(rows, end=after - timedelta(days=1)) if desc else \
+                slice_range(rows, start=after + timedelta(days=1))
+        if desc:
+            rows = rows[::-1]
+        page = rows[offset:offset + limit]
+        if offset + limit < rows.size:
+            meta["next_cursor"] = encode_cursor(k="prices", s=symbol, o=order.lower(), d=page["date"][-1])
+        return FastJSONResponse({"data": to_records(symbol, page), "meta": meta}, headers=etag)
+
+    q = select(*_price_columns()).where(models.StockPrice.symbol == symbol)
+    if start_d:
+        q = q.where(models.StockPrice.date >= start_d)
+    if end_d:
+        q = q.where(models.StockPrice.date <= end_d)
+    if total:
+        meta["total"] = await total_for_async(total, db, q, ("prices", symbol, start_d, end_d))
+    if after is not None:
+        q = q.where(models.StockPrice.date < after if desc else models.StockPrice.date > after)
+
+    q = q.order_by(models.StockPrice.date.desc() if desc else models.StockPrice.date.asc())
+    rows = (await db.execute(q.limit(limit + 1).offset(offset))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        meta["next_cursor"] = encode_cursor(k="prices", s=symbol, o=order.lower(), d=rows[-1].date)
+    return FastJSONResponse({"data": rows_as_dicts(PRICE_ROW_COLUMNS, rows), "meta": meta}, headers=etag)
+
+
+@router.get("/prices/{symbol}/latest", response_class=FastJSONResponse)
+async def get_latest_price(request: Request, symbol: str, db: AsyncSession = Depends(get_async_db)):
+    not_modified, etag = await conditional_get(request, db, ("prices", symbol.upper()))
+    if not_modified:
+        return not_modified
+
+    if cache_enabled():
+        version = request.state.dataset_versions[("prices", symbol.upper())]
+        rows = await run_in_threadpool(get_price_cache().get, symbol.upper(), version)
+        if not rows.size:
+            raise HTTPException(status_code=404, detail="No price found")
+        return FastJSONResponse(to_records(symbol.upper(), rows[-1:])[0], headers=etag)
+
+    # bảng latest_prices (1 dòng / mã); mã chưa có trong bảng thì lấy thẳng từ stock_prices
+    row = (await db.execute(select(*_price_columns(models.LatestPrice))
+                            .where(models.LatestPrice.symbol == symbol.upper()))).first()
+    if not row:
+        row = (await db.execute(select(*_price_columns())
+                                .where(models.StockPrice.symbol == symbol.upper())
+                                .order_by(models.StockPrice.date.desc())
+                                .limit(1))).first()
     if not row:
         raise HTTPException(status_code=404, detail="No price found")
-    return row
+    return FastJSONResponse(dict(zip(PRICE_ROW_COLUMNS, row)), headers=etag)
+
+
+# ===================== GET API: NẾN INTRADAY (1m/5m/15m) =====================
+@router.get("/bars/{symbol}")
+async def get_bars(
+    symbol: str,
+    interval: str = Query(default="1m", regex="^(1m|5m|15m)$"),
+    start: str | None = Query(default=None, description="YYYY-MM-DD hoặc YYYY-MM-DDTHH:MM"),
+    end: str | None = Query(default=None, description="YYYY-MM-DD hoặc YYYY-MM-DDTHH:MM"),
+    order: str = Query(default="asc", regex="^(?i)(asc|desc)$"),
+    limit: int = Query(default=500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Nến đọc thẳng từ bảng intraday_bars (nến cuối có closed=false là nến đang mở)"""
+    try:
+        start_dt = datetime.fromisoformat(start) if start else None
+        end_dt = datetime.fromisoformat(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Sai định dạng thời gian, dùng ISO 8601")
+    if end_dt is not None and len(end) == 10:
+        end_dt += timedelta(days=1)  # end chỉ có ngày -> lấy hết ngày đó
+
+    q = select(models.IntradayBar).where(models.IntradayBar.symbol == symbol.upper(),
+                                         models.IntradayBar.interval == interval)
+    if start_dt:
+        q = q.where(models.IntradayBar.start >= start_dt)
+    if end_dt:
+        q = q.where(models.IntradayBar.start < end_dt if len(end) == 10 else models.IntradayBar.start <= end_dt)
+
+    q = q.order_by(models.IntradayBar.start.desc() if order.lower() == "desc" else models.IntradayBar.start.asc())
+    rows = (await db.scalars(q.limit(limit))).all()
+    return {"data": rows, "meta": {"symbol": symbol.upper(), "interval": interval, "limit": limit}}
 
 
 # ===================== GET API: TỔNG HỢP THEO NGÀY & SÀN =====================
-@router.get("/daily")
-def get_daily_by_exchange(
+DAILY_COLUMNS = ("symbol", "company_name", "exchange", "date", *PRICE_FIELDS)
+TOP_LIST_COLUMNS = ("rank", *DAILY_COLUMNS, "change_pct")
+SUMMARY_COLUMNS = ("symbols", "advancers", "decliners", "unchanged", "total_volume", "total_value")
+
+
+async def _fresh_market_summary(db: AsyncSession, day: date, scope: str):
+    """Dòng daily_market_summary của (ngày, sàn) nếu được tính sau lần ghi giá cuối của ngày đó"""
+    written = (select(models.DatasetVersion.updated_at)
+               .where(models.DatasetVersion.dataset == "daily", models.DatasetVersion.key == str(day))
+               .scalar_subquery())
+    return (await db.execute(
+        select(*[getattr(models.DailyMarketSummary, c) for c in SUMMARY_COLUMNS])
+        .where(models.DailyMarketSummary.date == day, models.DailyMarketSummary.exchange == scope,
+               models.DailyMarketSummary.updated_at >= func.coalesce(written, models.DailyMarketSummary.updated_at))
+    )).first()
+
+
+async def _top_list_page(db: AsyncSession, day: date, exchange, order_by: str, order: str, limit: int, meta: dict):
+    """Trang đầu của /daily sắp theo volume|value giảm dần, đọc từ daily_top_lists (None nếu chưa có)"""
+    top = models.DailyTopList
+    rows = (await db.execute(
+        select(*[getattr(top, c) for c in DAILY_COLUMNS])
+        .where(top.date == day, top.scope == (exchange or "ALL"), top.list == order_by, top.rank <= limit + 1)
+        .order_by(top.rank)
+    )).all()
+    if not rows:
+        return None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        value = getattr(last, order_by)
+        meta["next_cursor"] = encode_cursor(k="daily", d=day, x=exchange, b=order_by, o=order.lower(), s=last.symbol,
+                                            v=float("-inf") if value is None else float(value))
+    return rows_as_dicts(DAILY_COLUMNS, rows)
+
+
+@router.get("/daily", response_class=FastJSONResponse)
+async def get_daily_by_exchange(
+    request: Request,
     date_str: str = Query(..., alias="date", description="YYYY-MM-DD"),
     exchange: str | None = Query(default=None, description="HOSE|HNX|UPCOM"),
     order_by: str = Query(default="symbol", regex="^(?i)(symbol|volume|value|change|close)$"),
     order: str = Query(default="asc", regex="^(?i)(asc|desc)$"),
     limit: int = Query(default=500, ge=1, le=5000),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db)
+    cursor: str | None = Query(default=None, description="next_cursor của trang trước (thay cho offset)"),
+    total: str | None = Query(default=None, regex="^(exact|estimate)$", description="Tính tổng số dòng"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Trả về toàn bộ thông tin giao dịch (OHLCV) của *một ngày*,
     có thể lọc theo sàn (exchange). Kết hợp bảng companies + stock_prices.
+    Phân trang bằng cursor (khóa = cột sắp xếp + symbol) hoặc offset.
     """
     try:
         day = datetime.strptime(date_str, "%Y-%m-%d").date()
     except ValueError:
         raise HTTPException(status_code=422, detail="Sai định dạng ngày, dùng YYYY-MM-DD")
 
+    order_by, desc = order_by.lower(), order.lower() == "desc"
+    meta = {"limit": limit, "offset": offset, "next_cursor": None}
+
+    # Ngày không giao dịch -> trả rỗng ngay, kèm phiên gần nhất trước đó
+    calendar = get_calendar()
+    if not calendar.is_session(day):
+        return FastJSONResponse({"data": [], "meta": {**meta, "total": 0, "trading_day": False,
+                                                      "previous_trading_day": calendar.previous(day)}})
+
+    # ETag theo version của ngày (giá) + companies (tên, sàn) + market summary (tổng, top list)
+    not_modified, etag = await conditional_get(request, db, ("daily", str(day)), ("companies", "all"),
+                                               ("market_summary", str(day)))
+    if not_modified:
+        return not_modified
+
+    # Tổng số dòng và trang đầu order_by=volume|value (desc) lấy từ bảng tính sẵn nếu còn mới
+    top_page = order_by in ("volume", "value") and desc and not cursor and offset == 0 and limit < MARKET_TOP_N
+    summary = await _fresh_market_summary(db, day, exchange or "ALL") if total or top_page else None
+    if summary is not None:
+        if total:
+            meta["total"] = summary.symbols
+        if top_page:
+            top = await _top_list_page(db, day, exchange, order_by, order, limit, meta)
+            if top is not None:
+                return FastJSONResponse({"data": top, "meta": meta}, headers=etag)
+
     # Chọn cột cần thiết
-    q = (db.query(
+    q = (select(
             models.StockPrice.symbol,
             models.Company.name.label("company_name"),
             models.Company.exchange,
@@ -349,41 +714,102 @@ def get_daily_by_exchange(
             models.StockPrice.change
         )
         .join(models.Company, models.Company.symbol == models.StockPrice.symbol)
-        .filter(models.StockPrice.date == day)
+        .where(models.StockPrice.date == day)
     )
 
     if exchange:
-        q = q.filter(models.Company.exchange == exchange)
-
-    # Map trường sắp xếp
-    order_map = {
-        "symbol": models.StockPrice.symbol,
-        "volume": models.StockPrice.volume,
-        "value":  models.StockPrice.value,
-        "change": models.StockPrice.change,
-        "close":  models.StockPrice.close,
-    }
-    order_col = order_map[order_by.lower()]
-    q = q.order_by(order_col.desc() if order.lower() == "desc" else order_col.asc())
-
-    total = q.count()
-    rows = q.limit(limit).offset(offset).all()
-
-    # Chuẩn hóa output thành list[dict]
-    data = []
-    for r in rows:
-        data.append({
-            "symbol": r.symbol,
-            "company_name": r.company_name,
-            "exchange": r.exchange,
-            "date": r.date,
-            "open": r.open,
-            "high": r.high,
-            "low": r.low,
-            "close": r.close,
-            "volume": r.volume,
-            "value": r.value,
-            "change": r.change
-        })
-
-    return {"data": data, "meta": {"total": total, "limit": limit, "offset": offset}}
+        q = q.where(models.Company.exchange == exchange)
+    if total and "total" not in meta:
+        meta["total"] = await total_for_async(total, db, q, ("daily", day, exchange))
+
+    # Khóa sắp xếp: (cột, symbol); NULL luôn nằm cuối để so sánh tuple được
+    if order_by == "symbol":
+        sort_key = None
+    else:
+        sort_key = func.coalesce(cast(getattr(models.StockPrice, order_by), Float),
+                                 float("-inf") if desc else float("inf"))
+
+    if cursor:
+        try:
+            key = decode_cursor(cursor, "daily")
+            if (key["d"], key["x"], key["b"], key["o"]) != (str(day), exchange, order_by, order.lower()):
+                raise CursorError("cursor không dùng cho truy vấn này")
+        except (CursorError, KeyError) as e:
+            raise HTTPException(status_code=422, detail=str(e) or "cursor không hợp lệ")
+        offset = meta["offset"] = 0
+        if sort_key is None:
+            q = q.where(models.StockPrice.symbol < key["s"] if desc else models.StockPrice.symbol > key["s"])
+        else:
+            last = tuple_(literal(float(key["v"]), Float), literal(key["s"]))
+            current = tuple_(sort_key, models.StockPrice.symbol)
+            q = q.where(current < last if desc else current > last)
+
+    columns = [models.StockPrice.symbol] if sort_key is None else [sort_key, models.StockPrice.symbol]
+    q = q.order_by(*[c.desc() if desc else c.asc() for c in columns])
+    if sort_key is not None:
+        q = q.add_columns(sort_key.label("sort_value"))
+
+    rows = (await db.execute(q.limit(limit + 1).offset(offset))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        meta["next_cursor"] = encode_cursor(k="daily", d=day, x=exchange, b=order_by, o=order.lower(), s=last.symbol,
+                                            v=None if sort_key is None else last.sort_value)
+
+    # Dòng tuple -> dict (cột sort_value thêm cho cursor nằm cuối nên bị zip bỏ qua)
+    return FastJSONResponse({"data": rows_as_dicts(DAILY_COLUMNS, rows), "meta": meta}, headers=etag)
+
+
+@router.get("/market-summary", response_class=FastJSONResponse)
+async def get_market_summary(
+    request: Request,
+    date_str: str | None = Query(default=None, alias="date", description="YYYY-MM-DD (mặc định: phiên gần nhất)"),
+    exchange: str | None = Query(default=None, description="HOSE|HNX|UPCOM (mặc định: mọi sàn + ALL)"),
+    top: int = Query(default=10, ge=0, le=100, description="Số mã mỗi danh sách top"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Tổng hợp thị trường 1 ngày theo sàn: số mã tăng / giảm / đứng giá, tổng khối lượng, giá trị
+    và top gainers / losers / volume / value. Đọc từ bảng tính sẵn sau mỗi lần nạp giá.
+    """
+    calendar = get_calendar()
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Sai định dạng ngày, dùng YYYY-MM-DD")
+    else:
+        day = calendar.last_session()
+
+    if not calendar.is_session(day):
+        return FastJSONResponse({"date": day, "trading_day": False,
+                                 "previous_trading_day": calendar.previous(day), "exchanges": {}})
+
+    not_modified, etag = await conditional_get(request, db, ("market_summary", str(day)))
+    if not_modified:
+        return not_modified
+
+    summary_q = select(models.DailyMarketSummary.exchange,
+                       *[getattr(models.DailyMarketSummary, c) for c in SUMMARY_COLUMNS]) \
+        .where(models.DailyMarketSummary.date == day)
+    if exchange:
+        summary_q = summary_q.where(models.DailyMarketSummary.exchange == exchange)
+    summaries = (await db.execute(summary_q)).all()
+    if not summaries and not (await db.execute(
+            select(models.DailyMarketSummary.exchange).where(models.DailyMarketSummary.date == day).limit(1))).first():
+        # ngày chưa được tính (DB cũ, hoặc dữ liệu nạp trước khi có bảng này) -> tính 1 lần
+        await run_in_threadpool(materialize_days, [day])
+        summaries = (await db.execute(summary_q)).all()
+
+    exchanges = {r.exchange: {**dict(zip(SUMMARY_COLUMNS, r[1:])), "top": {}} for r in summaries}
+    if top and exchanges:
+        tl = models.DailyTopList
+        rows = (await db.execute(
+            select(tl.scope, tl.list, *[getattr(tl, c) for c in TOP_LIST_COLUMNS])
+            .where(tl.date == day, tl.scope.in_(list(exchanges)), tl.rank <= top)
+            .order_by(tl.scope, tl.list, tl.rank)
+        )).all()
+        for r in rows:
+            exchanges[r.scope]["top"].setdefault(r.list, []).append(dict(zip(TOP_LIST_COLUMNS, r[2:])))
+
+    return FastJSONResponse({"date": day, "trading_day": True, "exchanges": exchanges}, headers=etag)
@@ -0,0 +1,87 @@
+"""
+Serialize JSON nhanh cho các API đọc nhiều dòng.
+
+Endpoint chọn cột dạng tuple (không dựng ORM object), ghép dict bằng zip rồi trả thẳng
+FastJSONResponse (orjson) nên FastAPI bỏ qua jsonable_encoder / validate từng dòng.
+orjson hiểu sẵn date, datetime và số numpy; NaN ra null. Không có orjson thì dùng json chuẩn.
+
+Benchmark 1 trang 5.000 dòng, trước (ORM + jsonable_encoder) và sau (tuple + orjson), không cần DB:
+    python -m app.serialization --rows 5000
+Kết quả đo (orjson, trung vị 20 lần, 1 vCPU): trước 278.0 ms, sau 12.8 ms (~22x).
+Lần đo khác trên cùng máy: 292.9 ms / 12.8 ms; lúc commit đầu: 236 ms / 9.6 ms (dao động theo tải máy).
+"""
+import json
+import time
+from decimal import Decimal
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Không serialize được {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Trả thẳng từ endpoint: content đã là dict/list thuần, không qua jsonable_encoder"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def rows_as_dicts(columns, rows) -> list:
+    """Dòng dạng tuple (Row của SQLAlchemy) -> list dict theo tên cột"""
+    return [dict(zip(columns, r)) for r in rows]
+
+
+# ================== Benchmark ==================
+def run_benchmark(rows: int = 5000, repeat: int = 20) -> dict:
+    from datetime import date, timedelta
+    from fastapi.encoders import jsonable_encoder
+    from .models import StockPrice
+
+    columns = ("symbol", "date", "open", "high", "low", "close", "volume", "value", "change")
+    start = date(2005, 1, 3)
+    tuples = [("VNM", start + timedelta(days=i), 80.1 + i % 7, 81.5 + i % 7, 79.2 + i % 7, 80.8 + i % 7,
+               1_250_000 + i, 101_000_000_000 + i, 0.35) for i in range(rows)]
+    objects = [StockPrice(**dict(zip(columns, t))) for t in tuples]
+    meta = {"limit": rows, "offset": 0, "next_cursor": None}
+
+    def _time(fn):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - t0)
+        samples.sort()
+        return round(samples[len(samples) // 2] * 1000, 2)
+
+    before = _time(lambda: JSONResponse(jsonable_encoder({"data": objects, "meta": meta})).body)
+    after = _time(lambda: FastJSONResponse({"data": rows_as_dicts(columns, tuples), "meta": meta}).body)
+    return {"rows": rows, "backend": "orjson" if orjson else "json",
+            "before_ms": before, "after_ms": after, "speedup": round(before / after, 1) if after else None}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark serialize 1 trang giá")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(run_benchmark(args.rows, args.repeat))
@@ -0,0 +1,220 @@
+"""
+Lịch giao dịch.
+
+Các ngày đã có dữ liệu lấy từ bảng trading_days (dựng từ DISTINCT date của stock_prices);
+ngoài khoảng đó (tương lai, hôm nay) dùng quy tắc: thứ 2-6 và không nằm trong danh sách nghỉ lễ.
+Ngày lễ cấu hình qua MARKET_HOLIDAYS="2025-01-01,2025-04-30" và/hoặc
+MARKET_HOLIDAYS_FILE=đường dẫn file JSON (list ngày YYYY-MM-DD).
+Giờ giao dịch (khớp lệnh liên tục + ATC) theo giờ Việt Nam: 09:00-11:30 và 13:00-14:45.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from sqlalchemy import text
+
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SECONDS = 300
+
+MARKET_TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+SESSION_HOURS = ((dtime(9, 0), dtime(11, 30)), (dtime(13, 0), dtime(14, 45)))
+
+# Câu SQL thêm ngày giao dịch từ 1 bảng/subquery có cột date (bỏ cuối tuần)
+INSERT_TRADING_DAYS_SQL = (
+    "INSERT INTO trading_days (date) "
+    "SELECT DISTINCT date FROM {source} WHERE EXTRACT(ISODOW FROM date) < 6 "
+    "ON CONFLICT (date) DO NOTHING"
+)
+
+
+def load_holidays() -> set:
+    days = {d.strip() for d in os.getenv("MARKET_HOLIDAYS", "").split(",") if d.strip()}
+    path = os.getenv("MARKET_HOLIDAYS_FILE")
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            days.update(json.load(f))
+    return {date.fromisoformat(d) for d in days}
+
+
+HOLIDAYS = load_holidays()
+
+
+def rule_session(d: date, holidays=HOLIDAYS) -> bool:
+    """Quy tắc khi không có dữ liệu: thứ 2-6 và không phải ngày lễ"""
+    return d.weekday() < 5 and d not in holidays
+
+
+class TradingCalendar:
+    """Index trong bộ nhớ: mảng datetime64[D] đã sắp xếp, tra cứu bằng searchsorted"""
+
+    def __init__(self, days, holidays=None):
+        self.holidays = HOLIDAYS if holidays is None else set(holidays)
+        arr = np.array(sorted(d for d in days if d not in self.holidays), dtype="datetime64[D]")
+        self._days = arr
+        self.first = arr[0].astype(date) if arr.size else None
+        self.last = arr[-1].astype(date) if arr.size else None
+
+    def _known(self, d: date) -> bool:
+        return self.first is not None and self.first <= d <= self.last
+
+    def is_session(self, d: date) -> bool:
+        if not self._known(d):
+            return rule_session(d, self.holidays)
+        i = np.searchsorted(self._days, np.datetime64(d, "D"))
+        return i < self._days.size and self._days[i] == np.datetime64(d, "D")
+
+    def previous(self, d: date) -> date:
+        """Phiên giao dịch gần nhất trước ngày d"""
+        d = d - timedelta(days=1)
+        while not self._known(d):
+            if rule_session(d, self.holidays):
+                return d
+            d -= timedelta(days=1)
+        i = np.searchsorted(self._days, np.datetime64(d, "D"), side="right")
+        return self._days[i - 1].astype(date)
+
+    def next(self, d: date) -> date:
+        """Phiên giao dịch gần nhất sau ngày d"""
+        d = d + timedelta(days=1)
+        while not self._known(d):
+            if rule_session(d, self.holidays):
+                return d
+            d += timedelta(days=1)
+        i = np.searchsorted(self._days, np.datetime64(d, "D"))
+        return self._days[i].astype(date)
+
+    def last_session(self, d: date | None = None) -> date:
+        """Phiên gần nhất tính cả ngày d"""
+        d = d or date.today()
+        return d if self.is_session(d) else self.previous(d)
+
+    def between(self, start: date, end: date) -> list:
+        """Danh sách phiên trong [start, end]"""
+        return [x.astype(date) for x in self.sessions_array(start, end)]
+
+    def sessions_array(self, start: date, end: date) -> np.ndarray:
+        """Như between() nhưng trả mảng datetime64[D] (dùng cho xử lý vector)"""
+        if start > end:
+            return np.array([], dtype="datetime64[D]")
+        parts = []
+        if self.first is None or start < self.first:
+            rule_end = end if self.first is None else min(end, self.first - timedelta(days=1))
+            parts.append(self._rule_range(start, rule_end))
+        if self.first is not None:
+            lo = np.searchsorted(self._days, np.datetime64(max(start, self.first), "D"))
+            hi = np.searchsorted(self._days, np.datetime64(end, "D"), side="right")
+            parts.append(self._days[lo:hi])
+            if end > self.last:
+                parts.append(self._rule_range(max(start, self.last + timedelta(days=1)), end))
+        return np.concatenate(parts) if parts else np.array([], dtype="datetime64[D]")
+
+    def count_between(self, start: date, end: date) -> int:
+        return int(self.sessions_array(start, end).size)
+
+    def _rule_range(self, start: date, end: date) -> np.ndarray:
+        if start > end:
+            return np.array([], dtype="datetime64[D]")
+        days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+        mask = np.is_busday(days)
+        if self.holidays:
+            mask &= ~np.isin(days, np.array(sorted(self.holidays), dtype="datetime64[D]"))
+        return days[mask]
+
+
+def rebuild_trading_days(db=None) -> int:
+    """Dựng lại bảng trading_days từ DISTINCT date của stock_prices"""
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        db.execute(text(INSERT_TRADING_DAYS_SQL.format(source="stock_prices")))
+        db.commit()
+        count = db.execute(text("SELECT count(*) FROM trading_days")).scalar()
+        logger.info("📅 trading_days: %d phiên", count)
+        return count
+    finally:
+        if own:
+            db.close()
+
+
+def _load_calendar() -> TradingCalendar:
+    db = SessionLocal()
+    try:
+        rows = db.execute(text("SELECT date FROM trading_days ORDER BY date")).all()
+        if not rows:
+            rebuild_trading_days(db)
+            rows = db.execute(text("SELECT date FROM trading_days ORDER BY date")).all()
+        return TradingCalendar([r[0] for r in rows])
+    finally:
+        db.close()
+
+
+_calendar = None
+_loaded_at = 0.0
+_refreshing = False
+_lock = threading.Lock()
+
+
+def _reload_calendar():
+    """Đọc lại trading_days (sync); lỗi DB thì giữ lịch cũ / lịch theo quy tắc"""
+    global _calendar, _loaded_at, _refreshing
+    try:
+        calendar = _load_calendar()
+    except Exception as e:
+        # DB chưa sẵn sàng -> dùng quy tắc thứ 2-6 / ngày lễ
+        logger.warning("Không tải được trading_days (%s), dùng lịch theo quy tắc", e)
+        calendar = None
+    with _lock:
+        _calendar = calendar or _calendar or TradingCalendar([])
+        _loaded_at = time.monotonic()
+        _refreshing = False
+        return _calendar
+
+
+def get_calendar() -> TradingCalendar:
+    """Calendar dùng chung trong process, tự làm mới sau REFRESH_SECONDS.
+
+    Chỉ lần nạp đầu (startup) đọc DB trong luồng gọi. Khi lịch cũ quá hạn, việc đọc lại chạy ở
+    thread nền và lời gọi trả ngay lịch hiện có -> endpoint async không bị chặn event loop.
+    """
+    global _refreshing
+    with _lock:
+        calendar = _calendar
+        stale = time.monotonic() - _loaded_at > REFRESH_SECONDS
+        if calendar is not None and stale and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_reload_calendar, name="calendar-refresh", daemon=True).start()
+    return calendar if calendar is not None else _reload_calendar()
+
+
+def market_now() -> datetime:
+    """Giờ hiện tại theo giờ Việt Nam (naive, cùng quy ước với cột TIMESTAMP)"""
+    return datetime.now(MARKET_TZ).replace(tzinfo=None)
+
+
+def last_closed_session(at: datetime | None = None) -> date:
+    """Phiên gần nhất đã đóng cửa (hôm nay chỉ tính sau 14:45 giờ Việt Nam)"""
+    at = at or market_now()
+    calendar = get_calendar()
+    if calendar.is_session(at.date()) and at.time() > SESSION_HOURS[-1][1]:
+        return at.date()
+    return calendar.previous(at.date())
+
+
+def in_trading_hours(at: datetime | None = None) -> bool:
+    at = at or market_now()
+    if not get_calendar().is_session(at.date()):
+        return False
+    return any(start <= at.time() <= end for start, end in SESSION_HOURS)
+
+
+def invalidate_calendar():
+    """Gọi sau khi ghi giá mới (trong luồng ghi, sync): nạp lại ngay để lần tra cứu tới thấy ngày mới"""
+    _reload_calendar()
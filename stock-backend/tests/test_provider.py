@@ -0,0 +1,135 @@
+"""
+Kiểm tra AimdLimiter, CircuitBreaker và retry của SourceGate với provider giả (không gọi mạng).
+
+Chạy từ stock-backend: python -m pytest -q tests
+"""
+import threading
+
+import pytest
+
+from app import provider
+from app.provider import AimdLimiter, CircuitBreaker, CircuitOpenError, SourceGate
+
+LIMITS = {"rate": 1000.0, "burst": 1000, "concurrency": 4, "min_concurrency": 1, "max_concurrency": 8}
+
+
+class FakeProvider:
+    """Hàm fetch giả: ném lần lượt các lỗi trong `errors` rồi trả `result`"""
+
+    def __init__(self, errors=(), result="ok"):
+        self.errors = list(errors)
+        self.result = result
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        with self._lock:
+            self.calls += 1
+            error = self.errors.pop(0) if self.errors else None
+        if error is not None:
+            raise error
+        return self.result
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # retry không ngủ thật
+    monkeypatch.setattr(provider.time, "sleep", lambda seconds: None)
+
+
+def test_aimd_additive_increase_multiplicative_decrease():
+    limiter = AimdLimiter(initial=4, minimum=1, maximum=5)
+    limiter.acquire()
+    limiter.release(True)
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.acquire()
+    limiter.release(False)
+    assert limiter.limit == pytest.approx(2.125)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(False)
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.acquire()
+        limiter.release(True)
+    assert limiter.limit == 5
+    assert limiter.in_flight == 0
+
+
+def test_aimd_blocks_above_limit():
+    limiter = AimdLimiter(initial=1, minimum=1, maximum=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=waiter, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+    limiter.release(True)
+    assert acquired.wait(1.0)
+    thread.join(1.0)
+
+
+def test_breaker_opens_after_threshold_and_half_opens():
+    breaker = CircuitBreaker(threshold=3, reset_seconds=3600)
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open" and not breaker.allow()
+
+    breaker.reset_seconds = 0
+    assert breaker.allow()  # half-open: cho 1 request đi thử
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_gate_retries_transient_errors():
+    fake = FakeProvider(errors=[ConnectionError("timeout"), ConnectionError("reset")])
+    gate = SourceGate("FAKE", LIMITS)
+    assert gate.call(fake.fetch) == "ok"
+    assert fake.calls == 3
+    assert gate.stats()["calls"] == 3 and gate.stats()["failures"] == 2
+    assert gate.stats()["breaker"] == "closed"
+
+
+def test_gate_gives_up_after_max_retries():
+    fake = FakeProvider(errors=[ConnectionError("down")] * (provider.MAX_RETRIES + 1))
+    gate = SourceGate("FAKE", LIMITS)
+    with pytest.raises(ConnectionError):
+        gate.call(fake.fetch)
+    assert fake.calls == provider.MAX_RETRIES + 1
+    assert gate.failures == provider.MAX_RETRIES + 1
+
+
+def test_gate_does_not_retry_data_errors():
+    fake = FakeProvider(errors=[ValueError("mã không có dữ liệu")])
+    gate = SourceGate("FAKE", LIMITS)
+    with pytest.raises(ValueError):
+        gate.call(fake.fetch)
+    assert fake.calls == 1 and gate.failures == 0
+    assert gate.concurrency.limit > LIMITS["concurrency"]  # lỗi dữ liệu không làm giảm song song
+
+
+def test_gate_rejects_when_breaker_open(monkeypatch):
+    monkeypatch.setattr(provider, "BREAKER_THRESHOLD", 2)
+    fake = FakeProvider(errors=[ConnectionError("down")] * 10)
+    gate = SourceGate("FAKE", LIMITS)
+    with pytest.raises(CircuitOpenError):
+        gate.call(fake.fetch)
+    assert fake.calls == 2
+    assert gate.stats()["breaker"] == "open"
+
+
+def test_gate_counters_under_concurrency():
+    fake = FakeProvider()
+    gate = SourceGate("FAKE", {**LIMITS, "rate": 1e9, "burst": 1e9})
+    threads = [threading.Thread(target=lambda: [gate.call(fake.fetch) for _ in range(200)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert gate.stats()["calls"] == fake.calls == 1600
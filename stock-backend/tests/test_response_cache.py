@@ -0,0 +1,71 @@
+"""
+Kiểm tra CachingProvider.price_history tách phần đã đóng / đuôi phiên đang mở (provider giả, cache thư mục tạm).
+
+Chạy từ stock-backend: python -m pytest -q tests
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from app import response_cache
+from app.response_cache import CachingProvider, ResponseCache
+
+CLOSED = date(2026, 10, 15)
+
+
+class FakeCalendar:
+    def count_between(self, start, end):
+        return 1
+
+
+class FakeProvider:
+    """Trả dữ liệu theo khoảng ngày; khoảng không có dữ liệu thì ném ValueError như nguồn thật"""
+
+    name = "fake"
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def price_history(self, symbol, start, end, interval="1D", source="VCI"):
+        self.calls.append((str(start), str(end)))
+        days = [d for d in self.rows if str(start) <= d <= str(end)]
+        if not days:
+            raise ValueError(f"{symbol} không có dữ liệu")
+        return pd.DataFrame({"time": days, "close": [10.0] * len(days)})
+
+
+@pytest.fixture
+def caching(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "last_closed_session", lambda: CLOSED)
+    monkeypatch.setattr(response_cache, "get_calendar", FakeCalendar)
+
+    def make(rows):
+        return CachingProvider(FakeProvider(rows), ResponseCache(str(tmp_path)))
+
+    return make
+
+
+def test_split_range_joins_head_and_tail(caching):
+    provider = caching(["2026-10-14", "2026-10-15", "2026-10-16"])
+    df = provider.price_history("VNM", "2026-10-01", "2026-10-16")
+    assert list(df["time"]) == ["2026-10-14", "2026-10-15", "2026-10-16"]
+    provider.price_history("VNM", "2026-10-01", "2026-10-16")
+    assert provider.cache.stats()["hits"] == 2
+
+
+def test_tail_kept_when_head_has_no_data(caching):
+    provider = caching(["2026-10-16"])  # mã mới niêm yết trong phiên đang mở
+    df = provider.price_history("NEW", "2026-10-01", "2026-10-16")
+    assert list(df["time"]) == ["2026-10-16"]
+
+
+def test_no_data_anywhere_still_raises(caching):
+    provider = caching([])
+    with pytest.raises(ValueError):
+        provider.price_history("NONE", "2026-10-01", "2026-10-16")
+
+
+def test_closed_range_ttl_is_short():
+    assert response_cache.CACHE_TTLS["price_history_closed"] <= response_cache.DAY